@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+Offline load test: drives mcp_server_focused over stdio against local mock providers and
+reports throughput, p50/p99 latency and peak RSS. Exits with status 1 when a threshold is
+missed, so it can gate CI.
+
+    python -m benchmarks.load_test --requests 500 --concurrency 16 --max-p99-ms 2000
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+import subprocess
+from typing import Dict, List, Optional
+
+from benchmarks.mock_providers import MockProviders, add_profile_arguments, profiles_from_arguments
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Relative weight of each tool in a generated request mix
+DEFAULT_MIX = {
+    "search_web": 4,
+    "search_tavily": 3,
+    "search_federated": 1,
+    "summarize_webpage": 1,
+    "search_and_summarize": 1,
+    "generate_voice": 1,
+    "generate_image": 1,
+}
+
+FALLBACK_CORPUS = [
+    "latest AI news", "python concurrency patterns", "vector databases compared",
+    "how does TLS session resumption work", "sqlite write ahead log", "mp3 frame format",
+    "reciprocal rank fusion", "token bucket rate limiting", "image diffusion models",
+    "text to speech latency"
+]
+
+def load_corpus(path: Optional[str]) -> List[str]:
+    # Query/prompt text taken from a JSONL file (title, query or prompt fields), e.g. requests.jsonl
+    if not path or not os.path.exists(path):
+        return list(FALLBACK_CORPUS)
+    corpus = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            text = record.get("title") or record.get("query") or record.get("prompt")
+            if text:
+                corpus.append(text)
+    return corpus or list(FALLBACK_CORPUS)
+
+def parse_mix(value: Optional[str]) -> Dict[str, float]:
+    # "search_web=4,generate_image=1"
+    if not value:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+def build_requests(mix: Dict[str, float], count: int, seed: int, corpus: List[str],
+                   page_base_url: str, cache_mode: Optional[str]) -> List[Dict]:
+    # A reproducible list of tools/call requests; the same seed always gives the same mix
+    rng = random.Random(seed)
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    requests_out = []
+    for i in range(count):
+        tool = rng.choices(names, weights)[0]
+        text = rng.choice(corpus)
+        if tool in ("search_web", "search_tavily", "search_federated", "search_and_summarize"):
+            arguments = {"query": text}
+        elif tool == "summarize_webpage":
+            arguments = {"url": f"{page_base_url}/pages/{rng.randrange(50)}"}
+        elif tool == "generate_voice":
+            arguments = {"text": text}
+        elif tool == "generate_image":
+            arguments = {"prompt": text}
+        else:
+            arguments = {"query": text}
+        if cache_mode and tool in ("search_web", "search_tavily", "search_federated", "summarize_webpage", "search_and_summarize"):
+            arguments["cache"] = cache_mode
+        requests_out.append({
+            "jsonrpc": "2.0",
+            "id": i + 1,
+            "method": "tools/call",
+            "params": {"name": tool, "arguments": arguments}
+        })
+    return requests_out
+
+def load_replay(path: str, page_base_url: str) -> List[Dict]:
+    # Recorded tools/call requests; {PAGES} in URLs is replaced by the mock page server
+    requests_out = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                requests_out.append(json.loads(line.replace("{PAGES}", page_base_url)))
+    for i, request in enumerate(requests_out):
+        request["id"] = i + 1
+    return requests_out
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+    return ordered[index]
+
+def peak_rss_kb(pid: int) -> Optional[int]:
+    # VmHWM is the resident-set high-water mark (Linux only)
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+def peak_rss_tree_kb(pid: int) -> Optional[int]:
+    # Summed high-water marks of a process and its children (the supervisor's workers)
+    total = peak_rss_kb(pid)
+    if total is None:
+        return None
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            children = [int(child) for child in f.read().split()]
+    except OSError:
+        children = []
+    return total + sum(peak_rss_kb(child) or 0 for child in children)
+
+def run_load(requests_in: List[Dict], concurrency: int, env: Dict[str, str], timeout: float,
+             workers: int = 1) -> Dict:
+    # Keep up to `concurrency` requests outstanding and time each one from send to response
+    proc = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "mcp_server_focused.py"), "--workers", str(workers)],
+        cwd=ROOT, env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+        text=True, bufsize=1
+    )
+    
+    sent_at: Dict[int, float] = {}
+    latencies: Dict[int, float] = {}
+    queue_waits: Dict[int, float] = {}  # the server's own report of time spent waiting for a worker
+    errors: Dict[int, str] = {}
+    window = threading.Semaphore(concurrency)
+    all_done = threading.Event()
+    lock = threading.Lock()
+    
+    def read():
+        for line in proc.stdout:
+            try:
+                message = json.loads(line)
+            except ValueError:
+                continue
+            request_id = message.get("id")
+            if request_id is None or request_id not in sent_at:
+                continue
+            with lock:
+                latencies[request_id] = time.perf_counter() - sent_at[request_id]
+                if "error" in message:
+                    errors[request_id] = message["error"].get("message", "error")
+                else:
+                    text = message["result"]["content"][0]["text"]
+                    queue_wait = (message["result"].get("_meta") or {}).get("queueWaitMs")
+                    if queue_wait is not None:
+                        queue_waits[request_id] = queue_wait
+                    if '"success":false' in text.replace(" ", ""):
+                        errors[request_id] = "tool reported failure"
+                if len(latencies) == len(requests_in):
+                    all_done.set()
+            window.release()
+    
+    reader = threading.Thread(target=read, daemon=True)
+    reader.start()
+    
+    proc.stdin.write(json.dumps({"jsonrpc": "2.0", "id": 0, "method": "initialize", "params": {}}) + "\n")
+    proc.stdin.flush()
+    
+    started = time.perf_counter()
+    for request in requests_in:
+        window.acquire()
+        with lock:
+            sent_at[request["id"]] = time.perf_counter()
+        proc.stdin.write(json.dumps(request) + "\n")
+        proc.stdin.flush()
+    
+    finished = all_done.wait(timeout)
+    elapsed = time.perf_counter() - started
+    rss_kb = peak_rss_tree_kb(proc.pid)
+    
+    proc.stdin.close()
+    try:
+        proc.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+    
+    values = [latency * 1000 for latency in latencies.values()]
+    by_tool: Dict[str, List[float]] = {}
+    waits_by_tool: Dict[str, List[float]] = {}
+    for request in requests_in:
+        if request["id"] in latencies:
+            by_tool.setdefault(request["params"]["name"], []).append(latencies[request["id"]] * 1000)
+        if request["id"] in queue_waits:
+            waits_by_tool.setdefault(request["params"]["name"], []).append(queue_waits[request["id"]])
+    
+    return {
+        "requests": len(requests_in),
+        "completed": len(latencies),
+        "errors": len(errors),
+        "timed_out": not finished,
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(values, 0.50), 1),
+        "p99_ms": round(percentile(values, 0.99), 1),
+        "max_ms": round(max(values), 1) if values else 0.0,
+        "peak_rss_mb": round(rss_kb / 1024, 1) if rss_kb else None,
+        "tools": {
+            tool: {
+                "count": len(v),
+                "p50_ms": round(percentile(v, 0.50), 1),
+                "p99_ms": round(percentile(v, 0.99), 1),
+                "queue_wait_p99_ms": round(percentile(waits_by_tool.get(tool, []), 0.99), 1)
+            }
+            for tool, v in sorted(by_tool.items())
+        }
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test for mcp_server_focused")
+    parser.add_argument("--requests", type=int, default=200, help="Number of tools/call requests")
+    parser.add_argument("--concurrency", type=int, default=8, help="Requests kept outstanding")
+    parser.add_argument("--seed", type=int, default=1, help="Seed for the request mix and the mocks")
+    parser.add_argument("--mix", help="Tool weights, e.g. search_web=4,generate_image=1")
+    parser.add_argument("--corpus", default=os.path.join(ROOT, "requests.jsonl"), help="JSONL file supplying query/prompt text")
+    parser.add_argument("--replay", help="JSONL file of recorded tools/call requests to send instead of a generated mix")
+    parser.add_argument("--record", help="Write the requests sent to this JSONL file for later --replay")
+    parser.add_argument("--cache", choices=["default", "bypass", "refresh"], default="bypass", help="cache argument for cacheable tools")
+    parser.add_argument("--workers", type=int, default=1, help="Server worker processes (--workers of the server)")
+    parser.add_argument("--timeout", type=float, default=300, help="Seconds to wait for all responses")
+    parser.add_argument("--max-p99-ms", type=float, help="Fail if p99 latency exceeds this")
+    parser.add_argument("--min-throughput", type=float, help="Fail if requests/second falls below this")
+    parser.add_argument("--max-rss-mb", type=float, help="Fail if the server's peak RSS exceeds this")
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    
+    mocks = MockProviders(profiles_from_arguments(args), seed=args.seed).start()
+    try:
+        if args.replay:
+            requests_in = load_replay(args.replay, mocks.base_url)
+        else:
+            requests_in = build_requests(parse_mix(args.mix), args.requests, args.seed,
+                                         load_corpus(args.corpus), mocks.base_url, args.cache)
+        if args.record:
+            with open(args.record, "w") as f:
+                for request in requests_in:
+                    f.write(json.dumps(request).replace(mocks.base_url, "{PAGES}") + "\n")
+        
+        with tempfile.TemporaryDirectory(prefix="mcp-bench-") as cache_dir:
+            env = dict(os.environ)
+            env.update(mocks.environment())
+            env["MCP_CACHE_DIR"] = cache_dir
+            report = run_load(requests_in, args.concurrency, env, args.timeout, args.workers)
+    finally:
+        mocks.stop()
+    
+    report["upstream_requests"] = dict(mocks.requests)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    
+    failures = []
+    if report["timed_out"]:
+        failures.append("not every request completed")
+    if args.max_p99_ms is not None and report["p99_ms"] > args.max_p99_ms:
+        failures.append(f"p99 {report['p99_ms']} ms > {args.max_p99_ms} ms")
+    if args.min_throughput is not None and report["throughput_rps"] < args.min_throughput:
+        failures.append(f"throughput {report['throughput_rps']} rps < {args.min_throughput} rps")
+    if args.max_rss_mb is not None and report["peak_rss_mb"] and report["peak_rss_mb"] > args.max_rss_mb:
+        failures.append(f"peak RSS {report['peak_rss_mb']} MB > {args.max_rss_mb} MB")
+    
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
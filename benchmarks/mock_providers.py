@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+"""
+Local stand-ins for SerpAPI, Tavily, ElevenLabs and Replicate, used by the load test.
+Every provider has configurable latency, jitter, error rate and payload size.
+"""
+
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+PROVIDERS = ("serpapi", "tavily", "elevenlabs", "replicate")
+
+class ProviderProfile:
+    # How one mock provider behaves: latency in ms (+/- jitter), error rate (0..1) and payload size
+    def __init__(self, latency_ms: float = 100, jitter_ms: float = 20, error_rate: float = 0.0,
+                 payload_bytes: int = 4096):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.payload_bytes = payload_bytes
+    
+    def delay(self, rng: random.Random) -> float:
+        return max(0.0, self.latency_ms + rng.uniform(-self.jitter_ms, self.jitter_ms)) / 1000.0
+
+class _QuietHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    
+    def handle_error(self, request, client_address):
+        # Clients that time out or cancel hang up mid-response; that is expected here
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+class MockProviders:
+    # One HTTP server hosting every provider under its own path prefix
+    def __init__(self, profiles: Optional[Dict[str, ProviderProfile]] = None, seed: int = 0,
+                 host: str = "127.0.0.1", port: int = 0):
+        self.profiles = {name: ProviderProfile() for name in PROVIDERS}
+        self.profiles.update(profiles or {})
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+        self.predictions: Dict[str, Dict] = {}
+        self.predictions_lock = threading.Lock()
+        self.requests = {name: 0 for name in PROVIDERS}
+        
+        self.server = _QuietHTTPServer((host, port), self._handler_class())
+        self.thread = None
+    
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+    
+    def environment(self) -> Dict[str, str]:
+        # Environment variables that point mcp_server_focused at these mocks
+        return {
+            "SERPAPI_BASE_URL": f"{self.base_url}/serpapi/search.json",
+            "TAVILY_BASE_URL": f"{self.base_url}/tavily",
+            "ELEVENLABS_BASE_URL": f"{self.base_url}/elevenlabs/v1",
+            "REPLICATE_BASE_URL": f"{self.base_url}/replicate",
+            "SERPAPI_API_KEY": "mock",
+            "TAVILY_API_KEY": "mock",
+            "ELEVENLABS_API_KEY": "mock",
+            "REPLICATE_API_TOKEN": "mock",
+            # The mock pages are served from this loopback server
+            "MCP_PAGE_ALLOW_PRIVATE": "1"
+        }
+    
+    def start(self) -> "MockProviders":
+        self.thread = threading.Thread(target=self.server.serve_forever, name="mock-providers", daemon=True)
+        self.thread.start()
+        return self
+    
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+    
+    def roll(self, provider: str):
+        # Decide latency and failure for one request
+        profile = self.profiles[provider]
+        with self.rng_lock:
+            self.requests[provider] += 1
+            return profile.delay(self.rng), self.rng.random() < profile.error_rate
+    
+    def _handler_class(self):
+        mocks = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            
+            def log_message(self, *args):
+                pass
+            
+            def do_GET(self):
+                path = self.path.split("?")[0]
+                if path.startswith("/serpapi/"):
+                    self._serpapi()
+                elif path.startswith("/replicate/v1/predictions/"):
+                    self._replicate_get(path.rsplit("/", 1)[-1])
+                elif path.startswith("/files/"):
+                    self._file()
+                elif path.startswith("/pages/"):
+                    self._page(path)
+                else:
+                    self._send_json(404, {"error": "not found"})
+            
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+                path = self.path.split("?")[0]
+                if path.startswith("/tavily/extract"):
+                    self._tavily_extract(body)
+                elif path.startswith("/tavily/"):
+                    self._tavily(body)
+                elif path.startswith("/elevenlabs/"):
+                    self._elevenlabs(path.endswith("/stream"))
+                elif path.startswith("/replicate/v1/models/") and path.endswith("/predictions"):
+                    self._replicate_create(path, body)
+                elif path.startswith("/replicate/v1/predictions/") and path.endswith("/cancel"):
+                    self._replicate_cancel(path.split("/")[-2])
+                else:
+                    self._send_json(404, {"error": "not found"})
+            
+            def _send_json(self, status: int, payload: Dict, headers: Optional[Dict] = None):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+            
+            def _fail(self):
+                # Alternate between throttling and a transient server error
+                with mocks.rng_lock:
+                    throttled = mocks.rng.random() < 0.5
+                if throttled:
+                    self._send_json(429, {"error": "rate limited"}, {"Retry-After": "0"})
+                else:
+                    self._send_json(503, {"error": "unavailable"})
+            
+            def _filler(self, provider: str, count: int) -> str:
+                size = max(16, mocks.profiles[provider].payload_bytes // max(1, count))
+                return ("lorem ipsum dolor sit amet " * (size // 27 + 1))[:size]
+            
+            def _serpapi(self):
+                delay, failed = mocks.roll("serpapi")
+                time.sleep(delay)
+                if failed:
+                    return self._fail()
+                count = 10
+                filler = self._filler("serpapi", count)
+                self._send_json(200, {
+                    "search_information": {"total_results": 1000},
+                    "organic_results": [
+                        {"position": i + 1, "title": f"Result {i}", "link": f"https://example.com/{i}", "snippet": filler}
+                        for i in range(count)
+                    ],
+                    "related_questions": [{"question": "Why?"}],
+                    "related_searches": [{"query": "more"}]
+                })
+            
+            def _tavily(self, body: Dict):
+                delay, failed = mocks.roll("tavily")
+                time.sleep(delay)
+                if failed:
+                    return self._fail()
+                count = min(int(body.get("max_results", 10)), 10)
+                filler = self._filler("tavily", count)
+                self._send_json(200, {
+                    "results": [
+                        dict(
+                            {"title": f"Result {i}", "url": f"https://www.example.com/{i}/", "content": filler, "score": 1 - i / 10},
+                            **({"raw_content": self._article(i)} if body.get("include_raw_content") else {})
+                        )
+                        for i in range(count)
+                    ]
+                })
+            
+            def _article(self, seed: int) -> str:
+                count = max(1, mocks.profiles["tavily"].payload_bytes // 60)
+                return " ".join(f"Sentence {i} of article {seed} covers topic {i % 7} in some detail." for i in range(count))
+            
+            def _tavily_extract(self, body: Dict):
+                delay, failed = mocks.roll("tavily")
+                time.sleep(delay)
+                if failed:
+                    return self._fail()
+                self._send_json(200, {
+                    "results": [{"url": url, "raw_content": self._filler("tavily", 1)} for url in body.get("urls", [])],
+                    "failed_results": []
+                })
+            
+            def _elevenlabs(self, stream: bool):
+                delay, failed = mocks.roll("elevenlabs")
+                if failed:
+                    time.sleep(delay)
+                    return self._fail()
+                
+                size = mocks.profiles["elevenlabs"].payload_bytes
+                chunks = 8
+                self.send_response(200)
+                self.send_header("Content-Type", "audio/mpeg")
+                if stream:
+                    # First audio arrives quickly, the rest is spread over the configured latency
+                    self.send_header("Transfer-Encoding", "chunked")
+                    self.end_headers()
+                    for _ in range(chunks):
+                        time.sleep(delay / chunks)
+                        data = b"\xff" * (size // chunks)
+                        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                        self.wfile.flush()
+                    self.wfile.write(b"0\r\n\r\n")
+                else:
+                    time.sleep(delay)
+                    self.send_header("Content-Length", str(size))
+                    self.end_headers()
+                    self.wfile.write(b"\xff" * size)
+            
+            def _prediction(self, prediction_id: str, status: str, output=None) -> Dict:
+                return {
+                    "id": prediction_id,
+                    "model": "mock/model",
+                    "version": "mock",
+                    "status": status,
+                    "input": {},
+                    "output": output,
+                    "logs": "",
+                    "error": None if status != "failed" else "mock failure",
+                    "urls": {}
+                }
+            
+            def _replicate_create(self, path: str, body: Dict):
+                delay, failed = mocks.roll("replicate")
+                if failed:
+                    return self._fail()
+                
+                input = body.get("input", {})
+                with mocks.predictions_lock:
+                    prediction_id = f"mock{len(mocks.predictions) + 1}"
+                    outputs = [f"{mocks.base_url}/files/{prediction_id}-{i}.webp" for i in range(int(input.get("num_outputs", 1)))]
+                    mocks.predictions[prediction_id] = {"ready_at": time.time() + delay, "output": outputs}
+                
+                # Prefer: wait[=N] blocks until the prediction is done or N seconds pass, like the real API
+                prefer = self.headers.get("Prefer") or ""
+                if prefer.startswith("wait"):
+                    _, _, seconds = prefer.partition("=")
+                    limit = float(seconds) if seconds else 60.0
+                    time.sleep(min(delay, limit))
+                    if delay <= limit:
+                        return self._send_json(201, self._prediction(prediction_id, "succeeded", outputs))
+                    return self._send_json(201, self._prediction(prediction_id, "processing"))
+                self._send_json(201, self._prediction(prediction_id, "starting"))
+            
+            def _replicate_cancel(self, prediction_id: str):
+                with mocks.predictions_lock:
+                    prediction = mocks.predictions.get(prediction_id)
+                    if prediction is not None:
+                        prediction["canceled"] = True
+                if prediction is None:
+                    return self._send_json(404, {"detail": "not found"})
+                self._send_json(200, self._prediction(prediction_id, "canceled"))
+            
+            def _replicate_get(self, prediction_id: str):
+                with mocks.predictions_lock:
+                    prediction = mocks.predictions.get(prediction_id)
+                if prediction is None:
+                    return self._send_json(404, {"detail": "not found"})
+                if prediction.get("canceled"):
+                    return self._send_json(200, self._prediction(prediction_id, "canceled"))
+                if time.time() >= prediction["ready_at"]:
+                    return self._send_json(200, self._prediction(prediction_id, "succeeded", prediction["output"]))
+                self._send_json(200, self._prediction(prediction_id, "processing"))
+            
+            def _page(self, path: str):
+                # A plain article page for summarize_webpage
+                delay, failed = mocks.roll("serpapi")
+                time.sleep(delay)
+                if failed:
+                    return self._fail()
+                sentences = " ".join(
+                    f"Sentence {i} about {path.rsplit('/', 1)[-1]} covers topic {i % 7} in some detail."
+                    for i in range(max(1, mocks.profiles["serpapi"].payload_bytes // 60))
+                )
+                data = f"<html><head><title>Page {path}</title></head><body><article><p>{sentences}</p></article></body></html>".encode("utf-8")
+                etag = '"mock-%d"' % len(data)
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.send_header("ETag", etag)
+                self.end_headers()
+                self.wfile.write(data)
+            
+            def _file(self):
+                data = b"RIFF" + b"\x00" * max(0, mocks.profiles["replicate"].payload_bytes - 4)
+                self.send_response(200)
+                self.send_header("Content-Type", "image/webp")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+        
+        return Handler
+
+def add_profile_arguments(parser: argparse.ArgumentParser):
+    # --<provider>-latency-ms, --<provider>-jitter-ms, --<provider>-error-rate, --<provider>-payload-bytes
+    defaults = ProviderProfile()
+    for provider in PROVIDERS:
+        parser.add_argument(f"--{provider}-latency-ms", type=float, default=defaults.latency_ms)
+        parser.add_argument(f"--{provider}-jitter-ms", type=float, default=defaults.jitter_ms)
+        parser.add_argument(f"--{provider}-error-rate", type=float, default=defaults.error_rate)
+        parser.add_argument(f"--{provider}-payload-bytes", type=int, default=defaults.payload_bytes)
+
+def profiles_from_arguments(args) -> Dict[str, ProviderProfile]:
+    return {
+        provider: ProviderProfile(
+            getattr(args, f"{provider}_latency_ms"),
+            getattr(args, f"{provider}_jitter_ms"),
+            getattr(args, f"{provider}_error_rate"),
+            getattr(args, f"{provider}_payload_bytes")
+        )
+        for provider in PROVIDERS
+    }
+
+def main():
+    # Run the mocks standalone and print the environment that points the server at them
+    parser = argparse.ArgumentParser(description="Mock SerpAPI/Tavily/ElevenLabs/Replicate server")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--seed", type=int, default=0)
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    
+    mocks = MockProviders(profiles_from_arguments(args), seed=args.seed, port=args.port).start()
+    for name, value in mocks.environment().items():
+        print(f"export {name}={value}")
+    try:
+        mocks.thread.join()
+    except KeyboardInterrupt:
+        mocks.stop()
+
+if __name__ == "__main__":
+    main()
@@ -11,7 +11,7 @@
 # - generate_voice: Generate speech from text using ElevenLabs
 # - search_web: Search the web using SerpAPI
 # - search_tavily: Advanced web search using Tavily
-# - summarize_webpage: Summarize a webpage using Tavily
+# - summarize_webpage: Fetch a webpage and summarize it (Tavily as fallback)
 # - generate_image: Generate an image using Replicate
 
 # MCP Configuration:
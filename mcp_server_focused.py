@@ -3,15 +3,63 @@
 Focused MCP Server with essential tools only
 """
 
+import time
+
+# Measured from here to the first response written, see RequestDispatcher.write_line
+PROCESS_START = time.perf_counter()
+
+import argparse
+import hashlib
 import json
+import os
 import sys
-from typing import Dict, List, Any
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Any, Optional
+
+# Provider modules (and the replicate SDK) are imported on first use in execute_tool,
+# so initialize and tools/list are answered before any of them is loaded
+from tools.call_context import CallCancelled, CallContext, DeadlineExceeded, DeadlineWatchdog, call_scope, current_call
+from tools.env import load_env
+from tools.metrics import get_metrics, start_textfile_writer
+from tools.profiling import get_profiler
+from tools.response_encoding import dumps, encode_result
+from tools.scheduler import FairScheduler, QueueFull
+from tools.singleflight import SingleFlight
+
+# Time budget per tool call in milliseconds, overridable with MCP_<TOOL>_TIMEOUT_MS and per call
+# with the timeout_ms argument. It covers queueing as well as every upstream request the call makes.
+DEFAULT_TIMEOUTS_MS = {
+    "generate_voice": 180000,
+    "search_web": 30000,
+    "search_tavily": 30000,
+    "search_web_batch": 120000,
+    "search_tavily_batch": 120000,
+    "search_federated": 15000,
+    "summarize_webpage": 30000,
+    "search_and_summarize": 60000,
+    "generate_image": 120000,
+    "generate_images_batch": 300000,
+    "generate_image_submit": 30000,
+    "generate_image_status": 10000,
+    "generate_image_result": 60000,
+}
+
+# Protocol revisions this server speaks; a client asking for one of them gets it back in initialize.
+# 2025-03-26 adds the streamable HTTP transport (see tools/http_transport.py).
+PROTOCOL_VERSIONS = ("2024-11-05", "2025-03-26")
+DEFAULT_PROTOCOL_VERSION = "2024-11-05"
+
+# Tools that make something new on every call: identical calls in flight must not share a result.
+# Image generation is repeatable only with a seed; a job submission always starts a new job.
+NON_IDEMPOTENT_TOOLS = ("generate_image_submit",)
+UNSEEDED_UNIQUE_TOOLS = ("generate_image", "generate_images_batch")
 
-# Import essential tools only
-from tools.elevenlabs_voice import generate_voice_from_text
-from tools.serpapi_search import search_web_query
-from tools.tavily_search import search_with_tavily, summarize_webpage
-from tools.generate_image import generate_image
+# JSON-RPC error code for a call that ran out of time (the MCP SDKs' RequestTimeout)
+TIMEOUT_ERROR_CODE = -32001
+
+# JSON-RPC error code for a call turned away because its tool's queue is full (see tools/scheduler.py)
+QUEUE_FULL_ERROR_CODE = -32003
 
 class FocusedMCPServer:
     def __init__(self):
@@ -21,36 +69,153 @@ class FocusedMCPServer:
                 "description": "Generate speech from text using ElevenLabs",
                 "parameters": {
                     "text": {"type": "string", "description": "Text to convert to speech"},
-                    "voice_id": {"type": "string", "description": "Voice ID to use", "default": "21m00Tcm4TlvDq8ikWAM"}
+                    "voice_id": {"type": "string", "description": "Voice ID to use", "default": "21m00Tcm4TlvDq8ikWAM"},
+                    "stream": {"type": "boolean", "description": "Stream audio to disk as it is synthesized", "default": True}
                 }
             },
             "search_web": {
                 "description": "Search the web using SerpAPI",
                 "parameters": {
                     "query": {"type": "string", "description": "Search query"},
-                    "num_results": {"type": "integer", "description": "Number of results", "default": 10}
+                    "num_results": {"type": "integer", "description": "Number of results", "default": 10},
+                    "cache": {"type": "string", "enum": ["default", "bypass", "refresh"], "description": "Result cache mode: bypass skips the cache, refresh fetches and re-stores", "default": "default"}
                 }
             },
             "search_tavily": {
                 "description": "Advanced web search using Tavily",
                 "parameters": {
                     "query": {"type": "string", "description": "Search query"},
-                    "search_depth": {"type": "string", "description": "Search depth", "default": "basic"}
+                    "search_depth": {"type": "string", "description": "Search depth", "default": "basic"},
+                    "cache": {"type": "string", "enum": ["default", "bypass", "refresh"], "description": "Result cache mode: bypass skips the cache, refresh fetches and re-stores", "default": "default"}
+                }
+            },
+            "search_web_batch": {
+                "description": "Run up to 50 SerpAPI web searches concurrently, results keyed by query",
+                "parameters": {
+                    "queries": {"type": "array", "items": {"type": "string"}, "description": "Search queries"},
+                    "num_results": {"type": "integer", "description": "Number of results per query", "default": 10},
+                    "cache": {"type": "string", "enum": ["default", "bypass", "refresh"], "description": "Result cache mode: bypass skips the cache, refresh fetches and re-stores", "default": "default"}
+                }
+            },
+            "search_tavily_batch": {
+                "description": "Run up to 50 Tavily searches concurrently, results keyed by query",
+                "parameters": {
+                    "queries": {"type": "array", "items": {"type": "string"}, "description": "Search queries"},
+                    "search_depth": {"type": "string", "description": "Search depth", "default": "basic"},
+                    "cache": {"type": "string", "enum": ["default", "bypass", "refresh"], "description": "Result cache mode: bypass skips the cache, refresh fetches and re-stores", "default": "default"}
+                }
+            },
+            "search_federated": {
+                "description": "Search SerpAPI and Tavily at once and fuse the de-duplicated results",
+                "parameters": {
+                    "query": {"type": "string", "description": "Search query"},
+                    "num_results": {"type": "integer", "description": "Number of fused results", "default": 10},
+                    "deadline_ms": {"type": "integer", "description": "Return what has arrived after this many milliseconds", "default": 4000},
+                    "cache": {"type": "string", "enum": ["default", "bypass", "refresh"], "description": "Result cache mode: bypass skips the cache, refresh fetches and re-stores", "default": "default"}
                 }
             },
             "summarize_webpage": {
-                "description": "Summarize a webpage using Tavily",
+                "description": "Fetch a webpage and summarize its main text (Tavily as fallback)",
                 "parameters": {
-                    "url": {"type": "string", "description": "URL to summarize"}
+                    "url": {"type": "string", "description": "URL to summarize"},
+                    "cache": {"type": "string", "enum": ["default", "bypass", "refresh"], "description": "Result cache mode: bypass skips the cache, refresh fetches and re-stores", "default": "default"}
+                }
+            },
+            "search_and_summarize": {
+                "description": "Search with Tavily and summarize the top k sources concurrently; each source is streamed as a progress notification",
+                "parameters": {
+                    "query": {"type": "string", "description": "Research question or search query"},
+                    "k": {"type": "integer", "description": "Number of sources to summarize (1-10)", "default": 3},
+                    "search_depth": {"type": "string", "description": "Search depth", "default": "basic"},
+                    "cache": {"type": "string", "enum": ["default", "bypass", "refresh"], "description": "Result cache mode: bypass skips the cache, refresh fetches and re-stores", "default": "default"}
                 }
             },
             "generate_image": {
                 "description": "Generate an image using Replicate",
+                "parameters": {
+                    "prompt": {"type": "string", "description": "Image generation prompt"},
+                    "seed": {"type": "integer", "description": "Fixed seed; identical requests with a seed are served from the local store", "default": None},
+                    "aspect_ratio": {"type": "string", "description": "Aspect ratio, e.g. 1:1 or 16:9", "default": "1:1"},
+                    "megapixels": {"type": "string", "description": "Approximate image size in megapixels", "default": "1"},
+                    "output_format": {"type": "string", "description": "webp, jpg or png", "default": "webp"}
+                }
+            },
+            "generate_images_batch": {
+                "description": "Generate several prompts and/or variants concurrently in one call; each finished prediction's images are streamed as a progress notification",
+                "parameters": {
+                    "prompts": {"type": "array", "items": {"type": "string"}, "description": "Image generation prompts"},
+                    "variants": {"type": "integer", "description": "Images per prompt", "default": 1},
+                    "seed": {"type": "integer", "description": "Base seed; variant i uses seed + i and can be served from the local store", "default": None},
+                    "aspect_ratio": {"type": "string", "description": "Aspect ratio, e.g. 1:1 or 16:9", "default": "1:1"},
+                    "output_format": {"type": "string", "description": "webp, jpg or png", "default": "webp"}
+                }
+            },
+            "generate_image_submit": {
+                "description": "Start an image generation job on Replicate and return its job id immediately",
                 "parameters": {
                     "prompt": {"type": "string", "description": "Image generation prompt"}
                 }
+            },
+            "generate_image_status": {
+                "description": "Report the status and progress of an image generation job",
+                "parameters": {
+                    "job_id": {"type": "string", "description": "Job id returned by generate_image_submit"}
+                }
+            },
+            "generate_image_result": {
+                "description": "Fetch the image URLs of a finished image generation job",
+                "parameters": {
+                    "job_id": {"type": "string", "description": "Job id returned by generate_image_submit"}
+                }
             }
         }
+        
+        # Arguments accepted by every tool; handled here, never passed to the tool
+        self.call_parameters = {
+            "timeout_ms": {"type": "integer", "description": "Give up with a timeout error after this many milliseconds (default depends on the tool)", "default": None},
+            "fields": {"type": "array", "items": {"type": "string"}, "description": "Dotted paths to keep in the result, e.g. organic_results.link", "default": None},
+            "max_bytes": {"type": "integer", "description": "Shorten content/snippet fields so the result fits in this many bytes", "default": None}
+        }
+        
+        # initialize and tools/list never change, so their results are built and serialized once
+        self.precomputed_results = {
+            "initialize": {
+                "protocolVersion": DEFAULT_PROTOCOL_VERSION,
+                "capabilities": {
+                    "tools": {}
+                },
+                "serverInfo": {
+                    "name": "focused-tools-mcp",
+                    "version": "1.0.0"
+                }
+            },
+            "tools/list": {
+                "tools": [
+                    {
+                        "name": name,
+                        "description": tool["description"],
+                        "inputSchema": {
+                            "type": "object",
+                            "properties": {**tool["parameters"], **self.call_parameters},
+                            "required": [k for k, v in tool["parameters"].items() if "default" not in v]
+                        }
+                    }
+                    for name, tool in self.tools.items()
+                ]
+            }
+        }
+        self.precomputed_json = {method: dumps(result) for method, result in self.precomputed_results.items()}
+        self.initialize_json = {
+            version: dumps(dict(self.precomputed_results["initialize"], protocolVersion=version))
+            for version in PROTOCOL_VERSIONS
+        }
+        
+        # Identical calls already in flight share one upstream execution
+        self.singleflight = SingleFlight()
+        self.stats_sources: Dict[str, Callable[[], Dict]] = {
+            "singleflight": self.singleflight.stats,
+            "profiler": get_profiler().stats
+        }
     
     def handle_request(self, request: Dict) -> Dict:
         # Handle MCP requests
@@ -61,44 +226,55 @@ class FocusedMCPServer:
             return {
                 "jsonrpc": "2.0",
                 "id": request.get("id"),
-                "result": {
-                    "protocolVersion": "2024-11-05",
-                    "capabilities": {
-                        "tools": {}
-                    },
-                    "serverInfo": {
-                        "name": "focused-tools-mcp",
-                        "version": "1.0.0"
-                    }
-                }
+                "result": dict(self.precomputed_results[method], protocolVersion=self.protocol_version(request))
             }
         
-        elif method == "tools/list":
+        if method in self.precomputed_results:
             return {
                 "jsonrpc": "2.0",
                 "id": request.get("id"),
-                "result": {
-                    "tools": [
-                        {
-                            "name": name,
-                            "description": tool["description"],
-                            "inputSchema": {
-                                "type": "object",
-                                "properties": tool["parameters"],
-                                "required": [k for k, v in tool["parameters"].items() if "default" not in v]
-                            }
-                        }
-                        for name, tool in self.tools.items()
-                    ]
-                }
+                "result": self.precomputed_results[method]
             }
         
-        elif method == "tools/call":
+        if method == "tools/call":
             tool_name = params.get("name")
-            arguments = params.get("arguments", {})
+            arguments = dict(params.get("arguments") or {})
+            fields = arguments.pop("fields", None)
+            max_bytes = arguments.pop("max_bytes", None)
+            arguments.pop("timeout_ms", None)
             
+            # Checked before the tool runs, so a bad argument costs no upstream work
+            error = self.call_parameter_error(fields, max_bytes)
+            if error:
+                return {
+                    "jsonrpc": "2.0",
+                    "id": request.get("id"),
+                    "error": {
+                        "code": -32602,
+                        "message": f"Invalid params: {error}"
+                    }
+                }
+            
+            # Profiled when _meta.profile asks for it or profiling/configure selected this call
+            started = time.perf_counter()
+            status = "exception"
+            profile = get_profiler().begin(tool_name, (params.get("_meta") or {}).get("profile"), current_call())
             try:
                 result = self.call_tool(tool_name, arguments)
+                status = "ok"
+                if isinstance(result, dict) and result.get("success") is False:
+                    status = str(result.get("status_code", "error"))
+                
+                text, sizes = encode_result(result, fields, max_bytes)
+                
+                # Waiting for a worker and running are reported apart, so a slow answer can be told
+                # from a busy server
+                sizes["executionMs"] = round((time.perf_counter() - started) * 1000, 1)
+                context = current_call()
+                if context is not None and context.queue_wait is not None:
+                    sizes["queueWaitMs"] = round(context.queue_wait * 1000, 1)
+                if profile is not None:
+                    sizes["profile"] = profile.finish()
                 return {
                     "jsonrpc": "2.0",
                     "id": request.get("id"),
@@ -106,9 +282,10 @@ class FocusedMCPServer:
                         "content": [
                             {
                                 "type": "text",
-                                "text": json.dumps(result, indent=2)
+                                "text": text
                             }
-                        ]
+                        ],
+                        "_meta": sizes
                     }
                 }
             except Exception as e:
@@ -120,6 +297,44 @@ class FocusedMCPServer:
                         "message": str(e)
                     }
                 }
+            finally:
+                if profile is not None:
+                    profile.finish()
+                context = current_call()
+                if context is not None and context.expired():
+                    status = "timeout"
+                elif context is not None and context.is_cancelled():
+                    status = "cancelled"
+                
+                # Unknown names share one label so clients cannot grow the metrics without bound
+                get_metrics().record_tool(self.metrics_label(tool_name), time.perf_counter() - started, status)
+        
+        if method == "profiling/configure":
+            # Custom method: profile the next N calls or a sampled fraction of them, see tools/profiling.py
+            try:
+                result = get_profiler().configure(params or {})
+            except (TypeError, ValueError) as e:
+                return {
+                    "jsonrpc": "2.0",
+                    "id": request.get("id"),
+                    "error": {
+                        "code": -32602,
+                        "message": f"Invalid params: {e}"
+                    }
+                }
+            return {
+                "jsonrpc": "2.0",
+                "id": request.get("id"),
+                "result": result
+            }
+        
+        if method == "metrics/get":
+            # Custom method: per-tool and per-provider counters, latency percentiles and hit rates
+            return {
+                "jsonrpc": "2.0",
+                "id": request.get("id"),
+                "result": get_metrics().snapshot(self.metrics_extra())
+            }
         
         return {
             "jsonrpc": "2.0",
@@ -130,56 +345,446 @@ class FocusedMCPServer:
             }
         }
     
+    def metrics_label(self, tool_name: Any) -> str:
+        return tool_name if tool_name in self.tools else "unknown"
+    
+    def call_parameter_error(self, fields: Any, max_bytes: Any) -> Optional[str]:
+        # Why the fields/max_bytes arguments are unusable, or None when they are fine
+        if fields is not None and (not isinstance(fields, list) or not all(isinstance(f, str) for f in fields)):
+            return "fields must be an array of strings"
+        if max_bytes is not None and (isinstance(max_bytes, bool) or not isinstance(max_bytes, int) or max_bytes < 0):
+            return "max_bytes must be a non-negative integer"
+        return None
+    
+    def call_timeout_ms(self, request: Dict) -> float:
+        # The call's timeout_ms argument, else the tool's default budget
+        params = request.get("params") or {}
+        tool_name = params.get("name")
+        requested = (params.get("arguments") or {}).get("timeout_ms")
+        try:
+            if requested is not None and float(requested) > 0:
+                return float(requested)
+        except (TypeError, ValueError):
+            pass
+        default = DEFAULT_TIMEOUTS_MS.get(tool_name, 30000)
+        return float(os.getenv(f"MCP_{str(tool_name).upper()}_TIMEOUT_MS", str(default)))
+    
+    def timeout_response(self, request: Dict, context: CallContext) -> Dict:
+        # Structured error for a call whose time budget ran out
+        tool_name = (request.get("params") or {}).get("name")
+        return {
+            "jsonrpc": "2.0",
+            "id": request.get("id"),
+            "error": {
+                "code": TIMEOUT_ERROR_CODE,
+                "message": f"Tool call timed out after {context.timeout_ms:g} ms",
+                "data": {
+                    "type": "timeout",
+                    "tool": tool_name,
+                    "timeout_ms": context.timeout_ms
+                }
+            }
+        }
+    
+    def queue_full_response(self, request: Dict, error: QueueFull) -> Dict:
+        # Structured error for a call turned away by the scheduler, with a retry hint
+        return {
+            "jsonrpc": "2.0",
+            "id": request.get("id"),
+            "error": {
+                "code": QUEUE_FULL_ERROR_CODE,
+                "message": str(error),
+                "data": {
+                    "type": "queue_full",
+                    "tool": error.tool,
+                    "queue_depth": error.depth,
+                    "retry_after_ms": round(error.retry_after * 1000)
+                }
+            }
+        }
+    
+    def metrics_extra(self) -> Dict:
+        # Server-level stats merged into metrics/get and the Prometheus text file
+        return {name: source() for name, source in self.stats_sources.items()}
+    
+    def protocol_version(self, request: Dict) -> str:
+        requested = (request.get("params") or {}).get("protocolVersion")
+        return requested if requested in PROTOCOL_VERSIONS else DEFAULT_PROTOCOL_VERSION
+    
+    def precomputed_response(self, request: Dict) -> Optional[str]:
+        # Serialized response line for initialize/tools/list, or None for every other method
+        if request.get("method") == "initialize":
+            result = self.initialize_json[self.protocol_version(request)]
+        else:
+            result = self.precomputed_json.get(request.get("method"))
+        if result is None:
+            return None
+        return '{"jsonrpc":"2.0","id":%s,"result":%s}' % (dumps(request.get("id")), result)
+    
+    @staticmethod
+    def coalesce_key(tool_name: str, arguments: Dict) -> Optional[str]:
+        # Key of the exact arguments, or None for calls that must run on their own. The result
+        # cache's normalization (case, whitespace) is only right for search queries; voice ids,
+        # job ids and prompts are case-sensitive.
+        if tool_name in NON_IDEMPOTENT_TOOLS or (tool_name in UNSEEDED_UNIQUE_TOOLS and arguments.get("seed") is None):
+            return None
+        raw = json.dumps([tool_name, arguments], sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+    
     def call_tool(self, tool_name: str, arguments: Dict) -> Dict:
+        # Coalesce concurrent calls with the same tool and arguments
+        if tool_name not in self.tools:
+            raise ValueError(f"Unknown tool: {tool_name}")
+        
+        key = self.coalesce_key(tool_name, arguments)
+        if key is None:
+            return self.execute_tool(tool_name, arguments)
+        
+        def execute():
+            result = self.execute_tool(tool_name, arguments)
+            context = current_call()
+            return result, context is not None and context.is_aborted()
+        
+        context = current_call()
+        try:
+            result, aborted = self.singleflight.do(key, execute)
+        except (CallCancelled, DeadlineExceeded):
+            if context is None or context.is_aborted():
+                raise
+            aborted = True
+        
+        # A shared execution cut short by another caller's cancellation or deadline is not
+        # this caller's answer, so run it again if this call still has time
+        if aborted and context is not None and not context.is_aborted():
+            result = self.execute_tool(tool_name, arguments)
+        return result
+    
+    def execute_tool(self, tool_name: str, arguments: Dict) -> Dict:
         # Call the appropriate tool based on name
         if tool_name == "generate_voice":
+            from tools.elevenlabs_voice import generate_voice_from_text
             return generate_voice_from_text(
                 arguments["text"], 
-                arguments.get("voice_id", "21m00Tcm4TlvDq8ikWAM")
+                arguments.get("voice_id", "21m00Tcm4TlvDq8ikWAM"),
+                arguments.get("stream", True)
             )
         
         elif tool_name == "search_web":
+            from tools.serpapi_search import search_web_query
             return search_web_query(
                 arguments["query"], 
-                arguments.get("num_results", 10)
+                arguments.get("num_results", 10),
+                arguments.get("cache")
             )
         
         elif tool_name == "search_tavily":
+            from tools.tavily_search import search_with_tavily
             return search_with_tavily(
                 arguments["query"], 
-                arguments.get("search_depth", "basic")
+                arguments.get("search_depth", "basic"),
+                arguments.get("cache")
+            )
+        
+        elif tool_name == "search_web_batch":
+            from tools.serpapi_search import search_web_batch
+            return search_web_batch(
+                arguments["queries"],
+                arguments.get("num_results", 10),
+                arguments.get("cache")
+            )
+        
+        elif tool_name == "search_tavily_batch":
+            from tools.tavily_search import search_tavily_batch
+            return search_tavily_batch(
+                arguments["queries"],
+                arguments.get("search_depth", "basic"),
+                arguments.get("cache")
+            )
+        
+        elif tool_name == "search_federated":
+            from tools.federated_search import federated_search
+            return federated_search(
+                arguments["query"],
+                arguments.get("num_results", 10),
+                arguments.get("deadline_ms", 4000),
+                arguments.get("cache")
             )
         
         elif tool_name == "summarize_webpage":
-            return summarize_webpage(arguments["url"])
+            from tools.tavily_search import summarize_webpage
+            return summarize_webpage(arguments["url"], arguments.get("cache"))
+        
+        elif tool_name == "search_and_summarize":
+            from tools.tavily_search import search_and_summarize
+            return search_and_summarize(
+                arguments["query"],
+                arguments.get("k", 3),
+                arguments.get("search_depth", "basic"),
+                arguments.get("cache")
+            )
         
         elif tool_name == "generate_image":
-            return {"image_url": generate_image(arguments["prompt"])}
+            from tools.generate_image import generate_image_file
+            return generate_image_file(
+                arguments["prompt"],
+                seed=arguments.get("seed"),
+                aspect_ratio=arguments.get("aspect_ratio"),
+                megapixels=arguments.get("megapixels"),
+                output_format=arguments.get("output_format")
+            )
+        
+        elif tool_name == "generate_images_batch":
+            from tools.generate_image import generate_images_batch
+            return generate_images_batch(
+                arguments["prompts"],
+                arguments.get("variants", 1),
+                seed=arguments.get("seed"),
+                aspect_ratio=arguments.get("aspect_ratio"),
+                output_format=arguments.get("output_format")
+            )
+        
+        elif tool_name == "generate_image_submit":
+            from tools.image_jobs import submit_image_job
+            return submit_image_job(arguments["prompt"])
+        
+        elif tool_name == "generate_image_status":
+            from tools.image_jobs import get_image_job_status
+            return get_image_job_status(arguments["job_id"])
+        
+        elif tool_name == "generate_image_result":
+            from tools.image_jobs import get_image_job_result
+            return get_image_job_result(arguments["job_id"])
         
         else:
             raise ValueError(f"Unknown tool: {tool_name}")
 
-def main():
-    # Main function to run the focused MCP server
-    server = FocusedMCPServer()
+class RequestDispatcher:
+    # Reads requests continuously and runs tools/call handlers on a bounded worker pool,
+    # writing each response as soon as it is ready (matched to its request by JSON-RPC id).
+    # The scheduler decides which queued call gets the next free worker.
+    def __init__(self, server: FocusedMCPServer, max_workers: Optional[int] = None, output=None):
+        self.server = server
+        self.output = output or sys.stdout
+        self.max_workers = max_workers or int(os.getenv("MCP_MAX_WORKERS", "8"))
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="mcp-tool")
+        self.scheduler = FairScheduler(self.executor, self.max_workers)
+        server.stats_sources["scheduler"] = self.scheduler.stats
+        self._write_lock = threading.Lock()
+        self._inflight_lock = threading.Lock()
+        self._inflight = {}  # (session, request id) -> (future, call context)
+        self.deadlines = DeadlineWatchdog()
+        self.startup_ms = None
     
-    # Read from stdin and write to stdout for MCP protocol
-    for line in sys.stdin:
+    def write(self, message: Dict):
+        self.write_line(dumps(message))
+    
+    def write_line(self, line: str):
+        # Serialize writes so concurrent responses never interleave on stdout
+        with self._write_lock:
+            self.output.write(line + "\n")
+            self.output.flush()
+            if self.startup_ms is None:
+                self._record_startup()
+    
+    def _record_startup(self):
+        # Import-to-first-response time; MCP_REPORT_STARTUP=1 prints it to stderr
+        self.startup_ms = round((time.perf_counter() - PROCESS_START) * 1000, 1)
+        if os.getenv("MCP_REPORT_STARTUP"):
+            print(f"startup_ms={self.startup_ms}", file=sys.stderr, flush=True)
+    
+    def dispatch_line(self, line: str):
+        # Parse one line from the client and route it
+        line = line.strip()
+        if not line:
+            return
+        
+        try:
+            request = json.loads(line)
+        except Exception as e:
+            self.write({
+                "jsonrpc": "2.0",
+                "id": None,
+                "error": {
+                    "code": -32700,
+                    "message": f"Parse error: {e}"
+                }
+            })
+            return
+        
+        self.dispatch(request)
+    
+    def dispatch(self, request: Dict, respond: Optional[Callable[[str], None]] = None,
+                 notify: Optional[Callable[[Dict], None]] = None, session: Any = None):
+        # respond gets the serialized response and notify the progress notifications of this
+        # request; both default to stdout. Request ids are only unique within a session.
+        respond = respond or self.write_line
+        notify = notify or self.write
+        
+        # Notifications carry no id and never get a response
+        if "id" not in request:
+            if request.get("method") == "notifications/cancelled":
+                self.cancel(request.get("params", {}).get("requestId"), session)
+            return
+        
+        if request.get("method") != "tools/call":
+            # initialize, tools/list and friends are cheap, answer them inline
+            line = self.server.precomputed_response(request)
+            respond(line if line is not None else dumps(self._handle(request)))
+            return
+        
+        # The deadline starts now, so time spent queued for a worker counts against it
+        key = (session, request.get("id"))
+        params = request.get("params", {})
+        meta = params.get("_meta") or {}
+        timeout_ms = self.server.call_timeout_ms(request)
+        context = CallContext(
+            request_id=request.get("id"),
+            progress_token=meta.get("progressToken"),
+            notify=notify,
+            deadline=time.monotonic() + timeout_ms / 1000.0,
+            timeout_ms=timeout_ms
+        )
+        
+        # Calls take turns per client: the HTTP session, or the one the supervisor forwarded for it
+        label = self.server.metrics_label(params.get("name"))
+        client = session if session is not None else meta.get("client")
+        try:
+            with self._inflight_lock:
+                future = self.scheduler.submit(label, client, lambda queue_wait: self._run(key, request, context, respond, queue_wait))
+                self._inflight[key] = (future, context)
+        except QueueFull as e:
+            # Turned away before it was queued: nothing to cancel and no deadline to watch
+            respond(dumps(self.server.queue_full_response(request, e)))
+            return
+        self.deadlines.schedule(context.deadline, lambda: self._expire(key, request, context, respond))
+    
+    def cancel(self, request_id: Any, session: Any = None) -> bool:
+        # Handle notifications/cancelled: drop queued calls, abort the upstream work of running
+        # ones. The client abandoned the call, so it no longer expects a response. True when
+        # the call will now never be answered (False if its response was already on its way).
+        with self._inflight_lock:
+            entry = self._inflight.pop((session, request_id), None)
+        if entry is None:
+            return False
+        
+        future, context = entry
+        suppressed = context.claim_response()
+        context.cancel()
+        future.cancel()
+        return suppressed
+    
+    def cancel_session(self, session: Any):
+        # Cancel every call a session still has in flight, e.g. when an HTTP session is deleted
+        with self._inflight_lock:
+            request_ids = [request_id for key_session, request_id in self._inflight if key_session == session]
+        for request_id in request_ids:
+            self.cancel(request_id, session)
+    
+    def inflight_count(self) -> int:
+        with self._inflight_lock:
+            return len(self._inflight)
+    
+    def _forget(self, key, context: CallContext):
+        with self._inflight_lock:
+            entry = self._inflight.get(key)
+            if entry is not None and entry[1] is context:
+                del self._inflight[key]
+        return entry
+    
+    def _expire(self, key, request: Dict, context: CallContext, respond: Callable[[str], None]):
+        # Deadline reached: answer with a timeout error right away and abort whatever is still running
+        if not context.claim_response():
+            return
+        context.cancel(timed_out=True)
+        entry = self._forget(key, context)
+        
+        # A call that never left the queue is not recorded by handle_request
+        if entry is not None and entry[0].cancel():
+            label = self.server.metrics_label((request.get("params") or {}).get("name"))
+            get_metrics().record_tool(label, context.timeout_ms / 1000.0, "timeout")
+        respond(dumps(self.server.timeout_response(request, context)))
+    
+    def _run(self, key, request: Dict, context: CallContext, respond: Callable[[str], None], queue_wait: float):
+        context.queue_wait = queue_wait
+        try:
+            if context.is_aborted():
+                return
+            with call_scope(context):
+                response = self._handle(request)
+            
+            # A result that only arrived at the deadline (typically an upstream timeout cut
+            # short by it) is reported as the timeout it is
+            if context.expired():
+                response = self.server.timeout_response(request, context)
+            if context.claim_response():
+                respond(dumps(response))
+        finally:
+            self._forget(key, context)
+    
+    def _handle(self, request: Dict) -> Dict:
         try:
-            request = json.loads(line.strip())
-            response = server.handle_request(request)
-            print(json.dumps(response))
-            sys.stdout.flush()
+            return self.server.handle_request(request)
         except Exception as e:
-            print(json.dumps({
+            return {
                 "jsonrpc": "2.0",
-                "id": request.get("id") if 'request' in locals() else None,
+                "id": request.get("id"),
                 "error": {
                     "code": -1,
                     "message": str(e)
                 }
-            }))
-            sys.stdout.flush()
+            }
+    
+    def drain(self):
+        # Let queued and in-flight calls finish and flush their responses
+        self.scheduler.join()
+        self.executor.shutdown(wait=True)
+    
+    def serve(self, stream=None):
+        # Keep reading while earlier calls are still running
+        try:
+            for line in (stream or sys.stdin):
+                self.dispatch_line(line)
+        finally:
+            self.drain()
+
+def main():
+    # Main function to run the focused MCP server
+    load_env()
+    parser = argparse.ArgumentParser(description="Focused MCP server")
+    parser.add_argument("--http", action="store_true", default=os.getenv("MCP_TRANSPORT") == "http",
+                        help="Serve many clients over streamable HTTP instead of one over stdio")
+    parser.add_argument("--host", help="HTTP bind address (default MCP_HTTP_HOST or 127.0.0.1)")
+    parser.add_argument("--port", type=int, help="HTTP port (default MCP_HTTP_PORT or 8808; 0 picks a free one)")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("MCP_WORKERS", "1")),
+                        help="Worker processes behind a supervisor; 0 starts one per core (default MCP_WORKERS or 1)")
+    args = parser.parse_args()
+    
+    if args.workers != 1:
+        # The supervisor only routes messages; tools, caches and metrics live in the workers
+        from tools.supervisor import WorkerSupervisor
+        supervisor = WorkerSupervisor(args.workers or os.cpu_count() or 1, [sys.executable, os.path.abspath(__file__)])
+        if args.http:
+            from tools.http_transport import serve_http
+            serve_http(supervisor, args.host, args.port)
+        else:
+            supervisor.serve()
+        return
+    
+    server = FocusedMCPServer()
+    
+    # Optional Prometheus text file, e.g. for node_exporter's textfile collector
+    textfile = os.getenv("MCP_METRICS_TEXTFILE")
+    if textfile:
+        start_textfile_writer(textfile, float(os.getenv("MCP_METRICS_INTERVAL", "15")), server.metrics_extra)
+    
+    if args.http:
+        # One warm process shares its caches, connection pools and workers with every session
+        from tools.http_transport import serve_http
+        serve_http(RequestDispatcher(server), args.host, args.port)
+        return
+    
+    # Read from stdin and write to stdout for MCP protocol
+    RequestDispatcher(server).serve()
 
 if __name__ == "__main__":
-    main()
+    main()
\ No newline at end of file
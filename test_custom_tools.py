@@ -73,6 +73,1256 @@ def test_custom_tools():
     print("   • summarize_webpage - Tavily summarization")
     print("   • generate_image - Replicate image generation")
 
+def test_server_startup():
+    # Cold start: no provider SDK is imported and initialize is answered quickly (no API keys needed)
+    import json
+    import os
+    import subprocess
+    import sys
+    
+    here = os.path.dirname(os.path.abspath(__file__))
+    loaded = subprocess.run(
+        [sys.executable, "-c", "import sys, mcp_server_focused; print(','.join(m for m in ('replicate', 'requests', 'tools.elevenlabs_voice') if m in sys.modules))"],
+        cwd=here, capture_output=True, text=True, timeout=60
+    )
+    assert loaded.returncode == 0, loaded.stderr
+    assert loaded.stdout.strip() == "", f"Eagerly imported: {loaded.stdout.strip()}"
+    
+    requests_in = "\n".join(json.dumps(r) for r in [
+        {"jsonrpc": "2.0", "id": 1, "method": "initialize", "params": {}},
+        {"jsonrpc": "2.0", "id": 2, "method": "tools/list"}
+    ]) + "\n"
+    proc = subprocess.run(
+        [sys.executable, "mcp_server_focused.py"],
+        cwd=here, input=requests_in, capture_output=True, text=True, timeout=60,
+        env=dict(os.environ, MCP_REPORT_STARTUP="1")
+    )
+    responses = {r["id"]: r for r in map(json.loads, proc.stdout.splitlines())}
+    assert responses[1]["result"]["serverInfo"]["name"] == "focused-tools-mcp"
+    assert any(tool["name"] == "search_web" for tool in responses[2]["result"]["tools"])
+    
+    startup_ms = float(proc.stderr.split("startup_ms=")[1].split()[0])
+    print(f"   ⏱️  Import to first response: {startup_ms} ms")
+    assert startup_ms < float(os.getenv("MCP_MAX_STARTUP_MS", "1000"))
+
+def test_concurrent_dispatch():
+    # Over stdio a fast call answers before a slow one sent earlier, and cancelling a running call frees its slot (mock providers)
+    import json
+    import os
+    import queue
+    import subprocess
+    import sys
+    import tempfile
+    import threading
+    import time
+    from benchmarks.mock_providers import MockProviders, ProviderProfile
+    
+    here = os.path.dirname(os.path.abspath(__file__))
+    mocks = MockProviders({
+        "serpapi": ProviderProfile(latency_ms=2000, jitter_ms=0),
+        "tavily": ProviderProfile(latency_ms=50, jitter_ms=0)
+    }).start()
+    
+    def start(workers):
+        env = dict(os.environ, **mocks.environment(), MCP_CACHE_DIR=tempfile.mkdtemp(), MCP_MAX_WORKERS=str(workers))
+        proc = subprocess.Popen([sys.executable, "mcp_server_focused.py"], cwd=here, env=env, text=True,
+                                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        lines = queue.Queue()
+        threading.Thread(target=lambda: [lines.put(json.loads(line)) for line in proc.stdout], daemon=True).start()
+        return proc, lines
+    
+    def send(proc, message):
+        proc.stdin.write(json.dumps(message) + "\n")
+        proc.stdin.flush()
+    
+    def call(proc, request_id, name, arguments):
+        send(proc, {"jsonrpc": "2.0", "id": request_id, "method": "tools/call", "params": {"name": name, "arguments": arguments}})
+    
+    try:
+        proc, lines = start(4)
+        try:
+            call(proc, 1, "search_web", {"query": "slow"})
+            call(proc, 2, "search_tavily", {"query": "fast"})
+            order = [lines.get(timeout=10)["id"], lines.get(timeout=10)["id"]]
+            assert order == [2, 1], order
+        finally:
+            proc.kill()
+        
+        # With one worker, only cancelling the running slow call lets the fast one start
+        proc, lines = start(1)
+        try:
+            call(proc, 1, "search_web", {"query": "slow"})
+            time.sleep(0.3)
+            call(proc, 2, "search_tavily", {"query": "fast"})
+            time.sleep(0.2)
+            assert lines.empty()
+            started = time.monotonic()
+            send(proc, {"jsonrpc": "2.0", "method": "notifications/cancelled", "params": {"requestId": 1}})
+            response = lines.get(timeout=10)
+            assert response["id"] == 2 and time.monotonic() - started < 1.0
+            send(proc, {"jsonrpc": "2.0", "id": 3, "method": "metrics/get"})
+            assert lines.get(timeout=10)["id"] == 3 and lines.empty()
+        finally:
+            proc.kill()
+    finally:
+        mocks.stop()
+    print("   🔀 Out-of-order responses and cancellation OK")
+
+def test_call_parameters():
+    # Malformed fields/max_bytes are refused with -32602 before the tool runs
+    from mcp_server_focused import FocusedMCPServer
+    
+    server = FocusedMCPServer()
+    calls = []
+    server.call_tool = lambda name, arguments: calls.append(name) or {"success": True, "title": "T", "link": "L"}
+    
+    def call(**extra):
+        return server.handle_request({"jsonrpc": "2.0", "id": 1, "method": "tools/call",
+                                      "params": {"name": "search_web", "arguments": dict(query="q", **extra)}})
+    
+    for extra in ({"fields": "title"}, {"fields": ["title", 3]}, {"max_bytes": "100"}, {"max_bytes": 1.5},
+                  {"max_bytes": True}, {"max_bytes": -1}):
+        response = call(**extra)
+        assert response["error"]["code"] == -32602 and "Invalid params" in response["error"]["message"], extra
+    assert calls == []
+    
+    response = call(fields=["title"], max_bytes=1000)
+    assert response["result"]["content"][0]["text"] == '{"success":true,"title":"T"}' and calls == ["search_web"]
+
+def test_coalesce_key():
+    # Only calls with exactly the same arguments share an execution, and unseeded images never do
+    from mcp_server_focused import FocusedMCPServer
+    
+    key = FocusedMCPServer.coalesce_key
+    assert key("generate_voice", {"text": "Hi", "voice_id": "AbC"}) != key("generate_voice", {"text": "Hi", "voice_id": "abc"})
+    assert key("generate_image_status", {"job_id": "Xy1"}) != key("generate_image_status", {"job_id": "xy1"})
+    assert key("generate_images_batch", {"prompts": ["A Red Cat"], "seed": 1}) != key("generate_images_batch", {"prompts": ["a red cat"], "seed": 1})
+    assert key("search_web", {"query": "q", "num_results": 5}) == key("search_web", {"num_results": 5, "query": "q"})
+    assert key("generate_image", {"prompt": "cat"}) is None
+    assert key("generate_images_batch", {"prompts": ["cat"]}) is None
+    assert key("generate_image_submit", {"prompt": "cat", "seed": 1}) is None
+    assert key("generate_image", {"prompt": "cat", "seed": 1}) is not None
+
+def test_federated_fusion():
+    # URLs that differ only in scheme, www., tracking params or a trailing slash fuse into one result
+    from tools.federated_search import RRF_K, canonicalize_url, fuse_results
+    
+    assert canonicalize_url("https://www.Example.com/a/?utm_source=x&b=2&a=1#top") == "example.com/a?a=1&b=2"
+    assert canonicalize_url("http://example.com:80/a") == canonicalize_url("https://example.com/a/")
+    assert canonicalize_url("https://example.com:8443/a") == "example.com:8443/a"
+    assert canonicalize_url("https://example.com/a?gclid=1&fbclid=2") == "example.com/a"
+    
+    ranked = {
+        "serpapi": [
+            {"url": "https://www.example.com/a?utm_medium=x", "title": "A", "snippet": "short"},
+            {"url": "https://other.org/b", "title": "B", "snippet": "b"},
+        ],
+        "tavily": [
+            {"url": "http://example.com/a/", "title": "A'", "snippet": "a longer snippet"},
+            {"url": "https://third.net/c", "title": "C", "snippet": "c"},
+            {"url": "https://example.com/a#again", "title": "A''", "snippet": "x"},
+        ],
+    }
+    fused = fuse_results(ranked, 10)
+    assert [item["title"] for item in fused] == ["A", "B", "C"]
+    top = fused[0]
+    assert top["ranks"] == {"serpapi": 1, "tavily": 1}
+    assert top["snippet"] == "a longer snippet"
+    assert abs(top["score"] - round(2.0 / (RRF_K + 1), 6)) < 1e-6
+    assert len(fuse_results(ranked, 2)) == 2
+    assert fuse_results({}, 10) == []
+
+def test_federated_errors():
+    # A failed federated search names each provider's error, and the deadline only when one timed out
+    import time
+    from tools import federated_search
+    
+    saved = federated_search.search_web_query, federated_search.search_with_tavily
+    try:
+        federated_search.search_web_query = lambda *args, **kwargs: {"success": False, "error": "serpapi quota used up"}
+        federated_search.search_with_tavily = lambda *args, **kwargs: {"success": False, "error": "tavily key invalid"}
+        result = federated_search.federated_search("q", deadline_ms=2000)
+        assert not result["success"] and "deadline" not in result["error"]
+        assert "serpapi: serpapi quota used up" in result["error"] and "tavily: tavily key invalid" in result["error"]
+        assert result["missing_providers"] == ["serpapi", "tavily"]
+        
+        federated_search.search_with_tavily = lambda *args, **kwargs: time.sleep(0.5) or {"success": False, "error": "late"}
+        result = federated_search.federated_search("q", deadline_ms=100)
+        assert "tavily: no answer before the deadline" in result["error"] and "serpapi: serpapi quota used up" in result["error"]
+        assert result["providers"]["tavily"] == {"status": "timeout"}
+    finally:
+        federated_search.search_web_query, federated_search.search_with_tavily = saved
+
+def test_response_encoding():
+    # Projections keep the status fields, and a budget truncates the same way every time
+    import json
+    from tools.response_encoding import TRUNCATION_MARKER, dumps, encode_result, fit_to_budget, project
+    
+    result = {
+        "success": True,
+        "query": "q",
+        "results": [{"title": "T1", "url": "u1", "snippet": "s" * 400}, {"title": "T2", "url": "u2", "snippet": "short"}],
+        "meta": {"took": 3, "provider": "serpapi"}
+    }
+    assert project(result, ["results.title", "meta.took"]) == {
+        "success": True,
+        "results": [{"title": "T1"}, {"title": "T2"}],
+        "meta": {"took": 3}
+    }
+    assert project(result, ["query"]) == {"success": True, "query": "q"}
+    assert project([{"a": 1, "b": 2}], ["a"]) == [{"a": 1}]
+    
+    text, truncated = fit_to_budget(result, 0)
+    assert text == dumps(result) and not truncated
+    text, truncated = fit_to_budget(result, 250)
+    assert truncated and len(text.encode("utf-8")) <= 250
+    decoded = json.loads(text)
+    assert decoded["results"][0]["snippet"].endswith(TRUNCATION_MARKER)
+    assert decoded["results"][0]["title"] == "T1" and decoded["meta"] == result["meta"]
+    assert all(fit_to_budget(json.loads(json.dumps(result)), 250) == (text, True) for _ in range(5))
+    
+    # A budget too small even for empty strings still returns the smallest valid encoding
+    text, truncated = fit_to_budget(result, 10)
+    assert truncated and json.loads(text)["results"][0]["snippet"] == TRUNCATION_MARKER
+    
+    text, report = encode_result(result, max_bytes=0, mode="compact")
+    assert text == dumps(result) and report["originalBytes"] == report["returnedBytes"] and not report["truncated"]
+    text, report = encode_result(result, fields=["results.url"], max_bytes=0, mode="compact")
+    assert json.loads(text) == {"success": True, "results": [{"url": "u1"}, {"url": "u2"}]} and report["projected"]
+    assert report["returnedBytes"] < report["originalBytes"]
+
+def test_page_address_guard():
+    # Pages on loopback, private and link-local addresses are refused and go to the fallback
+    from tools import webpage
+    
+    for url in ("http://127.0.0.1:8808/mcp", "http://169.254.169.254/latest/meta-data/", "http://10.0.0.1/",
+                "http://192.168.1.1/", "http://[::1]/", "http://[::ffff:127.0.0.1]/", "http://0.0.0.0/", "file:///etc/passwd"):
+        try:
+            webpage.check_public_url(url)
+        except webpage.BlockedAddress:
+            continue
+        raise AssertionError(f"{url} was not refused")
+    assert webpage.check_public_url("http://93.184.216.34/page") == ["93.184.216.34"]
+    
+    fallback = lambda url: {"success": True, "title": "Extracted", "content": "Extracted text. " * 20}
+    result = webpage.summarize_page("http://169.254.169.254/latest/meta-data/", fallback=fallback, use_cache=False)
+    assert result["success"] and result["source"] == "tavily"
+    assert "non-public address 169.254.169.254" in result["fallback_reason"]
+    result = webpage.summarize_page("http://127.0.0.1/", use_cache=False)
+    assert not result["success"] and "non-public" in result["error"]
+
+def test_page_revalidation():
+    # Conditional fetches: a 304 or an unchanged 200 is not "modified", an error serves the cached
+    # copy, and the connection goes to the checked address rather than a fresh DNS answer
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from tools import webpage
+    
+    state = {"mode": "ok", "hosts": []}
+    bodies = {"v1": "Version one of the page has plenty of words in it. " * 10,
+              "v2": "Version two of the page has different words in it. " * 10}
+    
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            state["hosts"].append(self.headers["Host"])
+            mode = state["mode"]
+            if mode == "error":
+                self.send_response(404)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            etag = {"ok": '"v1"', "rotated": '"v1b"', "changed": '"v2"'}[mode]
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.end_headers()
+                return
+            body = f"<html><title>Page</title><body><article><p>{bodies['v2' if mode == 'changed' else 'v1']}</p></article></body></html>".encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def log_message(self, *args):
+            pass
+    
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    saved_check, saved_cache = webpage.check_public_url, webpage._page_cache
+    # page.invalid never resolves, so the request can only reach the server through the checked address
+    webpage.check_public_url = lambda url: ["127.0.0.1"]
+    webpage._page_cache = webpage.PageCache(":memory:")
+    url = f"http://page.invalid:{server.server_address[1]}/article"
+    try:
+        first = webpage.summarize_page(url)
+        assert first["success"] and first["content"].startswith("Version one")
+        assert state["hosts"] == [f"page.invalid:{server.server_address[1]}"]
+        
+        assert webpage.summarize_page(url)["not_modified"]
+        
+        state["mode"] = "error"
+        stale = webpage.summarize_page(url)
+        assert stale["success"] and stale["stale"] and stale["content"] == first["content"]
+        assert "HTTP 404" in stale["revalidation_error"]
+        
+        state["mode"] = "rotated"
+        assert webpage.summarize_page(url)["content"] == first["content"]
+        
+        state["mode"] = "changed"
+        assert webpage.summarize_page(url)["content"].startswith("Version two")
+        
+        stats = webpage._page_cache.stats()
+        assert (stats["not_modified"], stats["stale"], stats["modified"]) == (2, 1, 1), stats
+    finally:
+        webpage.check_public_url, webpage._page_cache = saved_check, saved_cache
+        server.shutdown()
+        server.server_close()
+
+def test_profiling():
+    # Selected calls write cpu and memory profiles, pool threads included, under MCP_PROFILE_DIR only
+    import os
+    import pstats
+    import tempfile
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    from tools.call_context import CallContext, call_scope
+    from tools.profiling import Profiler, parse_modes
+    
+    assert parse_modes(True) == ["cpu", "memory"]
+    assert parse_modes("memory, CPU") == ["cpu", "memory"]
+    assert parse_modes(["gpu"]) == [] and parse_modes(None) == []
+    
+    base = tempfile.mkdtemp()
+    saved = os.environ.get("MCP_PROFILE_DIR")
+    os.environ["MCP_PROFILE_DIR"] = base
+    try:
+        profiler = Profiler()
+        assert profiler.begin("search_web") is None
+        for directory in ("/etc", "../outside", "runs/../../outside"):
+            try:
+                profiler.configure({"directory": directory})
+            except ValueError:
+                continue
+            raise AssertionError(f"directory {directory} was accepted")
+        settings = profiler.configure({"directory": "runs", "calls": 1, "tools": ["search_web"], "modes": "cpu"})
+        assert settings["directory"] == os.path.join(os.path.realpath(base), "runs")
+        assert settings["remaining_calls"] == 1
+        
+        assert profiler.begin("generate_image") is None
+        context = CallContext(request_id=1)
+        session = profiler.begin("search_web", context=context)
+        assert session is not None and context.profile is session and session.modes == ["cpu"]
+        assert profiler.begin("search_web") is None
+        
+        def busy_in_pool():
+            return sum(i * i for i in range(20000))
+        def run_in_pool():
+            with call_scope(context):
+                return busy_in_pool()
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            pool.submit(run_in_pool).result()
+        report = session.finish()
+        assert session.finish() is report
+        assert report["tool"] == "search_web" and report["files"][0].endswith(".prof")
+        assert all(os.path.exists(path) and path.startswith(settings["directory"]) for path in report["files"])
+        assert "busy_in_pool" in {name for (_, _, name) in pstats.Stats(report["files"][0]).stats}
+        
+        # A memory profile's allocation report is written in the background and lands in "last"
+        session = profiler.begin("search_web", flag="memory")
+        kept = [bytearray(1024) for _ in range(200)]
+        report = session.finish()
+        assert kept and report["files"][0].endswith(".alloc.folded") and report["files"][1].endswith(".alloc.txt")
+        for _ in range(100):
+            last = profiler.stats()["last"]
+            if last and last.get("top_allocations"):
+                break
+            time.sleep(0.05)
+        assert last["top_allocations"] and all(os.path.exists(path) for path in report["files"])
+        assert profiler.stats()["requested"] == 1 and profiler.stats()["profiled"] == 2
+    finally:
+        if saved is None:
+            os.environ.pop("MCP_PROFILE_DIR", None)
+        else:
+            os.environ["MCP_PROFILE_DIR"] = saved
+
+def test_circuit_breaker():
+    # A breaker opens on its error rate, probes after the cool-down, and reopens for twice as long
+    import threading
+    import time
+    import uuid
+    from tools.health import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpen, degraded_result
+    from tools.rate_limit import ProviderLimiter
+    from tools.result_cache import get_result_cache, make_key
+    
+    breaker = CircuitBreaker("serpapi", min_requests=4, error_rate=0.5, open_seconds=0.2, max_open_seconds=0.3, probes=2)
+    
+    def request(ok):
+        with breaker.attempt() as attempt:
+            attempt.record(ok, 0.01)
+    
+    def rejected():
+        try:
+            request(True)
+        except CircuitOpen as e:
+            return e
+        return None
+    
+    # Errors below min_requests, or below the error rate, leave it closed
+    request(False)
+    request(False)
+    request(True)
+    assert breaker.state == CLOSED
+    request(True)
+    assert breaker.state == CLOSED
+    request(False)
+    assert breaker.state == OPEN and breaker.stats()["opened"] == 1
+    error = rejected()
+    assert error is not None and 0 < error.retry_after <= 0.2
+    
+    # After the cool-down one probe goes through at a time
+    time.sleep(0.25)
+    with breaker.attempt() as attempt:
+        assert breaker.state == HALF_OPEN
+        assert rejected() is not None
+        attempt.record(True, 0.01)
+    assert breaker.state == HALF_OPEN
+    
+    # A failed probe reopens it for twice as long, capped at max_open_seconds
+    request(False)
+    assert breaker.state == OPEN and 0.2 < rejected().retry_after <= 0.3
+    time.sleep(0.35)
+    request(True)
+    request(True)
+    assert breaker.state == CLOSED and breaker.stats()["requests"] == 0
+    assert [(t["from"], t["to"]) for t in breaker.transitions] == [
+        (CLOSED, OPEN), (OPEN, HALF_OPEN), (HALF_OPEN, OPEN), (OPEN, HALF_OPEN), (HALF_OPEN, CLOSED)
+    ]
+    
+    # A call cut short by its deadline says nothing about the provider
+    with breaker.attempt():
+        pass
+    assert breaker.stats()["requests"] == 0
+    
+    # A call waiting for a rate-limit token does not hold the half-open probe slot meanwhile
+    probing = CircuitBreaker("serpapi", min_requests=1, open_seconds=0.05, probes=2)
+    with probing.attempt() as attempt:
+        attempt.record(False, 0.01)
+    time.sleep(0.1)
+    limiter = ProviderLimiter("serpapi", rate=2.0, burst=1, breaker=probing)
+    limiter.bucket.acquire()
+    waiting = threading.Thread(target=limiter.execute, args=(lambda: "ok", lambda result, error: (False, None)))
+    waiting.start()
+    time.sleep(0.1)
+    with probing.attempt() as attempt:
+        assert probing.state == HALF_OPEN
+        attempt.record(True, 0.01)
+    waiting.join(timeout=5)
+    assert probing.state == CLOSED
+    
+    # While open: the stale cached result first, then the other provider, then a fast failure
+    params = {"query": uuid.uuid4().hex, "num_results": 5}
+    open_error = CircuitOpen("serpapi", 12.0)
+    reroute = lambda: {"success": True, "results": ["from tavily"]}
+    result = degraded_result(open_error, "search_web", params, None, reroute)
+    assert result["results"] == ["from tavily"] and result["circuit_open"] == "serpapi"
+    
+    get_result_cache().set("search_web", make_key("search_web", params), {"success": True, "results": ["cached"]})
+    result = degraded_result(open_error, "search_web", params, None, reroute)
+    assert result["results"] == ["cached"] and result["stale"] and result["circuit_open"] == "serpapi"
+    result = degraded_result(open_error, "search_web", params, "bypass", lambda: {"success": False})
+    assert not result["success"] and result["retry_after"] == 12.0 and "circuit breaker is open" in result["error"]
+
+def test_fair_scheduler():
+    # Weighted turns between tools, per-tool caps, per-client turns, queue limits and cancellation
+    from tools.scheduler import FairScheduler, QueueFull
+    
+    class StepExecutor:
+        # Holds dispatched calls until the test runs them, one at a time
+        def __init__(self):
+            self.pending = []
+        
+        def submit(self, fn, *args):
+            self.pending.append((fn, args))
+        
+        def step(self):
+            fn, args = self.pending.pop(0)
+            fn(*args)
+    
+    def drain(executor):
+        while executor.pending:
+            executor.step()
+    
+    ran = []
+    def job(label):
+        return lambda wait: ran.append(label) or label
+    
+    # With one slot, a weight-3 tool gets three turns for each of a weight-1 tool's
+    executor = StepExecutor()
+    scheduler = FairScheduler(executor, capacity=1, weights={"fast": 3, "slow": 1}, caps={})
+    scheduler.submit("blocker", "c", job("blocker"))
+    for _ in range(8):
+        scheduler.submit("fast", "c", job("fast"))
+        scheduler.submit("slow", "c", job("slow"))
+    drain(executor)
+    assert ran[0] == "blocker" and ran[1:9].count("fast") == 6 and ran[1:9].count("slow") == 2
+    assert ran.count("fast") == ran.count("slow") == 8
+    
+    # A tool never runs more calls than its cap, even with free slots
+    executor = StepExecutor()
+    scheduler = FairScheduler(executor, capacity=4, caps={"capped": 2})
+    futures = [scheduler.submit("capped", "c", job(i)) for i in range(4)]
+    assert len(executor.pending) == 2 and scheduler.stats()["tools"]["capped"]["queued"] == 2
+    scheduler.submit("other", "c", job("other"))
+    assert len(executor.pending) == 3
+    drain(executor)
+    assert [f.result() for f in futures] == [0, 1, 2, 3]
+    scheduler.join()
+    
+    # Clients take turns within a tool
+    ran.clear()
+    executor = StepExecutor()
+    scheduler = FairScheduler(executor, capacity=1)
+    scheduler.submit("blocker", "a", job("blocker"))
+    for label in ("a1", "a2", "a3"):
+        scheduler.submit("tool", "a", job(label))
+    scheduler.submit("tool", "b", job("b1"))
+    scheduler.submit("tool", "c", job("c1"))
+    drain(executor)
+    assert ran == ["blocker", "a1", "b1", "c1", "a2", "a3"]
+    
+    # A full queue turns calls away with a retry hint; a cancelled queued call never runs
+    ran.clear()
+    executor = StepExecutor()
+    scheduler = FairScheduler(executor, capacity=1, max_queue={"tool": 2})
+    scheduler.submit("blocker", "c", job("blocker"))
+    first = scheduler.submit("tool", "c", job("first"))
+    scheduler.submit("tool", "c", job("second"))
+    try:
+        scheduler.submit("tool", "c", job("third"))
+        raise AssertionError("a full queue accepted a call")
+    except QueueFull as e:
+        assert e.tool == "tool" and e.depth == 2 and e.retry_after == 2.0
+    assert first.cancel()
+    assert scheduler.stats()["tools"]["tool"]["queued"] == 1
+    scheduler.submit("tool", "c", job("third"))
+    drain(executor)
+    assert ran == ["blocker", "second", "third"] and first.cancelled()
+    stats = scheduler.stats()["tools"]["tool"]
+    assert stats["rejected"] == 1 and stats["dispatched"] == 2 and stats["queued"] == 0
+
+def test_retries():
+    # Retries honor Retry-After, stop at the attempt limit and the retry budget, and pace requests
+    import time
+    from email.utils import formatdate
+    import requests
+    from benchmarks.mock_providers import MockProviders, ProviderProfile
+    from tools.http_client import PooledSession, _should_retry
+    from tools.rate_limit import ProviderLimiter, RetryBudget, TokenBucket, parse_retry_after
+    
+    assert parse_retry_after("3") == 3.0 and parse_retry_after("-1") == 0.0
+    assert 8 < parse_retry_after(formatdate(time.time() + 10, usegmt=True)) <= 10
+    assert parse_retry_after("soon") is None and parse_retry_after(None) is None
+    
+    bucket = TokenBucket(rate=20, burst=2)
+    assert bucket.acquire() == 0 and bucket.acquire() == 0
+    assert 0.04 < bucket.acquire() < 0.1
+    
+    budget = RetryBudget(ratio=0.5, reserve=2)
+    assert budget.withdraw() and budget.withdraw() and not budget.withdraw()
+    budget.deposit()
+    budget.deposit()
+    assert budget.withdraw() and not budget.withdraw()
+    
+    class FakeResponse:
+        def __init__(self, status_code, retry_after=None):
+            self.status_code = status_code
+            self.headers = {"Retry-After": retry_after} if retry_after is not None else {}
+            self.closed = False
+        
+        def close(self):
+            self.closed = True
+    
+    def replay(limiter, outcomes):
+        outcomes = list(outcomes)
+        def attempt():
+            outcome = outcomes.pop(0)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+        return limiter.execute(attempt, _should_retry, on_discard=lambda response: response.close())
+    
+    # Retry-After sets the delay; the discarded response is closed
+    limiter = ProviderLimiter("fake", rate=1000, burst=1000, base_delay=5.0, budget=RetryBudget(reserve=10))
+    throttled = FakeResponse(429, "0.2")
+    started = time.monotonic()
+    assert replay(limiter, [throttled, FakeResponse(200)]).status_code == 200
+    assert 0.2 <= time.monotonic() - started < 1.0 and throttled.closed
+    
+    # A Retry-After beyond max_retry_after, or a read timeout, is not waited out
+    assert replay(limiter, [FakeResponse(429, "60"), FakeResponse(200)]).status_code == 429
+    try:
+        replay(limiter, [requests.ReadTimeout("slow"), FakeResponse(200)])
+        raise AssertionError("a read timeout was retried")
+    except requests.ReadTimeout:
+        pass
+    
+    # Failed connections are retried up to max_attempts, then the last error is raised
+    limiter = ProviderLimiter("fake", rate=1000, burst=1000, max_attempts=3, base_delay=0.01, budget=RetryBudget(reserve=10))
+    try:
+        replay(limiter, [requests.ConnectionError("refused")] * 3 + [FakeResponse(200)])
+        raise AssertionError("the attempt limit was exceeded")
+    except requests.ConnectionError:
+        pass
+    assert limiter.stats()["attempts"] == 3 and limiter.stats()["retries"] == 2
+    
+    # An exhausted retry budget returns the failure instead of retrying
+    limiter = ProviderLimiter("fake", rate=1000, burst=1000, max_attempts=5, base_delay=0.01, budget=RetryBudget(ratio=0, reserve=1))
+    assert replay(limiter, [FakeResponse(503), FakeResponse(503), FakeResponse(200)]).status_code == 503
+    assert replay(limiter, [FakeResponse(503), FakeResponse(200)]).status_code == 503
+    stats = limiter.stats()
+    assert stats["retries"] == 1 and stats["budget_exhausted"] == 2 and stats["attempts"] == 3
+    
+    # The same over HTTP against a mock provider that always throttles or fails
+    mocks = MockProviders({"serpapi": ProviderProfile(latency_ms=1, jitter_ms=0, error_rate=1.0)}).start()
+    try:
+        limiter = ProviderLimiter("serpapi", rate=1000, burst=1000, max_attempts=3, base_delay=0.01, budget=RetryBudget(reserve=10))
+        session = PooledSession(limiter=limiter, provider="serpapi")
+        response = session.get(mocks.environment()["SERPAPI_BASE_URL"], params={"q": "x"})
+        assert response.status_code in (429, 503)
+        assert mocks.requests["serpapi"] == 3 and limiter.stats()["retries"] == 2
+    finally:
+        mocks.stop()
+
+def test_cancelled_follower():
+    # A cancelled caller waiting on a coalesced execution frees its worker at once (mock providers)
+    import json
+    import os
+    import queue
+    import subprocess
+    import sys
+    import tempfile
+    import threading
+    import time
+    from benchmarks.mock_providers import MockProviders, ProviderProfile
+    
+    here = os.path.dirname(os.path.abspath(__file__))
+    mocks = MockProviders({
+        "serpapi": ProviderProfile(latency_ms=3000, jitter_ms=0),
+        "tavily": ProviderProfile(latency_ms=100, jitter_ms=0)
+    }).start()
+    env = dict(os.environ, **mocks.environment(), MCP_CACHE_DIR=tempfile.mkdtemp(), MCP_MAX_WORKERS="2")
+    proc = subprocess.Popen([sys.executable, "mcp_server_focused.py"], cwd=here, env=env, text=True,
+                            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    lines = queue.Queue()
+    threading.Thread(target=lambda: [lines.put(json.loads(line)) for line in proc.stdout], daemon=True).start()
+    
+    def send(message):
+        proc.stdin.write(json.dumps(message) + "\n")
+        proc.stdin.flush()
+    
+    def call(request_id, name, arguments):
+        send({"jsonrpc": "2.0", "id": request_id, "method": "tools/call", "params": {"name": name, "arguments": arguments}})
+    
+    try:
+        call(1, "search_web", {"query": "slow"})
+        call(2, "search_web", {"query": "slow"})
+        time.sleep(0.3)
+        send({"jsonrpc": "2.0", "method": "notifications/cancelled", "params": {"requestId": 2}})
+        started = time.monotonic()
+        call(3, "search_tavily", {"query": "fast"})
+        first = lines.get(timeout=10)
+        elapsed = time.monotonic() - started
+        assert first["id"] == 3 and elapsed < 1.5, f"id {first['id']} after {elapsed:.2f}s"
+        assert lines.get(timeout=10)["id"] == 1
+        assert lines.empty()
+    finally:
+        proc.kill()
+        mocks.stop()
+    print(f"   🪢 Cancelled follower freed its worker ({elapsed * 1000:.0f} ms for the next call)")
+
+def test_long_speech_chunks():
+    # Chunks follow paragraphs, so editing one paragraph re-synthesizes only its chunk (mock ElevenLabs)
+    import io
+    import os
+    import tempfile
+    from benchmarks.mock_providers import MockProviders, ProviderProfile
+    from tools.blob_store import BlobStore
+    from tools.elevenlabs_voice import ElevenLabsVoice, _skip_id3_header, split_text
+    
+    paragraphs = [f"Paragraph {n} opens here. It has a second sentence." for n in range(4)]
+    text = "\n\n".join(paragraphs)
+    assert split_text(text, 200) == paragraphs
+    edited = split_text(text.replace("Paragraph 0 opens", "Paragraph zero, edited, opens"), 200)
+    assert edited[1:] == paragraphs[1:] and edited[0] != paragraphs[0]
+    
+    long_paragraph = " ".join(f"Sentence {n} is here." for n in range(20))
+    chunks = split_text("Short one.\n\n" + long_paragraph + "\n\nShort two.", 60)
+    assert chunks[0] == "Short one." and chunks[-1] == "Short two."
+    assert all(len(chunk) <= 60 and chunk.endswith(".") for chunk in chunks)
+    assert " ".join(chunks[1:-1]) == long_paragraph
+    assert all(len(chunk) <= 10 for chunk in split_text("a" * 25 + " " + "word " * 5, 10))
+    
+    # ID3v2 tags (size is syncsafe, +10 with a footer) are skipped; other data is left alone
+    tag = b"ID3\x04\x00\x00\x00\x00\x01\x01" + b"t" * 129
+    audio = io.BytesIO(tag + b"\xff\xfbframes")
+    _skip_id3_header(audio)
+    assert audio.read() == b"\xff\xfbframes"
+    audio = io.BytesIO(b"ID3\x04\x00\x10\x00\x00\x00\x02" + b"t" * 12 + b"\xff\xfb")
+    _skip_id3_header(audio)
+    assert audio.read() == b"\xff\xfb"
+    audio = io.BytesIO(b"\xff\xfbno tag")
+    _skip_id3_header(audio)
+    assert audio.read() == b"\xff\xfbno tag"
+    
+    mocks = MockProviders({"elevenlabs": ProviderProfile(latency_ms=5, jitter_ms=0, payload_bytes=2048)}).start()
+    saved = {name: os.environ.get(name) for name in mocks.environment()}
+    os.environ.update(mocks.environment())
+    try:
+        voice = ElevenLabsVoice(audio_store=BlobStore(tempfile.mkdtemp(), 64 * 1024 * 1024, ".mp3"))
+        first = voice.generate_long_speech(text, chunk_chars=200)
+        assert first["success"] and first["chunks"] == 4 and first["chunks_from_cache"] == 0
+        requests_before = mocks.requests["elevenlabs"]
+        second = voice.generate_long_speech(text.replace("Paragraph 2 opens", "Paragraph two opens"), chunk_chars=200)
+        assert second["chunks_from_cache"] == 3 and mocks.requests["elevenlabs"] == requests_before + 1
+        
+        # A store too small to keep more than one file still stitches every chunk
+        tiny = ElevenLabsVoice(audio_store=BlobStore(tempfile.mkdtemp(), 1, ".mp3"))
+        stitched = tiny.generate_long_speech(text, chunk_chars=200, concurrency=1)
+        assert stitched["success"] and os.path.getsize(stitched["audio_path"]) == 4 * 2048
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        mocks.stop()
+
+def test_replicate_request_budget():
+    # A Replicate request that hangs gives up when the call's deadline does (no API keys needed)
+    import socket
+    import time
+    import httpx
+    from tools.call_context import CallContext, DeadlineExceeded, call_scope
+    from tools.generate_image import BudgetedClient
+    
+    silent = socket.socket()
+    silent.bind(("127.0.0.1", 0))
+    silent.listen(8)
+    client = BudgetedClient(api_token="mock", base_url=f"http://127.0.0.1:{silent.getsockname()[1]}")
+    started = time.monotonic()
+    try:
+        with call_scope(CallContext(request_id=1, deadline=time.monotonic() + 0.5, timeout_ms=500)):
+            try:
+                client.predictions.get("hung")
+                raise AssertionError("a hung poll returned")
+            except httpx.TimeoutException:
+                pass
+        assert time.monotonic() - started < 2.0
+        
+        # Out of time before sending: no request at all
+        with call_scope(CallContext(request_id=2, deadline=time.monotonic() - 1, timeout_ms=1)):
+            try:
+                client.predictions.get("late")
+                raise AssertionError("an expired call sent a request")
+            except DeadlineExceeded:
+                pass
+    finally:
+        silent.close()
+
+def test_replicate_no_sdk_retries():
+    # Throttled Replicate polls are retried by ProviderLimiter alone, not also by the SDK (no API keys needed)
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from replicate.exceptions import ReplicateError
+    from tools.generate_image import BudgetedClient, should_retry
+    from tools.rate_limit import ProviderLimiter, RetryBudget
+    
+    hits = []
+    class Throttled(BaseHTTPRequestHandler):
+        def do_GET(self):
+            hits.append(self.path)
+            self.send_response(429)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Retry-After", "0")
+            self.end_headers()
+            self.wfile.write(b'{"detail": "throttled"}')
+        
+        def log_message(self, *args):
+            pass
+    
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Throttled)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        client = BudgetedClient(api_token="mock", base_url=f"http://127.0.0.1:{server.server_address[1]}")
+        try:
+            client.predictions.get("p1")
+            raise AssertionError("a throttled poll succeeded")
+        except ReplicateError as e:
+            assert e.status == 429
+        assert len(hits) == 1
+        
+        limiter = ProviderLimiter("replicate", rate=1000, burst=1000, max_attempts=3, base_delay=0.01, budget=RetryBudget(reserve=10))
+        try:
+            limiter.execute(lambda: client.predictions.get("p2"), should_retry)
+            raise AssertionError("a throttled poll succeeded")
+        except ReplicateError:
+            pass
+        assert len(hits) == 4 and limiter.stats()["retries"] == 2
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def test_result_cache():
+    # TTL expiry, memory LRU in front of SQLite, cache modes and key normalization
+    import os
+    import tempfile
+    import time
+    from tools.result_cache import ResultCache, make_key
+    
+    cache = ResultCache(path=os.path.join(tempfile.mkdtemp(), "results.sqlite3"), max_memory_entries=2, ttls={"t": 0.3})
+    cache.set("t", "a", {"success": True, "n": 1})
+    assert cache.get("a") == {"success": True, "n": 1} and cache.stats()["memory_hits"] == 1
+    time.sleep(0.35)
+    assert cache.get("a") is None and cache.stats()["misses"] == 1
+    assert cache.get_stale("a")[0] == {"success": True, "n": 1}
+    
+    # The least recently used entry leaves memory but is still found in SQLite
+    cache.set("search_web", "b", {"success": True, "n": 2})
+    cache.set("search_web", "c", {"success": True, "n": 3})
+    assert cache.get("b")["n"] == 2
+    cache.set("search_web", "d", {"success": True, "n": 4})
+    assert cache.stats()["evictions"] == 1 and cache.stats()["memory_entries"] == 2
+    assert cache.get("c")["n"] == 3 and cache.stats()["disk_hits"] == 1
+    assert cache.get("c")["n"] == 3 and cache.stats()["disk_hits"] == 1
+    
+    calls = []
+    def compute():
+        calls.append(1)
+        return {"success": True, "n": len(calls)}
+    params = {"query": "q"}
+    assert cache.get_or_compute("search_web", params, compute)["n"] == 1
+    assert cache.get_or_compute("search_web", params, compute)["n"] == 1
+    assert cache.get_or_compute("search_web", params, compute, "bypass")["n"] == 2
+    assert cache.get_or_compute("search_web", params, compute)["n"] == 1
+    assert cache.get_or_compute("search_web", params, compute, "refresh")["n"] == 3
+    assert cache.get_or_compute("search_web", params, compute)["n"] == 3 and len(calls) == 3
+    assert cache.stats()["bypassed"] == 2
+    failing = lambda: {"success": False, "error": "upstream"}
+    cache.get_or_compute("search_web", {"query": "bad"}, failing)
+    assert cache.get(make_key("search_web", {"query": "bad"})) is None
+    try:
+        cache.get_or_compute("search_web", params, compute, "sometimes")
+        raise AssertionError("an unknown cache mode was accepted")
+    except ValueError:
+        pass
+    
+    # Queries ignore case, whitespace, list order and None; url, text and prompt do not
+    assert make_key("search_web", {"query": "  Latest  AI news", "num_results": 5}) == make_key("search_web", {"num_results": 5, "query": "latest ai news"})
+    assert make_key("search_tavily", {"domains": ["b.com", "A.com"], "x": None}) == make_key("search_tavily", {"domains": ["a.com", "b.com"]})
+    assert make_key("search_web", {"query": "q"}) != make_key("search_tavily", {"query": "q"})
+    for field in ("url", "text", "prompt"):
+        assert make_key("tool", {field: "Value"}) != make_key("tool", {field: "value"})
+        assert make_key("tool", {field: " Value "}) == make_key("tool", {field: "Value"})
+
+def test_run_batch():
+    # Duplicate queries are fetched once but counted per submitted query
+    import threading
+    from tools.batch import run_batch
+    
+    searched = []
+    lock = threading.Lock()
+    def search(query):
+        with lock:
+            searched.append(query)
+        if query == "broken":
+            raise RuntimeError("upstream failed")
+        return {"success": True, "query": query}
+    
+    report = run_batch("serpapi", ["cats", "Cats ", "cats", "broken", "dogs"], search)
+    assert sorted(searched) == ["broken", "cats", "dogs"]
+    assert report["total_queries"] == 5 and report["unique_queries"] == 3
+    assert report["succeeded"] == 4 and report["failed"] == 1
+    assert report["succeeded"] + report["failed"] == report["total_queries"]
+    assert list(report["results"]) == ["cats", "Cats ", "broken", "dogs"]
+    assert report["results"]["broken"] == {"success": False, "latency_ms": report["results"]["broken"]["latency_ms"], "error": "upstream failed"}
+    assert report["results"]["Cats "]["result"]["query"] == "cats"
+    for queries in ([], "cats", ["q"] * 51):
+        try:
+            run_batch("serpapi", queries, search)
+            raise AssertionError(f"{queries!r} was accepted")
+        except ValueError:
+            pass
+
+def use_mock_providers(mocks):
+    # Point the provider clients, stores and job table at mocks and a fresh cache directory;
+    # returns the function that puts everything back
+    import os
+    import tempfile
+    from tools import blob_store, generate_image, image_jobs
+    
+    environment = dict(mocks.environment(), MCP_CACHE_DIR=tempfile.mkdtemp())
+    saved_environment = {name: os.environ.get(name) for name in environment}
+    saved = (generate_image._client, image_jobs._manager, dict(blob_store._stores))
+    os.environ.update(environment)
+    generate_image._client, image_jobs._manager = None, None
+    blob_store._stores.clear()
+    
+    def restore():
+        for name, value in saved_environment.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        generate_image._client, image_jobs._manager = saved[0], saved[1]
+        blob_store._stores.clear()
+        blob_store._stores.update(saved[2])
+    return restore
+
+def test_image_jobs():
+    # Job table, adaptive poll interval and one poller across processes (mock Replicate)
+    import os
+    import subprocess
+    import sys
+    import tempfile
+    import time
+    from benchmarks.mock_providers import MockProviders, ProviderProfile
+    from tools.image_jobs import MAX_POLL_INTERVAL, MIN_POLL_INTERVAL, POLL_BACKOFF, ImageJobManager, ImageJobStore
+    
+    store = ImageJobStore(os.path.join(tempfile.mkdtemp(), "jobs.sqlite3"))
+    store.insert("j1", "model", {"prompt": "a"}, "starting")
+    store.insert("j2", "model", {"prompt": "b"}, "processing")
+    store.update("j1", next_poll_at=time.time() + 60)
+    store.update("j2", status="succeeded", output='["u"]')
+    assert store.get("j2")["status"] == "succeeded" and store.get("missing") is None
+    assert [job["job_id"] for job in store.active()] == ["j1"]
+    assert store.get("j1")["poll_interval"] == MIN_POLL_INTERVAL
+    
+    intervals = [ImageJobManager._next_poll(None)["poll_interval"]]
+    for _ in range(8):
+        intervals.append(ImageJobManager._next_poll({"poll_interval": intervals[-1]})["poll_interval"])
+    assert intervals[:3] == [0.5, 0.5 * POLL_BACKOFF, 0.5 * POLL_BACKOFF ** 2]
+    assert intervals[-1] == MAX_POLL_INTERVAL and all(a <= b for a, b in zip(intervals, intervals[1:]))
+    
+    mocks = MockProviders({"replicate": ProviderProfile(latency_ms=1500, jitter_ms=0, payload_bytes=1024)}).start()
+    restore = use_mock_providers(mocks)
+    try:
+        path = os.path.join(tempfile.mkdtemp(), "jobs.sqlite3")
+        manager = ImageJobManager(ImageJobStore(path))
+        
+        # Another process holds the poller lock, so this one leaves the job to it
+        holder = subprocess.Popen(
+            [sys.executable, "-c", "import sys, time; from tools.file_lock import file_lock\n"
+             "with file_lock(sys.argv[1]):\n    print('held', flush=True)\n    time.sleep(60)", path + ".poller"],
+            cwd=os.path.dirname(os.path.abspath(__file__)), stdout=subprocess.PIPE, text=True
+        )
+        try:
+            assert holder.stdout.readline().strip() == "held"
+            job = manager.submit("a lighthouse at dusk")
+            assert job["success"] and job["status"] == "starting"
+            time.sleep(2.0)
+            assert manager.status(job["job_id"])["status"] == "starting"
+            assert manager.result(job["job_id"])["error"] == "Job has not finished yet"
+        finally:
+            holder.kill()
+            holder.wait()
+        
+        # With the holder gone the next status call elects this process, which polls with backoff
+        manager.status(job["job_id"])
+        for _ in range(100):
+            if manager.status(job["job_id"])["done"]:
+                break
+            time.sleep(0.1)
+        status = manager.status(job["job_id"])
+        assert status["status"] == "succeeded" and status["progress"] == 1.0
+        result = manager.result(job["job_id"])
+        assert result["success"] and result["image_url"].endswith(".webp") and os.path.exists(result["local_path"])
+        assert manager.result(job["job_id"])["local_path"] == result["local_path"]
+        
+        # A slow job's poll interval grows between polls
+        slow = manager.submit("a slow one")["job_id"]
+        mocks.predictions[slow]["ready_at"] = time.time() + 60
+        time.sleep(2.5)
+        assert manager.store.get(slow)["poll_interval"] > MIN_POLL_INTERVAL * POLL_BACKOFF
+        manager.store.update(slow, status="canceled")  # lets the poller thread exit
+    finally:
+        restore()
+        mocks.stop()
+
+def test_seeded_image_reuse():
+    # A seeded repeat is served from the image store without a prediction; an unseeded one never is (mock Replicate)
+    import os
+    from benchmarks.mock_providers import MockProviders, ProviderProfile
+    from tools.generate_image import generate_image_file
+    
+    mocks = MockProviders({"replicate": ProviderProfile(latency_ms=20, jitter_ms=0, payload_bytes=1024)}).start()
+    restore = use_mock_providers(mocks)
+    try:
+        first = generate_image_file("a red fox", seed=42)
+        assert first["success"] and not first["cached"] and os.path.exists(first["local_path"])
+        repeat = generate_image_file("a red fox", seed=42)
+        assert repeat["cached"] and repeat["local_path"] == first["local_path"] and len(mocks.predictions) == 1
+        assert not generate_image_file("a red fox", seed=43)["cached"] and len(mocks.predictions) == 2
+        
+        unseeded = [generate_image_file("a red fox") for _ in range(2)]
+        assert not any(result["cached"] for result in unseeded) and len(mocks.predictions) == 4
+        assert unseeded[0]["local_path"] != unseeded[1]["local_path"]
+    finally:
+        restore()
+        mocks.stop()
+
+def test_image_batch():
+    # Variants are packed MAX_OUTPUTS_PER_PREDICTION per prediction and every prediction's images stream as progress (mock Replicate)
+    import json
+    from benchmarks.mock_providers import MockProviders, ProviderProfile
+    from tools.call_context import CallContext, call_scope
+    from tools.generate_image import MAX_BATCH_IMAGES, MAX_OUTPUTS_PER_PREDICTION, generate_images_batch
+    
+    mocks = MockProviders({"replicate": ProviderProfile(latency_ms=20, jitter_ms=0, payload_bytes=1024)}).start()
+    restore = use_mock_providers(mocks)
+    try:
+        notifications = []
+        context = CallContext(request_id=1, progress_token="batch", notify=notifications.append)
+        variants = MAX_OUTPUTS_PER_PREDICTION + 2
+        with call_scope(context):
+            result = generate_images_batch(["a cat", "a dog"], variants=variants)
+        assert result["success"] and result["images"] == 2 * variants and result["predictions"] == 4
+        assert sorted(len(p["output"]) for p in mocks.predictions.values()) == [2, 2, MAX_OUTPUTS_PER_PREDICTION, MAX_OUTPUTS_PER_PREDICTION]
+        
+        messages = [json.loads(n["params"]["message"]) for n in notifications]
+        assert [n["params"]["progress"] for n in notifications] == [1, 2, 3, 4]
+        assert all(n["params"]["total"] == 4 for n in notifications)
+        streamed = {}
+        for message in messages:
+            assert message["prompt"] == ["a cat", "a dog"][message["prompt_index"]] and "error" not in message
+            assert all(image["image_url"] and image["local_path"] for image in message["images"])
+            streamed.setdefault(message["prompt_index"], []).extend(image["local_path"] for image in message["images"])
+        for index, item in enumerate(result["results"]):
+            assert sorted(streamed[index]) == sorted(image["local_path"] for image in item["images"])
+        
+        assert generate_images_batch(["x"], variants=MAX_BATCH_IMAGES + 1)["success"] is False
+    finally:
+        restore()
+        mocks.stop()
+
+def test_metrics():
+    # Histogram buckets and interpolated quantiles, and well-formed Prometheus text
+    import os
+    import re
+    from tools.metrics import Histogram, MetricsRegistry
+    
+    histogram = Histogram(buckets=(0.1, 0.5, 1.0))
+    assert histogram.percentile(0.5) == 0.0
+    for seconds in (0.05, 0.1, 0.3, 2.0):
+        histogram.observe(seconds)
+    assert histogram.counts == [2, 1, 0, 1] and histogram.count == 4 and histogram.max == 2.0
+    assert abs(histogram.percentile(0.1) - 0.02) < 1e-9
+    assert histogram.percentile(0.5) == 0.1 and histogram.percentile(0.75) == 0.5
+    assert histogram.percentile(1.0) == 2.0
+    summary = histogram.summary()
+    assert summary["count"] == 4 and summary["mean_ms"] == 612.5 and summary["max_ms"] == 2000.0
+    
+    registry = MetricsRegistry()
+    registry.record_tool("search_web", 0.2)
+    registry.record_tool("search_web", 3.0, "error")
+    registry.record_queue_wait("search_web", 0.004)
+    registry.record_upstream("serpapi", 200, 0.2, connect=0.01, ttfb=0.1, received_bytes=100)
+    registry.record_bytes("serpapi", 50)
+    snapshot = registry.snapshot()
+    assert snapshot["tools"]["search_web"]["calls"] == 2 and snapshot["tools"]["search_web"]["errors"] == {"error": 1}
+    assert snapshot["providers"]["serpapi"]["bytes_received"] == 150 and snapshot["providers"]["serpapi"]["statuses"] == {"200": 1}
+    
+    text = registry.prometheus_text()
+    sample = re.compile(r'^[a-z_]+\{([a-z_]+="[^"]*",?)+\} -?[0-9.e+-]+$')
+    for line in text.splitlines():
+        assert line.startswith("# TYPE ") or sample.match(line), line
+    lines = set(text.splitlines())
+    assert 'mcp_tool_calls_total{tool="search_web",status="ok"} 1' in lines
+    assert 'mcp_tool_calls_total{tool="search_web",status="error"} 1' in lines
+    assert 'mcp_tool_latency_seconds_bucket{tool="search_web",le="0.25"} 1' in lines
+    assert 'mcp_tool_latency_seconds_bucket{tool="search_web",le="+Inf"} 2' in lines
+    assert 'mcp_tool_latency_seconds_count{tool="search_web"} 2' in lines
+    assert 'mcp_tool_latency_seconds_sum{tool="search_web"} 3.200000' in lines
+    assert 'mcp_upstream_latency_seconds_count{provider="serpapi",phase="connect"} 1' in lines
+    assert 'mcp_upstream_received_bytes_total{provider="serpapi"} 150' in lines
+    buckets = [int(line.rsplit(" ", 1)[1]) for line in text.splitlines() if line.startswith('mcp_tool_latency_seconds_bucket{tool="search_web"')]
+    assert buckets == sorted(buckets)
+    
+    saved = os.environ.get("MCP_WORKER_INDEX")
+    os.environ["MCP_WORKER_INDEX"] = "3"
+    try:
+        assert 'mcp_tool_calls_total{worker="3",tool="search_web",status="ok"} 1' in registry.prometheus_text().splitlines()
+    finally:
+        if saved is None:
+            os.environ.pop("MCP_WORKER_INDEX", None)
+        else:
+            os.environ["MCP_WORKER_INDEX"] = saved
+
+def test_http_transport():
+    # Streamable HTTP over loopback: sessions, JSON and SSE responses, session teardown (no API keys needed)
+    import json
+    import os
+    import subprocess
+    import sys
+    import urllib.error
+    import urllib.request
+    
+    here = os.path.dirname(os.path.abspath(__file__))
+    proc = subprocess.Popen(
+        [sys.executable, "mcp_server_focused.py", "--http", "--port", "0"],
+        cwd=here, stderr=subprocess.PIPE, text=True
+    )
+    try:
+        url = None
+        for line in proc.stderr:
+            if "listening on " in line:
+                url = line.split("listening on ")[1].strip()
+                break
+        assert url, "HTTP transport did not start"
+        
+        def post(message, session=None, accept="application/json, text/event-stream"):
+            headers = {"Content-Type": "application/json", "Accept": accept}
+            if session:
+                headers["Mcp-Session-Id"] = session
+            request = urllib.request.Request(url, data=json.dumps(message).encode(), headers=headers, method="POST")
+            try:
+                with urllib.request.urlopen(request, timeout=30) as response:
+                    return response.status, response.headers, response.read().decode()
+            except urllib.error.HTTPError as e:
+                return e.code, e.headers, e.read().decode()
+        
+        status, headers, body = post({"jsonrpc": "2.0", "id": 1, "method": "initialize",
+                                      "params": {"protocolVersion": "2025-03-26"}})
+        session = headers["Mcp-Session-Id"]
+        assert status == 200 and session
+        assert json.loads(body)["result"]["protocolVersion"] == "2025-03-26"
+        
+        assert post({"jsonrpc": "2.0", "method": "notifications/initialized"}, session)[0] == 202
+        
+        status, _, body = post({"jsonrpc": "2.0", "id": 2, "method": "tools/list"}, session)
+        assert status == 200 and any(tool["name"] == "search_web" for tool in json.loads(body)["result"]["tools"])
+        
+        assert post({"jsonrpc": "2.0", "id": 3, "method": "tools/list"})[0] == 400
+        
+        status, headers, body = post({"jsonrpc": "2.0", "id": 4, "method": "tools/call",
+                                      "params": {"name": "no_such_tool", "arguments": {}}}, session)
+        assert status == 200 and headers["Content-Type"] == "text/event-stream"
+        events = [json.loads(line[len("data: "):]) for line in body.splitlines() if line.startswith("data: ")]
+        assert events[-1]["id"] == 4 and "error" in events[-1]
+        
+        request = urllib.request.Request(url, headers={"Mcp-Session-Id": session}, method="DELETE")
+        with urllib.request.urlopen(request, timeout=30) as response:
+            assert response.status == 200
+        assert post({"jsonrpc": "2.0", "id": 5, "method": "tools/list"}, session)[0] == 404
+        print("   🌐 Streamable HTTP transport OK")
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+def test_http_cancellation():
+    # A call cancelled or whose session is deleted while it runs still completes its POST (mock providers, no API keys)
+    import json
+    import os
+    import subprocess
+    import sys
+    import tempfile
+    import threading
+    import time
+    import urllib.error
+    import urllib.request
+    from benchmarks.mock_providers import MockProviders, ProviderProfile
+    
+    here = os.path.dirname(os.path.abspath(__file__))
+    mocks = MockProviders({"serpapi": ProviderProfile(latency_ms=10000, jitter_ms=0)}).start()
+    env = dict(os.environ, **mocks.environment(), MCP_CACHE_DIR=tempfile.mkdtemp())
+    proc = subprocess.Popen(
+        [sys.executable, "mcp_server_focused.py", "--http", "--port", "0"],
+        cwd=here, stderr=subprocess.PIPE, text=True, env=env
+    )
+    try:
+        url = None
+        for line in proc.stderr:
+            if "listening on " in line:
+                url = line.split("listening on ")[1].strip()
+                break
+        assert url, "HTTP transport did not start"
+        
+        def post(message, session=None, accept="application/json"):
+            headers = {"Content-Type": "application/json", "Accept": accept}
+            if session:
+                headers["Mcp-Session-Id"] = session
+            request = urllib.request.Request(url, data=json.dumps(message).encode(), headers=headers, method="POST")
+            try:
+                with urllib.request.urlopen(request, timeout=8) as response:
+                    return response.status, response.headers, response.read().decode()
+            except urllib.error.HTTPError as e:
+                return e.code, e.headers, e.read().decode()
+        
+        def slow_call(session, request_id, accept, results):
+            call = {"jsonrpc": "2.0", "id": request_id, "method": "tools/call",
+                    "params": {"name": "search_web", "arguments": {"query": f"slow {request_id}", "cache": "bypass"}}}
+            results[request_id] = post(call, session, accept)
+        
+        def new_session():
+            _, headers, _ = post({"jsonrpc": "2.0", "id": 0, "method": "initialize", "params": {}})
+            return headers["Mcp-Session-Id"]
+        
+        # notifications/cancelled from another POST ends a JSON-mode call
+        session = new_session()
+        results = {}
+        caller = threading.Thread(target=slow_call, args=(session, 1, "application/json", results))
+        caller.start()
+        time.sleep(1)
+        assert post({"jsonrpc": "2.0", "method": "notifications/cancelled", "params": {"requestId": 1}}, session)[0] == 202
+        caller.join(5)
+        assert not caller.is_alive(), "cancelled call kept its POST open"
+        status, _, body = results[1]
+        assert status == 200 and json.loads(body)["error"]["code"] == -32800
+        
+        # Deleting the session ends an SSE call
+        session = new_session()
+        caller = threading.Thread(target=slow_call, args=(session, 2, "application/json, text/event-stream", results))
+        caller.start()
+        time.sleep(1)
+        request = urllib.request.Request(url, headers={"Mcp-Session-Id": session}, method="DELETE")
+        with urllib.request.urlopen(request, timeout=8) as response:
+            assert response.status == 200
+        caller.join(5)
+        assert not caller.is_alive(), "deleting the session kept an SSE call open"
+        status, _, body = results[2]
+        events = [json.loads(line[len("data: "):]) for line in body.splitlines() if line.startswith("data: ")]
+        assert status == 200 and events[-1]["id"] == 2 and events[-1]["error"]["code"] == -32800
+        print("   🛑 HTTP cancellation OK")
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+        mocks.stop()
+
+def test_worker_supervisor():
+    # Supervisor mode: requests are routed to worker processes and metrics/get combines them (no API keys needed)
+    import json
+    import os
+    import subprocess
+    import sys
+    
+    here = os.path.dirname(os.path.abspath(__file__))
+    requests_in = "\n".join(json.dumps(r) for r in [
+        {"jsonrpc": "2.0", "id": "a", "method": "initialize", "params": {}},
+        {"jsonrpc": "2.0", "id": "b", "method": "tools/list"},
+        {"jsonrpc": "2.0", "id": "c", "method": "metrics/get"}
+    ]) + "\n"
+    proc = subprocess.run(
+        [sys.executable, "mcp_server_focused.py", "--workers", "2"],
+        cwd=here, input=requests_in, capture_output=True, text=True, timeout=60
+    )
+    responses = {r["id"]: r for r in map(json.loads, proc.stdout.splitlines())}
+    assert responses["a"]["result"]["serverInfo"]["name"] == "focused-tools-mcp"
+    assert any(tool["name"] == "search_web" for tool in responses["b"]["result"]["tools"])
+    metrics = responses["c"]["result"]
+    assert metrics["supervisor"]["workers"] == 2 and len(metrics["workers"]) == 2
+    assert all("tools" in worker for worker in metrics["workers"])
+    print("   🧵 Worker supervisor OK")
+
 def demo_usage():
     # Show example usage of the tools
     print("\n" + "=" * 40)
@@ -99,5 +1349,31 @@ def demo_usage():
 
 if __name__ == "__main__":
     test_custom_tools()
+    test_server_startup()
+    test_concurrent_dispatch()
+    test_call_parameters()
+    test_coalesce_key()
+    test_cancelled_follower()
+    test_long_speech_chunks()
+    test_replicate_request_budget()
+    test_replicate_no_sdk_retries()
+    test_image_jobs()
+    test_seeded_image_reuse()
+    test_image_batch()
+    test_federated_fusion()
+    test_federated_errors()
+    test_result_cache()
+    test_run_batch()
+    test_response_encoding()
+    test_metrics()
+    test_page_address_guard()
+    test_page_revalidation()
+    test_profiling()
+    test_circuit_breaker()
+    test_fair_scheduler()
+    test_retries()
+    test_http_transport()
+    test_http_cancellation()
+    test_worker_supervisor()
     demo_usage()
 
@@ -0,0 +1,81 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List
+
+from tools.call_context import in_call, report_progress
+
+MAX_BATCH_QUERIES = 50
+
+# Concurrent upstream calls allowed per provider across every running batch
+DEFAULT_CONCURRENCY = {"serpapi": 5, "tavily": 5, "replicate": 4}
+
+_semaphores: Dict[str, threading.Semaphore] = {}
+_semaphores_lock = threading.Lock()
+
+def provider_semaphore(provider: str) -> threading.Semaphore:
+    with _semaphores_lock:
+        semaphore = _semaphores.get(provider)
+        if semaphore is None:
+            limit = int(os.getenv(f"MCP_{provider.upper()}_BATCH_CONCURRENCY", str(DEFAULT_CONCURRENCY.get(provider, 4))))
+            semaphore = threading.Semaphore(max(1, limit))
+            _semaphores[provider] = semaphore
+        return semaphore
+
+def run_batch(provider: str, queries: List[str], search: Callable[[str], Dict]) -> Dict:
+    # Run search for every distinct query concurrently under the provider's cap and
+    # return per-query results with their own success flag, error and latency
+    if not isinstance(queries, list) or not queries:
+        raise ValueError("queries must be a non-empty list of strings")
+    if len(queries) > MAX_BATCH_QUERIES:
+        raise ValueError(f"At most {MAX_BATCH_QUERIES} queries per batch")
+    
+    # Queries that differ only in case or whitespace are fetched once
+    groups: Dict[str, List[str]] = {}
+    for query in queries:
+        groups.setdefault(" ".join(str(query).split()).lower(), []).append(query)
+    
+    semaphore = provider_semaphore(provider)
+    
+    def run_one(query: str) -> Dict:
+        with semaphore:
+            started = time.perf_counter()
+            try:
+                result = search(query)
+            except Exception as e:
+                result = {"success": False, "error": str(e)}
+            latency_ms = round((time.perf_counter() - started) * 1000, 1)
+        
+        item = {"success": bool(result.get("success")), "latency_ms": latency_ms}
+        if item["success"]:
+            item["result"] = result
+        else:
+            item["error"] = result.get("error", "Unknown error")
+            if "status_code" in result:
+                item["status_code"] = result["status_code"]
+        return item
+    
+    started = time.perf_counter()
+    by_group: Dict[str, Dict] = {}
+    with ThreadPoolExecutor(max_workers=len(groups), thread_name_prefix=f"{provider}-batch") as pool:
+        futures = {pool.submit(in_call(run_one), members[0]): key for key, members in groups.items()}
+        for done, future in enumerate(as_completed(futures), 1):
+            by_group[futures[future]] = future.result()
+            report_progress(done, len(groups), f"Completed {done}/{len(groups)} queries")
+    
+    # Keep the caller's query order in the response
+    results = {query: by_group[key] for key, members in groups.items() for query in members}
+    results = {query: results[query] for query in queries}
+    
+    # Counted per submitted query, like total_queries, so exact duplicates count every time
+    succeeded = sum(1 for query in queries if results[query]["success"])
+    return {
+        "success": succeeded > 0,
+        "results": results,
+        "total_queries": len(queries),
+        "unique_queries": len(groups),
+        "succeeded": succeeded,
+        "failed": len(queries) - succeeded,
+        "total_time_ms": round((time.perf_counter() - started) * 1000, 1)
+    }
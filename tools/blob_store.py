@@ -0,0 +1,134 @@
+import os
+import json
+import hashlib
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from tools.file_lock import file_lock
+from tools.result_cache import default_cache_dir
+
+class BlobStore:
+    # Content-addressed files under one directory, kept within a total disk budget by LRU eviction.
+    # Every process pointed at the same directory shares it; lock files (dot-prefixed) coordinate them.
+    def __init__(self, root: str, max_bytes: int, suffix: str = ""):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+        os.makedirs(self.root, exist_ok=True)
+    
+    @staticmethod
+    def key_for(params: Dict) -> str:
+        # Hash of every parameter that affects the stored bytes
+        raw = json.dumps(params, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+    
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.root, key + self.suffix)
+    
+    def get(self, key: str) -> Optional[str]:
+        # Return the stored file path, marking it recently used, or None
+        path = self.path_for(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self._stats["misses"] += 1
+            return None
+        
+        with self._lock:
+            self._stats["hits"] += 1
+        return path
+    
+    @contextmanager
+    def writer(self, key: str):
+        # Write to a temp file in the same directory and rename it into place only on success,
+        # so readers never see a partial file and concurrent writers of one key cannot clash
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix=".", suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                yield f
+            os.replace(tmp_path, self.path_for(key))
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+        
+        with self._lock:
+            self._stats["writes"] += 1
+        self.evict(keep=key)
+    
+    @contextmanager
+    def filling(self, key: str):
+        # Held while producing the file for key, so processes asked for the same blob at the same
+        # time produce it once: whoever waited re-checks get() afterwards. The lock file is removed
+        # by its holder; a waiter that raced the removal only costs a duplicate fill, since
+        # writer() renames complete files into place either way.
+        lock_path = os.path.join(self.root, f".{key}.lock")
+        with file_lock(lock_path):
+            try:
+                yield
+            finally:
+                try:
+                    os.remove(lock_path)
+                except FileNotFoundError:
+                    pass
+    
+    def evict(self, keep: Optional[str] = None):
+        # Remove least recently used files until the store fits its budget. One process evicts
+        # at a time; the others skip it, since the running pass brings the shared total down.
+        with file_lock(os.path.join(self.root, ".evict.lock"), blocking=False) as held:
+            if held:
+                self._evict(keep)
+    
+    def _evict(self, keep: Optional[str]):
+        entries = []
+        total = 0
+        for entry in os.scandir(self.root):
+            if not entry.is_file() or not entry.name.endswith(self.suffix) or entry.name.startswith("."):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+        
+        if total <= self.max_bytes:
+            return
+        
+        keep_path = self.path_for(keep) if keep else None
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep_path:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            total -= size
+            with self._lock:
+                self._stats["evictions"] += 1
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            return dict(self._stats)
+
+_stores: Dict[str, BlobStore] = {}
+_stores_lock = threading.Lock()
+
+def get_store(name: str, suffix: str = "", default_max_mb: int = 512) -> BlobStore:
+    # Process-wide store under MCP_CACHE_DIR/<name>, budget from MCP_<NAME>_STORE_MB
+    with _stores_lock:
+        store = _stores.get(name)
+        if store is None:
+            max_mb = int(os.getenv(f"MCP_{name.upper()}_STORE_MB", str(default_max_mb)))
+            store = BlobStore(os.path.join(default_cache_dir(), name), max_mb * 1024 * 1024, suffix)
+            _stores[name] = store
+        return store
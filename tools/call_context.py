@@ -0,0 +1,233 @@
+import time
+import heapq
+import itertools
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+
+# With less than this many seconds left a call counts as out of time; no upstream request can finish in it
+DEADLINE_SLACK = 0.01
+
+class CallCancelled(Exception):
+    # The client sent notifications/cancelled for the call
+    pass
+
+class DeadlineExceeded(Exception):
+    # The call used up its time budget
+    pass
+
+class CallContext:
+    # Per-request state that tool code running on a worker thread can reach without extra arguments
+    def __init__(self, request_id: Any = None, progress_token: Any = None,
+                 notify: Optional[Callable[[Dict], None]] = None,
+                 cancel_event: Optional[threading.Event] = None,
+                 deadline: Optional[float] = None, timeout_ms: Optional[float] = None):
+        self.request_id = request_id
+        self.progress_token = progress_token
+        self.notify = notify
+        self.cancel_event = cancel_event or threading.Event()
+        self.deadline = deadline  # time.monotonic() value, or None for no limit
+        self.timeout_ms = timeout_ms
+        self.timed_out = False
+        self.queue_wait = None  # seconds spent waiting for a worker slot, set when the call starts
+        self.profile = None  # tools.profiling.ProfileSession while the call is being profiled
+        self._last_progress = None
+        self._responded = False
+        self._cancel_callbacks = []
+        self._lock = threading.Lock()
+    
+    def is_cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+    
+    def remaining(self) -> Optional[float]:
+        # Seconds left before the deadline, None when the call has none
+        if self.deadline is None:
+            return None
+        return self.deadline - time.monotonic()
+    
+    def expired(self) -> bool:
+        remaining = self.remaining()
+        return self.timed_out or (remaining is not None and remaining <= DEADLINE_SLACK)
+    
+    def is_aborted(self) -> bool:
+        return self.is_cancelled() or self.expired()
+    
+    def check(self):
+        # Raise if work for this call should stop
+        if self.expired():
+            raise DeadlineExceeded(f"Deadline of {self.timeout_ms:g} ms exceeded" if self.timeout_ms else "Deadline exceeded")
+        if self.is_cancelled():
+            raise CallCancelled("Call was cancelled")
+    
+    def wait(self, seconds: float):
+        # Sleep for up to seconds, waking early on cancellation; raises once the call is aborted
+        remaining = self.remaining()
+        if remaining is not None:
+            seconds = min(seconds, max(0.0, remaining))
+        self.cancel_event.wait(seconds)
+        self.check()
+    
+    def cancel(self, timed_out: bool = False):
+        # Flag the call and run the registered abort callbacks (e.g. shutting down sockets)
+        with self._lock:
+            if timed_out:
+                self.timed_out = True
+            self.cancel_event.set()
+            callbacks, self._cancel_callbacks = self._cancel_callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+    
+    def on_cancel(self, callback: Callable[[], None]) -> Callable[[], None]:
+        # Run callback when the call is cancelled (at once if it already is); returns an unregister function
+        with self._lock:
+            if not self.cancel_event.is_set():
+                self._cancel_callbacks.append(callback)
+                return lambda: self._discard_callback(callback)
+        callback()
+        return lambda: None
+    
+    def _discard_callback(self, callback: Callable[[], None]):
+        with self._lock:
+            try:
+                self._cancel_callbacks.remove(callback)
+            except ValueError:
+                pass
+    
+    def claim_response(self) -> bool:
+        # Exactly one of the worker, the deadline watchdog and a cancellation decides what the client gets
+        with self._lock:
+            if self._responded:
+                return False
+            self._responded = True
+            return True
+    
+    def report_progress(self, progress: float, total: Optional[float] = None, message: Optional[str] = None):
+        # Only clients that sent a progressToken asked for progress notifications
+        if self.progress_token is None or self.notify is None or self.is_cancelled():
+            return
+        
+        # The protocol requires progress to increase with every notification
+        with self._lock:
+            if self._last_progress is not None and progress <= self._last_progress:
+                return
+            self._last_progress = progress
+        
+        params = {"progressToken": self.progress_token, "progress": progress}
+        if total is not None:
+            params["total"] = total
+        if message:
+            params["message"] = message
+        
+        self.notify({
+            "jsonrpc": "2.0",
+            "method": "notifications/progress",
+            "params": params
+        })
+
+_current: contextvars.ContextVar = contextvars.ContextVar("mcp_call_context", default=None)
+
+def current_call() -> Optional[CallContext]:
+    return _current.get()
+
+@contextmanager
+def call_scope(context: CallContext):
+    # Make context the current call for the duration of the block. A profiled call's pool
+    # threads are profiled along with it.
+    token = _current.set(context)
+    profile = context.profile.enter_thread() if context.profile is not None else None
+    try:
+        yield context
+    finally:
+        if profile is not None:
+            profile.disable()
+        _current.reset(token)
+
+def in_call(fn: Callable) -> Callable:
+    # Wrap fn so it runs as part of the current call on another thread (e.g. a pool worker),
+    # seeing its deadline and cancellation
+    context = _current.get()
+    if context is None:
+        return fn
+    
+    def run(*args, **kwargs):
+        with call_scope(context):
+            return fn(*args, **kwargs)
+    return run
+
+def report_progress(progress: float, total: Optional[float] = None, message: Optional[str] = None):
+    # No-op outside of a dispatched tools/call
+    context = _current.get()
+    if context is not None:
+        context.report_progress(progress, total, message)
+
+def check_call():
+    # Raise CallCancelled/DeadlineExceeded if the current call is over; no-op outside a call
+    context = _current.get()
+    if context is not None:
+        context.check()
+
+def remaining_time() -> Optional[float]:
+    context = _current.get()
+    return context.remaining() if context is not None else None
+
+def bounded_timeout(timeout):
+    # Clamp a requests-style timeout (seconds or a (connect, read) tuple) to the current call's budget
+    remaining = remaining_time()
+    if remaining is None:
+        return timeout
+    check_call()
+    if isinstance(timeout, tuple):
+        return tuple(remaining if t is None else min(t, remaining) for t in timeout)
+    return remaining if timeout is None else min(timeout, remaining)
+
+def interruptible_sleep(seconds: float):
+    # time.sleep that gives up (raising) when the current call is cancelled or out of time
+    context = _current.get()
+    if context is None:
+        time.sleep(seconds)
+    else:
+        context.wait(seconds)
+
+def on_cancel(callback: Callable[[], None]) -> Callable[[], None]:
+    context = _current.get()
+    if context is None:
+        return lambda: None
+    return context.on_cancel(callback)
+
+class DeadlineWatchdog:
+    # A single thread that runs callbacks at their deadlines, instead of one timer thread per call
+    def __init__(self):
+        self._heap = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+    
+    def schedule(self, deadline: float, callback: Callable[[], None]):
+        # deadline is a time.monotonic() value
+        with self._condition:
+            heapq.heappush(self._heap, (deadline, next(self._sequence), callback))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="mcp-deadlines", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+    
+    def _run(self):
+        while True:
+            with self._condition:
+                if not self._heap:
+                    self._condition.wait()
+                    continue
+                deadline, _, callback = self._heap[0]
+                delay = deadline - time.monotonic()
+                if delay > 0:
+                    self._condition.wait(delay)
+                    continue
+                heapq.heappop(self._heap)
+            try:
+                callback()
+            except Exception:
+                pass
@@ -1,15 +1,39 @@
+import io
 import os
+import re
+import time
+import shutil
+import threading
 import requests
 import json
-from dotenv import load_dotenv
-from typing import Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple
 
-load_dotenv()
+from tools.blob_store import BlobStore, get_store
+from tools.call_context import check_call, in_call, report_progress
+from tools.env import load_env
+from tools.http_client import get_session
+from tools.metrics import get_metrics
+
+load_env()
+
+# Bytes per read from the streaming endpoint, and the minimum gap between progress notifications
+STREAM_CHUNK_SIZE = 16384
+PROGRESS_INTERVAL = 0.25
+
+# Texts longer than this many characters are split and synthesized in parallel
+LONG_TEXT_CHUNK_CHARS = int(os.getenv("MCP_TTS_CHUNK_CHARS", "1000"))
+LONG_TEXT_CONCURRENCY = int(os.getenv("MCP_TTS_CONCURRENCY", "3"))
+
+# Syntheses of one chunk whose file an eviction removed before it was read
+CHUNK_READ_ATTEMPTS = 3
 
 class ElevenLabsVoice:
-    def __init__(self):
+    def __init__(self, session: Optional[requests.Session] = None, audio_store: Optional[BlobStore] = None):
         self.api_key = os.getenv("ELEVENLABS_API_KEY")
-        self.base_url = "https://api.elevenlabs.io/v1"
+        self.base_url = os.getenv("ELEVENLABS_BASE_URL", "https://api.elevenlabs.io/v1")
+        self.session = session or get_session("elevenlabs")
+        self.audio_store = audio_store or get_store("audio", ".mp3", 512)
         
         if not self.api_key:
             raise ValueError("ELEVENLABS_API_KEY is not set")
@@ -17,7 +41,7 @@ class ElevenLabsVoice:
     def get_voices(self) -> List[Dict]:
         # Get all available voices
         url = f"{self.base_url}/voices"
-        response = requests.get(url, headers={"xi-api-key": self.api_key})
+        response = self.session.get(url, headers={"xi-api-key": self.api_key})
         
         if response.status_code == 200:
             return response.json().get("voices", [])
@@ -26,37 +50,37 @@ class ElevenLabsVoice:
     
     def generate_speech(self, text: str, voice_id: str = "21m00Tcm4TlvDq8ikWAM", 
                        model_id: str = "eleven_monolingual_v1",
-                       stability: float = 0.5, similarity_boost: float = 0.75) -> Dict:
-        # Generate speech from text
-        url = f"{self.base_url}/text-to-speech/{voice_id}"
+                       stability: float = 0.5, similarity_boost: float = 0.75,
+                       stream: bool = False) -> Dict:
+        # Generate speech from text, reusing stored audio for identical requests
+        if stream:
+            return self.stream_speech(text, voice_id, model_id, stability, similarity_boost)
         
-        payload = {
-            "text": text,
-            "model_id": model_id,
-            "voice_settings": {
-                "stability": stability,
-                "similarity_boost": similarity_boost
-            }
-        }
+        key = self.speech_key(text, voice_id, model_id, stability, similarity_boost)
+        return self._stored_or_fill(key, text, voice_id, model_id,
+                                    lambda: self._fetch_speech(key, text, voice_id, model_id, stability, similarity_boost))
+    
+    def _fetch_speech(self, key: str, text: str, voice_id: str, model_id: str,
+                      stability: float, similarity_boost: float) -> Dict:
+        url = f"{self.base_url}/text-to-speech/{voice_id}"
         
-        response = requests.post(
+        response = self.session.post(
             url,
             headers={
                 "xi-api-key": self.api_key,
                 "Content-Type": "application/json"
             },
-            json=payload
+            json=self._speech_payload(text, model_id, stability, similarity_boost)
         )
         
         if response.status_code == 200:
-            # Save audio to file
-            audio_path = f"/tmp/speech_{voice_id}.mp3"
-            with open(audio_path, "wb") as f:
+            # Save audio to the store
+            with self.audio_store.writer(key) as f:
                 f.write(response.content)
             
             return {
                 "success": True,
-                "audio_path": audio_path,
+                "audio_path": self.audio_store.path_for(key),
                 "voice_id": voice_id,
                 "text_length": len(text),
                 "model_used": model_id
@@ -68,6 +92,195 @@ class ElevenLabsVoice:
                 "status_code": response.status_code
             }
     
+    def stream_speech(self, text: str, voice_id: str = "21m00Tcm4TlvDq8ikWAM",
+                      model_id: str = "eleven_monolingual_v1",
+                      stability: float = 0.5, similarity_boost: float = 0.75,
+                      report_bytes: bool = True) -> Dict:
+        # Generate speech through the streaming endpoint, writing chunks to disk as they arrive.
+        # report_bytes=False leaves progress to the caller (generate_long_speech counts chunks).
+        key = self.speech_key(text, voice_id, model_id, stability, similarity_boost)
+        return self._stored_or_fill(key, text, voice_id, model_id,
+                                    lambda: self._stream_to_store(key, text, voice_id, model_id, stability, similarity_boost, report_bytes))
+    
+    def _stream_to_store(self, key: str, text: str, voice_id: str, model_id: str,
+                         stability: float, similarity_boost: float, report_bytes: bool = True) -> Dict:
+        url = f"{self.base_url}/text-to-speech/{voice_id}/stream"
+        
+        started = time.perf_counter()
+        response = self.session.post(
+            url,
+            headers={
+                "xi-api-key": self.api_key,
+                "Content-Type": "application/json"
+            },
+            json=self._speech_payload(text, model_id, stability, similarity_boost),
+            stream=True
+        )
+        
+        with response:
+            if response.status_code != 200:
+                return {
+                    "success": False,
+                    "error": response.text,
+                    "status_code": response.status_code
+                }
+            
+            first_byte = None
+            bytes_written = 0
+            last_report = 0.0
+            
+            with self.audio_store.writer(key) as f:
+                for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+                    check_call()
+                    if not chunk:
+                        continue
+                    
+                    now = time.perf_counter()
+                    if first_byte is None:
+                        first_byte = now - started
+                    
+                    f.write(chunk)
+                    bytes_written += len(chunk)
+                    
+                    if report_bytes and now - last_report >= PROGRESS_INTERVAL:
+                        last_report = now
+                        report_progress(bytes_written, message=f"{bytes_written} bytes of audio received")
+            
+            total = time.perf_counter() - started
+            get_metrics().record_bytes("elevenlabs", bytes_written)
+        
+        return {
+            "success": True,
+            "audio_path": self.audio_store.path_for(key),
+            "voice_id": voice_id,
+            "text_length": len(text),
+            "model_used": model_id,
+            "streamed": True,
+            "bytes_written": bytes_written,
+            "time_to_first_byte_ms": round(first_byte * 1000, 1) if first_byte is not None else None,
+            "total_time_ms": round(total * 1000, 1)
+        }
+    
+    @staticmethod
+    def speech_key(text: str, voice_id: str, model_id: str, stability: float, similarity_boost: float) -> str:
+        # Identical text and voice settings always produce the same stored file
+        return BlobStore.key_for({
+            "text": text,
+            "voice_id": voice_id,
+            "model_id": model_id,
+            "stability": stability,
+            "similarity_boost": similarity_boost
+        })
+    
+    @staticmethod
+    def _speech_payload(text: str, model_id: str, stability: float, similarity_boost: float) -> Dict:
+        return {
+            "text": text,
+            "model_id": model_id,
+            "voice_settings": {
+                "stability": stability,
+                "similarity_boost": similarity_boost
+            }
+        }
+    
+    def _stored_or_fill(self, key: str, text: str, voice_id: str, model_id: str, fill) -> Dict:
+        # Serve stored audio, or synthesize it under the store's fill lock so that workers sharing
+        # the audio store never pay for the same speech twice
+        cached = self._stored_speech(key, text, voice_id, model_id)
+        if cached:
+            return cached
+        
+        with self.audio_store.filling(key):
+            # Another worker may have stored it while this one waited
+            if os.path.exists(self.audio_store.path_for(key)):
+                return self._stored_speech(key, text, voice_id, model_id) or fill()
+            return fill()
+    
+    def _stored_speech(self, key: str, text: str, voice_id: str, model_id: str) -> Optional[Dict]:
+        audio_path = self.audio_store.get(key)
+        if audio_path is None:
+            return None
+        
+        return {
+            "success": True,
+            "audio_path": audio_path,
+            "voice_id": voice_id,
+            "text_length": len(text),
+            "model_used": model_id,
+            "cached": True
+        }
+    
+    def generate_long_speech(self, text: str, voice_id: str = "21m00Tcm4TlvDq8ikWAM",
+                             model_id: str = "eleven_monolingual_v1",
+                             stability: float = 0.5, similarity_boost: float = 0.75,
+                             chunk_chars: int = LONG_TEXT_CHUNK_CHARS,
+                             concurrency: int = LONG_TEXT_CONCURRENCY) -> Dict:
+        # Split long text into paragraph chunks, synthesize them concurrently and stitch them in
+        # order into one file. Each chunk is stored on its own, so editing one paragraph only
+        # re-synthesizes that paragraph's chunks.
+        chunks = split_text(text, chunk_chars)
+        if len(chunks) <= 1:
+            return self.stream_speech(text, voice_id, model_id, stability, similarity_boost)
+        
+        key = self.speech_key(text, voice_id, model_id, stability, similarity_boost)
+        cached = self._stored_speech(key, text, voice_id, model_id)
+        if cached:
+            return cached
+        
+        # Progress counts finished chunks. The chunks' own byte counts would start above it, and
+        # progress must only increase, so they would hide every chunk notification.
+        started = time.perf_counter()
+        results: List[Optional[Tuple[Dict, bytes]]] = [None] * len(chunks)
+        with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="tts-chunk") as pool:
+            futures = {
+                pool.submit(in_call(self._chunk_audio), chunk, voice_id, model_id, stability, similarity_boost): index
+                for index, chunk in enumerate(chunks)
+            }
+            done = 0
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+                done += 1
+                report_progress(done, len(chunks), f"Synthesized {done}/{len(chunks)} chunks")
+        
+        failed = [result for result, _ in results if not result.get("success")]
+        if failed:
+            return failed[0]
+        
+        # Concatenate the chunks frame-for-frame
+        with self.audio_store.writer(key) as out:
+            for index, (_, audio) in enumerate(results):
+                audio = io.BytesIO(audio)
+                if index > 0:
+                    _skip_id3_header(audio)
+                shutil.copyfileobj(audio, out)
+        
+        return {
+            "success": True,
+            "audio_path": self.audio_store.path_for(key),
+            "voice_id": voice_id,
+            "text_length": len(text),
+            "model_used": model_id,
+            "chunks": len(chunks),
+            "chunks_from_cache": sum(1 for result, _ in results if result.get("cached")),
+            "total_time_ms": round((time.perf_counter() - started) * 1000, 1)
+        }
+    
+    def _chunk_audio(self, text: str, voice_id: str, model_id: str,
+                     stability: float, similarity_boost: float) -> Tuple[Dict, bytes]:
+        # One chunk's result and audio bytes. The bytes are read as soon as the chunk is stored:
+        # another write may evict its file before the chunks are stitched. A file evicted
+        # between synthesis and this read is synthesized again.
+        for _ in range(CHUNK_READ_ATTEMPTS):
+            result = self.stream_speech(text, voice_id, model_id, stability, similarity_boost, False)
+            if not result.get("success"):
+                return result, b""
+            try:
+                with open(result["audio_path"], "rb") as f:
+                    return result, f.read()
+            except FileNotFoundError:
+                continue
+        return {"success": False, "error": "Chunk audio was evicted from the audio store before it could be read"}, b""
+    
     def clone_voice(self, name: str, description: str, files: List[str]) -> Dict:
         # Clone a voice from audio files
         url = f"{self.base_url}/voices/add"
@@ -82,7 +295,7 @@ class ElevenLabsVoice:
             with open(file_path, "rb") as f:
                 files_data.append(("files", f))
         
-        response = requests.post(
+        response = self.session.post(
             url,
             headers={"xi-api-key": self.api_key},
             data=payload,
@@ -94,18 +307,79 @@ class ElevenLabsVoice:
         else:
             return {"success": False, "error": response.text}
 
-def generate_voice_from_text(text: str, voice_id: str = "21m00Tcm4TlvDq8ikWAM") -> Dict:
-    # Generate voice from text
+def split_text(text: str, max_chars: int) -> List[str]:
+    # One chunk per paragraph, so a chunk's text (and its stored audio) only changes when its
+    # paragraph does. Paragraphs over max_chars are packed sentence by sentence, and sentences
+    # over max_chars word by word; either way the boundaries stay inside the paragraph.
+    chunks = []
+    for paragraph in re.split(r"\n\s*\n", text.strip()):
+        paragraph = " ".join(paragraph.split())
+        if not paragraph:
+            continue
+        if len(paragraph) <= max_chars:
+            chunks.append(paragraph)
+            continue
+        
+        current = ""
+        for sentence in re.split(r"(?<=[.!?])\s+", paragraph):
+            while len(sentence) > max_chars:
+                cut = sentence.rfind(" ", 0, max_chars)
+                cut = cut if cut > 0 else max_chars
+                if current:
+                    chunks.append(current)
+                    current = ""
+                chunks.append(sentence[:cut])
+                sentence = sentence[cut:].lstrip()
+            if not sentence:
+                continue
+            if current and len(current) + 1 + len(sentence) <= max_chars:
+                current += " " + sentence
+            else:
+                if current:
+                    chunks.append(current)
+                current = sentence
+        if current:
+            chunks.append(current)
+    return chunks
+
+def _skip_id3_header(f):
+    # Position f after a leading ID3v2 tag so only MP3 frames are appended to the stitched file
+    header = f.read(10)
+    if len(header) == 10 and header[:3] == b"ID3":
+        size = 0
+        for b in header[6:10]:
+            size = (size << 7) | (b & 0x7F)
+        if header[5] & 0x10:
+            size += 10
+        f.seek(10 + size)
+    else:
+        f.seek(0)
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client() -> ElevenLabsVoice:
+    # One long-lived client per process, shared by every tool call
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = ElevenLabsVoice()
+        return _client
+
+def generate_voice_from_text(text: str, voice_id: str = "21m00Tcm4TlvDq8ikWAM", stream: bool = False) -> Dict:
+    # Generate voice from text; long passages go through the parallel chunked pipeline
     try:
-        elevenlabs = ElevenLabsVoice()
-        return elevenlabs.generate_speech(text, voice_id)
+        elevenlabs = get_client()
+        if len(text) > LONG_TEXT_CHUNK_CHARS:
+            return elevenlabs.generate_long_speech(text, voice_id)
+        return elevenlabs.generate_speech(text, voice_id, stream=stream)
     except Exception as e:
         return {"success": False, "error": str(e)}
 
 def get_available_voices() -> List[Dict]:
     # Get available voices
     try:
-        elevenlabs = ElevenLabsVoice()
+        elevenlabs = get_client()
         return elevenlabs.get_voices()
     except Exception as e:
         return [{"error": str(e)}]
@@ -0,0 +1,167 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from urllib.parse import parse_qsl, urlencode, urlsplit
+from typing import Dict, List, Optional
+
+from tools.call_context import CallContext, call_scope, current_call
+from tools.scheduler import DEFAULT_CAPS
+from tools.serpapi_search import search_web_query
+from tools.tavily_search import search_with_tavily
+
+# Reciprocal-rank fusion constant; 60 is the value from the original RRF paper
+RRF_K = 60
+
+TRACKING_PARAMS = {"gclid", "fbclid", "msclkid", "yclid", "igshid", "mc_cid", "mc_eid", "ref", "ref_src", "_ga", "_hsenc", "_hsmi"}
+
+# Seconds of the call's deadline kept back for fusing the results that did arrive
+FUSE_MARGIN = 0.1
+
+# Provider calls keep running past the federated deadline so late results still land in the
+# cache, but only for this many deadlines in all; then they are cut off like any timed-out call
+PROVIDER_BUDGET_FACTOR = 2
+
+# They run on a shared pool that a federated call never waits to shut down. Each of the
+# scheduler's concurrent search_federated calls (its cap) leaves at most two rounds of provider
+# calls on the pool at once, the finished call's lingering ones and its successor's, so this
+# size never makes a call's providers wait for a thread.
+_FEDERATED_CAP = int(os.getenv("MCP_SEARCH_FEDERATED_MAX_CONCURRENCY", str(DEFAULT_CAPS["search_federated"])))
+_pool = ThreadPoolExecutor(max_workers=2 * PROVIDER_BUDGET_FACTOR * _FEDERATED_CAP, thread_name_prefix="federated")
+
+def canonicalize_url(url: str) -> str:
+    # Collapse scheme, www., default ports, tracking params, fragments and trailing slashes
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    if parts.port and parts.port not in (80, 443):
+        host = f"{host}:{parts.port}"
+    
+    path = parts.path.rstrip("/")
+    query = sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith("utm_") and k.lower() not in TRACKING_PARAMS
+    )
+    return host + path + ("?" + urlencode(query) if query else "")
+
+def _serpapi_items(result: Dict) -> List[Dict]:
+    return [
+        {"url": item.get("link"), "title": item.get("title", ""), "snippet": item.get("snippet", "")}
+        for item in result.get("organic_results", []) if item.get("link")
+    ]
+
+def _tavily_items(result: Dict) -> List[Dict]:
+    return [
+        {"url": item.get("url"), "title": item.get("title", ""), "snippet": item.get("content", "")}
+        for item in result.get("results", []) if item.get("url")
+    ]
+
+def _provider_context(budget: float) -> CallContext:
+    # Provider calls get their own deadline, budget seconds from now (never past the call's),
+    # and are cancelled along with the call
+    parent = current_call()
+    deadline = time.monotonic() + budget
+    if parent is not None and parent.deadline is not None:
+        deadline = min(deadline, parent.deadline)
+    context = CallContext(
+        request_id=parent.request_id if parent is not None else None,
+        deadline=deadline,
+        timeout_ms=round((deadline - time.monotonic()) * 1000)
+    )
+    if parent is not None:
+        context.profile = parent.profile
+        parent.on_cancel(context.cancel)
+    return context
+
+def _run_in(context: CallContext, call):
+    with call_scope(context):
+        return call()
+
+def fuse_results(ranked: Dict[str, List[Dict]], limit: int) -> List[Dict]:
+    # Merge per-provider rankings with reciprocal-rank fusion, de-duplicated by canonical URL
+    fused: Dict[str, Dict] = {}
+    for provider, items in ranked.items():
+        for rank, item in enumerate(items, 1):
+            key = canonicalize_url(item["url"])
+            entry = fused.get(key)
+            if entry is None:
+                entry = fused[key] = {
+                    "url": item["url"],
+                    "title": item["title"],
+                    "snippet": item["snippet"],
+                    "score": 0.0,
+                    "ranks": {}
+                }
+            elif len(item["snippet"]) > len(entry["snippet"]):
+                entry["snippet"] = item["snippet"]
+            if provider not in entry["ranks"]:
+                entry["ranks"][provider] = rank
+                entry["score"] += 1.0 / (RRF_K + rank)
+    
+    results = sorted(fused.values(), key=lambda entry: (-entry["score"], min(entry["ranks"].values())))
+    for entry in results:
+        entry["score"] = round(entry["score"], 6)
+        entry["providers"] = sorted(entry["ranks"])
+    return results[:limit]
+
+def federated_search(query: str, num_results: int = 10, deadline_ms: int = 4000,
+                     cache: Optional[str] = None) -> Dict:
+    # Query SerpAPI and Tavily at once and fuse whatever has arrived by the deadline. A provider
+    # whose breaker is open contributes stale results at best, never the other provider's.
+    started = time.perf_counter()
+    calls = {
+        "serpapi": (lambda: search_web_query(query, num_results, cache, reroute=False), _serpapi_items),
+        "tavily": (lambda: search_with_tavily(query, "basic", cache, reroute=False), _tavily_items),
+    }
+    context = _provider_context(PROVIDER_BUDGET_FACTOR * deadline_ms / 1000.0)
+    futures = {provider: _pool.submit(_run_in, context, call) for provider, (call, _) in calls.items()}
+    
+    # Leave a little of the call's own budget to fuse and return what has arrived
+    timeout = deadline_ms / 1000.0
+    parent = current_call()
+    if parent is not None and parent.deadline is not None:
+        timeout = max(0.0, min(timeout, parent.remaining() - FUSE_MARGIN))
+    wait(list(futures.values()), timeout=timeout)
+    
+    ranked = {}
+    providers = {}
+    for provider, future in futures.items():
+        if not future.done():
+            providers[provider] = {"status": "timeout"}
+            continue
+        
+        try:
+            result = future.result()
+        except Exception as e:
+            result = {"success": False, "error": str(e)}
+        
+        if result.get("success"):
+            ranked[provider] = calls[provider][1](result)
+            providers[provider] = {"status": "ok", "results": len(ranked[provider])}
+        else:
+            providers[provider] = {"status": "error", "error": result.get("error", "Unknown error")}
+    
+    missing = [provider for provider, info in providers.items() if info["status"] != "ok"]
+    if not ranked:
+        # Each provider's own error; the deadline only for those that actually ran out of time
+        reasons = [
+            f"{provider}: " + ("no answer before the deadline" if info["status"] == "timeout" else info["error"])
+            for provider, info in providers.items()
+        ]
+        return {
+            "success": False,
+            "query": query,
+            "error": "No search provider answered (" + "; ".join(reasons) + ")",
+            "providers": providers,
+            "missing_providers": missing
+        }
+    
+    return {
+        "success": True,
+        "query": query,
+        "results": fuse_results(ranked, num_results),
+        "providers": providers,
+        "missing_providers": missing,
+        "partial": bool(missing),
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)
+    }
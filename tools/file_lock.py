@@ -0,0 +1,58 @@
+import os
+import threading
+from contextlib import contextmanager
+from typing import Dict
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # Windows: locks only exclude threads of this process
+
+from tools.call_context import interruptible_sleep
+
+# How often a blocked waiter retries; waiting in steps keeps it responsive to cancellation and deadlines
+LOCK_POLL_INTERVAL = 0.05
+
+_local_locks: Dict[str, threading.Lock] = {}
+_local_locks_guard = threading.Lock()
+
+@contextmanager
+def file_lock(path: str, blocking: bool = True):
+    # Advisory exclusive lock on path, shared by every process using the same cache directory
+    # (worker processes under the supervisor). Yields True once held; with blocking=False yields
+    # False straight away if someone else holds it. The OS drops the lock if its holder dies.
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    if fcntl is None:
+        with _local_lock(path, blocking) as held:
+            yield held
+        return
+    
+    # Every acquisition opens its own descriptor, so flock also excludes threads of this process
+    with open(path, "a+b") as f:
+        while True:
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if not blocking:
+                    yield False
+                    return
+                interruptible_sleep(LOCK_POLL_INTERVAL)
+        try:
+            yield True
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+@contextmanager
+def _local_lock(path: str, blocking: bool):
+    with _local_locks_guard:
+        lock = _local_locks.setdefault(path, threading.Lock())
+    while not lock.acquire(blocking=False):
+        if not blocking:
+            yield False
+            return
+        interruptible_sleep(LOCK_POLL_INTERVAL)
+    try:
+        yield True
+    finally:
+        lock.release()
@@ -1,24 +1,98 @@
 import replicate
+import replicate.client as replicate_client
 import os
-from dotenv import load_dotenv
+import time
+import threading
+import httpx
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from replicate.exceptions import ReplicateError
+from typing import Dict, List, Optional, Tuple
 
-load_dotenv()
+from tools.batch import provider_semaphore
+from tools.blob_store import BlobStore, get_store
+from tools.call_context import CallCancelled, DeadlineExceeded, bounded_timeout, check_call, in_call, interruptible_sleep, remaining_time, report_progress
+from tools.env import load_env
+from tools.health import CircuitOpen
+from tools.http_client import get_session
+from tools.metrics import get_metrics
+from tools.rate_limit import RETRYABLE_STATUS, get_limiter
+from tools.response_encoding import dumps
 
-def generate_image(prompt: str) -> str:
-    replicate_api_token = os.getenv("REPLICATE_API_TOKEN")
-    if not replicate_api_token:
-        raise ValueError("REPLICATE_API_TOKEN is not set")
+load_env()
+
+# Connect and read timeouts of a Replicate API request (the SDK's defaults). A request inside a
+# tool call never gets more than what is left of the call's deadline.
+REPLICATE_CONNECT_TIMEOUT = 5.0
+REPLICATE_READ_TIMEOUT = 30.0
+
+class BudgetedClient(replicate.Client):
+    # replicate.Client whose requests (creates, polls, cancels) are each bounded by the current
+    # call's remaining time, so a hung poll cannot outlive the deadline. Its httpx client has a
+    # plain transport: the SDK's RetryTransport would retry 429/503/504 GETs up to 10 times
+    # inside one ProviderLimiter attempt, past the token bucket, the retry budget, Retry-After
+    # and the deadline. ProviderLimiter makes every retry decision instead.
+    def __init__(self, api_token: str, base_url: Optional[str] = None):
+        super().__init__(api_token=api_token, base_url=base_url)
+        self._http = httpx.Client(
+            base_url=base_url or "https://api.replicate.com",
+            headers={"User-Agent": f"replicate-python/{replicate_client.__version__}", "Authorization": f"Bearer {api_token}"},
+            timeout=httpx.Timeout(REPLICATE_READ_TIMEOUT, connect=REPLICATE_CONNECT_TIMEOUT),
+            transport=httpx.HTTPTransport()
+        )
     
-    # Set the API token as environment variable
-    os.environ["REPLICATE_API_TOKEN"] = replicate_api_token
+    @property
+    def _client(self) -> httpx.Client:
+        return self._http
     
-    input = {"prompt": prompt}
+    def _request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        connect, read = bounded_timeout((REPLICATE_CONNECT_TIMEOUT, REPLICATE_READ_TIMEOUT))
+        kwargs.setdefault("timeout", httpx.Timeout(read, connect=connect, pool=connect))
+        return super()._request(method, path, **kwargs)
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client() -> BudgetedClient:
+    # One long-lived Replicate client (and its connection pool) per process
+    global _client
+    with _client_lock:
+        if _client is None:
+            replicate_api_token = os.getenv("REPLICATE_API_TOKEN")
+            if not replicate_api_token:
+                raise ValueError("REPLICATE_API_TOKEN is not set")
+            
+            # REPLICATE_BASE_URL points the client at a stand-in server, e.g. for benchmarks
+            _client = BudgetedClient(api_token=replicate_api_token, base_url=os.getenv("REPLICATE_BASE_URL"))
+        return _client
+
+def should_retry(result, error: Optional[Exception]) -> Tuple[bool, Optional[float]]:
+    # Retry Replicate throttling/5xx responses and connections that never reached the API
+    if isinstance(error, ReplicateError):
+        return error.status in RETRYABLE_STATUS, None
+    return isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout)), None
+
+# This model I found on replicate has a good balance between speed and quality. You may choose your own.
+IMAGE_MODEL = "black-forest-labs/flux-schnell"
+
+# Inputs that change the produced image, and therefore its key in the local image store
+IMAGE_OPTIONS = ("seed", "megapixels", "aspect_ratio", "output_format", "output_quality", "num_inference_steps")
+
+DOWNLOAD_CHUNK_SIZE = 65536
+
+TERMINAL_STATUSES = ("succeeded", "failed", "canceled")
 
-    output = replicate.run(
-        # This model I found on replicate has a good balance between speed and quality. You may choose your own.
-        "black-forest-labs/flux-schnell", 
-        # Each model has its own input parameters. You may customize to your liking. I went with the default settings.
-        input={
+# Longest a create request blocks with "Prefer: wait" (the API accepts 1-60 seconds). flux-schnell
+# usually finishes well within it; slower predictions are polled, where cancellation is noticed quickly.
+MAX_SYNC_WAIT = 5
+
+# flux-schnell returns at most 4 images per prediction
+MAX_OUTPUTS_PER_PREDICTION = 4
+MAX_BATCH_IMAGES = 32
+
+def image_input(prompt: str, **options) -> Dict:
+    # Each model has its own input parameters. You may customize to your liking. I went with the default settings.
+    input = {
         "prompt": prompt,
         "go_fast": True,
         "megapixels": "1",
@@ -27,11 +101,207 @@ def generate_image(prompt: str) -> str:
         "output_format": "webp",
         "output_quality": 80,
         "num_inference_steps": 4
-        }
-    )
+    }
+    input.update({name: value for name, value in options.items() if value is not None})
+    return input
+
+def image_key(model: str, input: Dict, nonce: Optional[str] = None) -> str:
+    # Without a fixed seed the same prompt gives a different image every time,
+    # so such images get a unique key (the nonce) and are never served as a cache hit
+    params = {"model": model}
+    params.update({name: input.get(name) for name in ("prompt",) + IMAGE_OPTIONS})
+    if params["seed"] is None:
+        params["nonce"] = nonce
+    return BlobStore.key_for(params) + "." + str(input.get("output_format", "webp"))
+
+def get_image_store() -> BlobStore:
+    return get_store("images", "", 1024)
+
+def download_image(url: str, key: str) -> str:
+    # Stream a finished image into the local store and return its path
+    store = get_image_store()
+    with get_session("replicate_delivery").get(url, stream=True) as response:
+        response.raise_for_status()
+        received = 0
+        with store.writer(key) as f:
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                check_call()
+                f.write(chunk)
+                received += len(chunk)
+    get_metrics().record_bytes("replicate_delivery", received)
+    return store.path_for(key)
+
+def call_replicate(fn):
+    # Rate-limited, retried Replicate API call, recorded in the metrics registry
+    started = time.perf_counter()
+    try:
+        result = get_limiter("replicate").execute(fn, should_retry)
+    except CircuitOpen:
+        raise  # no request was sent
+    except Exception as e:
+        get_metrics().record_upstream("replicate", getattr(e, "status", None) or type(e).__name__, time.perf_counter() - started)
+        raise
+    get_metrics().record_upstream("replicate", 200, time.perf_counter() - started)
+    return result
+
+def run_prediction(input: Dict) -> List:
+    # client.run equivalent whose blocking wait and polling stay within the current call's
+    # deadline. A prediction whose call is cancelled or runs out of time is cancelled upstream.
+    client = get_client()
+    remaining = remaining_time()
+    wait = MAX_SYNC_WAIT if remaining is None else max(1, min(MAX_SYNC_WAIT, int(remaining)))
+    prediction = call_replicate(lambda: client.models.predictions.create(model=IMAGE_MODEL, input=input, wait=wait))
+    
+    try:
+        while prediction.status not in TERMINAL_STATUSES:
+            interruptible_sleep(client.poll_interval)
+            call_replicate(prediction.reload)
+    except (CallCancelled, DeadlineExceeded):
+        # Nobody is waiting for these images any more, so stop paying for them
+        try:
+            client.predictions.cancel(prediction.id)
+        except Exception:
+            pass
+        raise
+    
+    if prediction.status != "succeeded":
+        raise RuntimeError(prediction.error or f"Prediction {prediction.status}")
+    output = prediction.output
+    if output is None:
+        return []
+    return output if isinstance(output, list) else [output]
+
+def generate_image(prompt: str) -> str:
+    output = run_prediction(image_input(prompt))
     
     # Return the first URL as a string, or None if no output
     if output and len(output) > 0:
         return str(output[0])
     else:
-        return None
\ No newline at end of file
+        return None
+
+def generate_image_file(prompt: str, **options) -> Dict:
+    # Generate an image and keep a local copy. With a fixed seed an identical request
+    # is served from disk without running a prediction.
+    input = image_input(prompt, **options)
+    if input.get("seed") is None:
+        return _generate_file(input)
+    
+    store = get_image_store()
+    key = image_key(IMAGE_MODEL, input)
+    cached = _stored_image(store, key, input)
+    if cached:
+        return cached
+    
+    # Workers sharing the image store run one prediction per seeded request
+    with store.filling(key):
+        if os.path.exists(store.path_for(key)):
+            cached = _stored_image(store, key, input)
+            if cached:
+                return cached
+        return _generate_file(input)
+
+def _stored_image(store: BlobStore, key: str, input: Dict) -> Optional[Dict]:
+    local_path = store.get(key)
+    if not local_path:
+        return None
+    return {
+        "success": True,
+        "image_url": Path(local_path).as_uri(),
+        "local_path": local_path,
+        "seed": input["seed"],
+        "cached": True
+    }
+
+def _generate_file(input: Dict) -> Dict:
+    output = run_prediction(input)
+    if not output:
+        return {"success": False, "error": "No image returned"}
+    
+    result = _stored_output(input, str(output[0]))
+    result.update({"success": True, "seed": input.get("seed"), "cached": False})
+    return result
+
+def _stored_output(input: Dict, image_url: str) -> Dict:
+    result = {"image_url": image_url}
+    try:
+        result["local_path"] = download_image(image_url, image_key(IMAGE_MODEL, input, image_url))
+    except Exception as e:
+        # The remote URL still works for a while, so a failed download is not fatal
+        result["download_error"] = str(e)
+    return result
+
+def _run_variants(prompt: str, num_outputs: int, options: Dict) -> List[Dict]:
+    # One prediction producing several variants of the same prompt
+    input = image_input(prompt, num_outputs=num_outputs, **options)
+    output = run_prediction(input)
+    return [_stored_output(input, str(url)) for url in output or []]
+
+def _run_seeded(prompt: str, seed: int, options: Dict) -> List[Dict]:
+    result = generate_image_file(prompt, seed=seed, **options)
+    if not result.get("success"):
+        raise RuntimeError(result.get("error", "Image generation failed"))
+    return [result]
+
+def generate_images_batch(prompts: List[str], variants: int = 1, **options) -> Dict:
+    # Generate variants of every prompt with predictions running concurrently under the
+    # Replicate cap. Unseeded variants are packed num_outputs at a time; with a seed every
+    # variant gets its own seed (seed, seed + 1, ...) so each one can be served from disk.
+    if isinstance(prompts, str):
+        prompts = [prompts]
+    if not prompts or variants < 1:
+        return {"success": False, "error": "Provide at least one prompt and one variant"}
+    if len(prompts) * variants > MAX_BATCH_IMAGES:
+        return {"success": False, "error": f"At most {MAX_BATCH_IMAGES} images per batch"}
+    
+    seed = options.pop("seed", None)
+    work = []  # (prompt index, callable returning a list of image dicts)
+    for index, prompt in enumerate(prompts):
+        if seed is not None:
+            for variant in range(variants):
+                work.append((index, lambda p=prompt, v=variant: _run_seeded(p, seed + v, options)))
+        else:
+            for start in range(0, variants, MAX_OUTPUTS_PER_PREDICTION):
+                count = min(MAX_OUTPUTS_PER_PREDICTION, variants - start)
+                work.append((index, lambda p=prompt, n=count: _run_variants(p, n, options)))
+    
+    semaphore = provider_semaphore("replicate")
+    
+    def run(fn) -> Tuple[List[Dict], Optional[str], float]:
+        with semaphore:
+            started = time.perf_counter()
+            try:
+                return fn(), None, time.perf_counter() - started
+            except Exception as e:
+                return [], str(e), time.perf_counter() - started
+    
+    started = time.perf_counter()
+    items = [{"prompt": prompt, "images": [], "errors": [], "latency_ms": 0.0} for prompt in prompts]
+    with ThreadPoolExecutor(max_workers=len(work), thread_name_prefix="image-batch") as pool:
+        futures = {pool.submit(in_call(run), fn): index for index, fn in work}
+        for done, future in enumerate(as_completed(futures), 1):
+            index = futures[future]
+            images, error, elapsed = future.result()
+            item = items[index]
+            item["images"].extend(images)
+            if error:
+                item["errors"].append(error)
+            item["latency_ms"] = max(item["latency_ms"], round(elapsed * 1000, 1))
+            # The prediction's images (URLs and local paths) go out as soon as they are stored
+            progress = {"prompt_index": index, "prompt": prompts[index], "images": images}
+            if error:
+                progress["error"] = error
+            report_progress(done, len(work), dumps(progress))
+    
+    for item in items:
+        item["success"] = bool(item["images"]) and not item["errors"]
+        if not item["errors"]:
+            del item["errors"]
+    
+    return {
+        "success": any(item["success"] for item in items),
+        "results": items,
+        "predictions": len(work),
+        "images": sum(len(item["images"]) for item in items),
+        "total_time_ms": round((time.perf_counter() - started) * 1000, 1)
+    }
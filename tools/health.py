@@ -0,0 +1,242 @@
+import os
+import sys
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+from tools.result_cache import get_result_cache, make_key
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+STATE_CODES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+# Providers behind a breaker. "web" is every site on the internet: a few dead pages say
+# nothing about the rest, so page fetches are never cut off.
+BREAKER_PROVIDERS = ("serpapi", "tavily", "elevenlabs", "replicate")
+
+# Upper bound on the outcomes a health window keeps, whatever the request rate
+WINDOW_MAX_SAMPLES = 2000
+
+class CircuitOpen(Exception):
+    # Raised instead of sending a request to a provider whose breaker is open
+    def __init__(self, provider: str, retry_after: float):
+        super().__init__(f"{provider} is failing and its circuit breaker is open; retry in {retry_after:.1f}s")
+        self.provider = provider
+        self.retry_after = retry_after
+
+class HealthWindow:
+    # Outcome and latency of every request finished in the last `seconds`
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self._samples = deque(maxlen=WINDOW_MAX_SAMPLES)  # (monotonic time, ok, latency seconds)
+    
+    def add(self, ok: bool, latency: float, now: float):
+        self._samples.append((now, ok, latency))
+    
+    def clear(self):
+        self._samples.clear()
+    
+    def summary(self, now: float) -> Dict:
+        while self._samples and now - self._samples[0][0] > self.seconds:
+            self._samples.popleft()
+        requests = len(self._samples)
+        errors = sum(1 for _, ok, _ in self._samples if not ok)
+        latencies = sorted(latency for _, _, latency in self._samples)
+        return {
+            "requests": requests,
+            "errors": errors,
+            "error_rate": round(errors / requests, 4) if requests else 0.0,
+            "p50_ms": round(latencies[int(0.50 * (requests - 1))] * 1000, 1) if requests else 0.0,
+            "p95_ms": round(latencies[int(0.95 * (requests - 1))] * 1000, 1) if requests else 0.0
+        }
+
+class Attempt:
+    # Verdict on one request; left at None when the call was cancelled or ran out of time,
+    # which says nothing about the provider
+    __slots__ = ("ok", "seconds")
+    
+    def __init__(self):
+        self.ok = None
+        self.seconds = 0.0
+    
+    def record(self, ok: bool, seconds: float):
+        self.ok = ok
+        self.seconds = seconds
+
+class CircuitBreaker:
+    # Closed: requests flow and their outcomes fill the health window. Too high an error rate
+    # opens the breaker: requests fail fast for open_seconds. Then it is half-open: probe requests
+    # go through one at a time, and after `probes` successes it closes again. A failed probe
+    # reopens it for twice as long (up to max_open_seconds).
+    def __init__(self, provider: str, window: float = 60.0, min_requests: int = 10,
+                 error_rate: float = 0.5, open_seconds: float = 30.0, max_open_seconds: float = 300.0,
+                 probes: int = 2, slow_call: Optional[float] = None):
+        self.provider = provider
+        self.window = HealthWindow(window)
+        self.min_requests = min_requests
+        self.error_rate = error_rate
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.probes = probes
+        self.slow_call = slow_call  # seconds; slower requests count as failures
+        
+        self.state = CLOSED
+        self.transitions = deque(maxlen=20)
+        self._open_for = open_seconds
+        self._open_until = 0.0
+        self._probe_in_flight = False
+        self._probe_successes = 0
+        self._lock = threading.Lock()
+        self._stats = {"rejected": 0, "opened": 0, "served_stale": 0, "rerouted": 0, "failed_fast": 0, "transitions": 0}
+    
+    def allow(self) -> bool:
+        # Admit a request or raise CircuitOpen; True means the request is a half-open probe
+        with self._lock:
+            now = time.monotonic()
+            if self.state == OPEN:
+                if now < self._open_until:
+                    self._stats["rejected"] += 1
+                    raise CircuitOpen(self.provider, self._open_until - now)
+                self._transition(HALF_OPEN, f"{self._open_for:g}s cool-down elapsed")
+            if self.state == HALF_OPEN:
+                if self._probe_in_flight:
+                    self._stats["rejected"] += 1
+                    raise CircuitOpen(self.provider, 1.0)
+                self._probe_in_flight = True
+                return True
+            return False
+    
+    @contextmanager
+    def attempt(self):
+        # Guard one request: the block records its verdict on the yielded Attempt
+        probe = self.allow()
+        outcome = Attempt()
+        try:
+            yield outcome
+        finally:
+            self._settle(outcome, probe)
+    
+    def _settle(self, outcome: Attempt, probe: bool):
+        with self._lock:
+            if probe:
+                self._probe_in_flight = False
+            if outcome.ok is None:
+                return
+            
+            ok = outcome.ok and (self.slow_call is None or outcome.seconds < self.slow_call)
+            now = time.monotonic()
+            self.window.add(ok, outcome.seconds, now)
+            
+            if probe and self.state == HALF_OPEN:
+                if not ok:
+                    self._open_for = min(self.max_open_seconds, self._open_for * 2)
+                    self._open(now, "probe failed")
+                    return
+                self._probe_successes += 1
+                if self._probe_successes >= self.probes:
+                    self._open_for = self.open_seconds
+                    self.window.clear()
+                    self._transition(CLOSED, f"{self._probe_successes} probes succeeded")
+            elif self.state == CLOSED and not ok:
+                health = self.window.summary(now)
+                if health["requests"] >= self.min_requests and health["error_rate"] >= self.error_rate:
+                    self._open(now, f"error rate {health['error_rate']:.0%} over {health['requests']} requests")
+    
+    def _open(self, now: float, reason: str):
+        # Caller holds the lock
+        self._open_until = now + self._open_for
+        self._probe_successes = 0
+        self._stats["opened"] += 1
+        self._transition(OPEN, reason)
+    
+    def _transition(self, state: str, reason: str):
+        # Caller holds the lock. Kept for metrics/get and logged for whoever watches stderr.
+        self.transitions.append({"from": self.state, "to": state, "reason": reason, "at": round(time.time(), 3)})
+        self._stats["transitions"] += 1
+        print(f"circuit: {self.provider} {self.state} -> {state} ({reason})", file=sys.stderr, flush=True)
+        self.state = state
+    
+    def count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            now = time.monotonic()
+            stats = self.window.summary(now)
+            stats.update(self._stats)
+            stats.update({
+                "state": self.state,
+                "state_code": STATE_CODES[self.state],
+                "retry_in_seconds": round(max(0.0, self._open_until - now), 1) if self.state == OPEN else 0.0,
+                "recent_transitions": list(self.transitions)
+            })
+            return stats
+
+def _setting(provider: str, name: str, default: float) -> float:
+    # MCP_<PROVIDER>_BREAKER_<NAME> wins over MCP_BREAKER_<NAME>
+    for key in (f"MCP_{provider.upper()}_BREAKER_{name}", f"MCP_BREAKER_{name}"):
+        value = os.getenv(key)
+        if value:
+            return float(value)
+    return default
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+def get_breaker(provider: str) -> Optional[CircuitBreaker]:
+    # Process-wide breaker for a guarded provider; None for the others or with MCP_BREAKER_ENABLED=0
+    if provider not in BREAKER_PROVIDERS or os.getenv("MCP_BREAKER_ENABLED", "1") == "0":
+        return None
+    with _breakers_lock:
+        breaker = _breakers.get(provider)
+        if breaker is None:
+            slow_call_ms = _setting(provider, "SLOW_CALL_MS", 0)
+            breaker = CircuitBreaker(
+                provider,
+                window=_setting(provider, "WINDOW", 60.0),
+                min_requests=int(_setting(provider, "MIN_REQUESTS", 10)),
+                error_rate=_setting(provider, "ERROR_RATE", 0.5),
+                open_seconds=_setting(provider, "OPEN_SECONDS", 30.0),
+                max_open_seconds=_setting(provider, "MAX_OPEN_SECONDS", 300.0),
+                probes=int(_setting(provider, "PROBES", 2)),
+                slow_call=slow_call_ms / 1000.0 if slow_call_ms else None
+            )
+            _breakers[provider] = breaker
+        return breaker
+
+def degraded_result(error: CircuitOpen, tool: str, params: Dict, cache: Optional[str] = None,
+                    reroute: Optional[Callable[[], Dict]] = None) -> Dict:
+    # What a cached tool answers while its provider's breaker is open: the last cached result
+    # even if expired (marked stale), else the other provider's answer, else a fast failure
+    # that says when to retry
+    breaker = get_breaker(error.provider)
+    if cache != "bypass":
+        stale = get_result_cache().get_stale(make_key(tool, params))
+        if stale is not None:
+            result, age = stale
+            if breaker is not None:
+                breaker.count("served_stale")
+            result.update({"stale": True, "age_seconds": round(age), "circuit_open": error.provider})
+            return result
+    
+    if reroute is not None:
+        try:
+            result = reroute()
+        except Exception:
+            result = None
+        if result and result.get("success"):
+            if breaker is not None:
+                breaker.count("rerouted")
+            result["circuit_open"] = error.provider
+            return result
+    
+    if breaker is not None:
+        breaker.count("failed_fast")
+    return {
+        "success": False,
+        "error": str(error),
+        "circuit_open": error.provider,
+        "retry_after": round(error.retry_after, 1)
+    }
@@ -0,0 +1,211 @@
+import os
+import time
+import socket
+import threading
+import requests
+from contextlib import contextmanager
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+from urllib3.util import connection
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from typing import Dict, List, Optional, Tuple
+
+from tools.call_context import bounded_timeout, check_call, on_cancel
+from tools.metrics import get_metrics
+from tools.rate_limit import RETRYABLE_STATUS, ProviderLimiter, get_limiter, parse_retry_after
+
+# Per-provider defaults: (pool size, connect timeout, read timeout)
+# Speech synthesis holds the connection open much longer than a search does
+PROVIDER_DEFAULTS = {
+    "serpapi": (10, 5.0, 30.0),
+    "tavily": (10, 5.0, 30.0),
+    "elevenlabs": (4, 5.0, 120.0),
+    "replicate_delivery": (8, 5.0, 60.0),
+    "web": (16, 5.0, 20.0),
+}
+
+def _env_number(provider: str, name: str, default, cast):
+    # MCP_<PROVIDER>_<NAME> wins over MCP_HTTP_<NAME>, which wins over the built-in default
+    for key in (f"MCP_{provider.upper()}_{name}", f"MCP_HTTP_{name}"):
+        value = os.getenv(key)
+        if value:
+            return cast(value)
+    return default
+
+def _should_retry(response: Optional[requests.Response], error: Optional[Exception]) -> Tuple[bool, Optional[float]]:
+    # Retry throttling and transient server errors, and connections that never got through.
+    # A read timeout may mean the provider already did (and billed) the work, so it is not retried.
+    if error is not None:
+        return isinstance(error, requests.ConnectionError), None
+    if response.status_code in RETRYABLE_STATUS:
+        return True, parse_retry_after(response.headers.get("Retry-After"))
+    return False, None
+
+# Seconds the current thread spent opening connections (TCP + TLS) during its latest request
+_timing = threading.local()
+
+# Addresses the current thread must connect to, by host name (see pinned_addresses)
+_pins = threading.local()
+
+@contextmanager
+def pinned_addresses(host: str, addresses: List[str]):
+    # Inside the block, new connections this thread opens to host go to one of addresses instead of
+    # resolving the name again, so a name checked once cannot be re-pointed before the connect
+    # (DNS rebinding). TLS still verifies the certificate against host. No addresses: no pin.
+    if not addresses:
+        yield
+        return
+    pins = getattr(_pins, "hosts", None)
+    if pins is None:
+        pins = _pins.hosts = {}
+    host = host.strip("[]").lower()
+    previous = pins.get(host)
+    pins[host] = list(addresses)
+    try:
+        yield
+    finally:
+        if previous is None:
+            pins.pop(host, None)
+        else:
+            pins[host] = previous
+
+class _InstrumentedConnection:
+    # Records how long connect + TLS handshake took, and lets a cancelled call abort a request
+    # that is blocked waiting for the response by shutting its socket down
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            _timing.connect = getattr(_timing, "connect", 0.0) + time.perf_counter() - started
+    
+    def _new_conn(self):
+        addresses = getattr(_pins, "hosts", {}).get(self.host.strip("[]").lower())
+        if not addresses:
+            return super()._new_conn()
+        error = None
+        for address in addresses:
+            try:
+                return connection.create_connection((address, self.port), self.timeout,
+                                                    source_address=self.source_address,
+                                                    socket_options=self.socket_options)
+            except socket.timeout as e:
+                raise ConnectTimeoutError(
+                    self, f"Connection to {self.host} timed out. (connect timeout={self.timeout})"
+                ) from e
+            except OSError as e:
+                error = e
+        raise NewConnectionError(self, f"Failed to establish a new connection: {error}") from error
+    
+    def getresponse(self, *args, **kwargs):
+        unregister = on_cancel(self._abort)
+        try:
+            return super().getresponse(*args, **kwargs)
+        finally:
+            unregister()
+    
+    def _abort(self):
+        sock = self.sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+class _TimedHTTPConnection(_InstrumentedConnection, HTTPConnection):
+    pass
+
+class _TimedHTTPSConnection(_InstrumentedConnection, HTTPSConnection):
+    pass
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+class TimedHTTPAdapter(HTTPAdapter):
+    # HTTPAdapter whose connections record connect + TLS handshake time and can be aborted
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TimedHTTPConnectionPool,
+            "https": _TimedHTTPSConnectionPool
+        }
+
+class PooledSession(requests.Session):
+    # requests.Session with a keep-alive connection pool, default connect/read timeouts,
+    # and an optional per-provider rate limiter that also retries transient failures
+    def __init__(self, pool_size: int = 10, timeout: Tuple[float, float] = (5.0, 30.0),
+                 limiter: Optional[ProviderLimiter] = None, provider: str = "http"):
+        super().__init__()
+        self.timeout = timeout
+        self.limiter = limiter
+        self.provider = provider
+        
+        adapter = TimedHTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+    
+    def request(self, method, url, **kwargs):
+        # Never let a call wait forever on a hung upstream. Each attempt also gets no more
+        # than what is left of the current call's deadline.
+        timeout = kwargs.pop("timeout", None) or self.timeout
+        send = lambda: self._timed_request(method, url, dict(kwargs, timeout=bounded_timeout(timeout)))
+        if self.limiter is None:
+            return send()
+        return self.limiter.execute(send, _should_retry, on_discard=lambda response: response.close())
+    
+    def _timed_request(self, method, url, kwargs) -> requests.Response:
+        # One attempt, recorded in the metrics registry with its connect/TTFB/total split
+        _timing.connect = 0.0
+        started = time.perf_counter()
+        try:
+            response = super().request(method, url, **kwargs)
+        except Exception as e:
+            get_metrics().record_upstream(self.provider, type(e).__name__, time.perf_counter() - started, _timing.connect)
+            # A socket shut down by cancellation, or a timeout cut short by the deadline,
+            # surfaces as CallCancelled/DeadlineExceeded rather than a network error
+            check_call()
+            raise
+        
+        # Streamed bodies are counted by their reader via record_bytes
+        received = 0 if kwargs.get("stream") else len(response.content)
+        get_metrics().record_upstream(
+            self.provider,
+            response.status_code,
+            time.perf_counter() - started,
+            connect=_timing.connect,
+            ttfb=response.elapsed.total_seconds(),
+            received_bytes=received
+        )
+        return response
+
+_sessions: Dict[str, PooledSession] = {}
+_sessions_lock = threading.Lock()
+
+def get_session(provider: str) -> PooledSession:
+    # Return the process-wide session for a provider, creating it on first use
+    with _sessions_lock:
+        session = _sessions.get(provider)
+        if session is None:
+            pool_size, connect_timeout, read_timeout = PROVIDER_DEFAULTS.get(provider, (10, 5.0, 30.0))
+            session = PooledSession(
+                pool_size=_env_number(provider, "POOL_SIZE", pool_size, int),
+                timeout=(
+                    _env_number(provider, "CONNECT_TIMEOUT", connect_timeout, float),
+                    _env_number(provider, "READ_TIMEOUT", read_timeout, float)
+                ),
+                limiter=get_limiter(provider),
+                provider=provider
+            )
+            _sessions[provider] = session
+        return session
+
+def close_sessions():
+    # Close every pooled connection, e.g. on server shutdown
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
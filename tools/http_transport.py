@@ -0,0 +1,367 @@
+import os
+import sys
+import json
+import time
+import uuid
+import signal
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+
+from tools.response_encoding import dumps
+
+# MCP streamable HTTP: one endpoint; clients POST JSON-RPC messages and get the responses back as
+# JSON or as a server-sent event stream that also carries the calls' progress notifications
+MCP_PATH = "/mcp"
+SESSION_HEADER = "Mcp-Session-Id"
+
+LOCAL_HOSTS = {"localhost", "127.0.0.1", "::1"}
+
+# JSON-RPC error code answering a call that was cancelled while its POST was still open
+# (the MCP SDKs' and LSP's RequestCancelled). Over stdio a cancelled call gets no response;
+# over HTTP its POST still has to be completed.
+CANCELLED_ERROR_CODE = -32800
+
+class ResponseStream:
+    # Messages produced for one POST, handed from worker threads to the handler thread that writes
+    # them to the client. Workers never wait for a slow client: once max_notifications progress
+    # notifications are queued, newer ones are dropped (a later one supersedes them anyway).
+    # Responses are always queued; there is at most one per request in the POST.
+    def __init__(self, request_ids: List[Any], max_notifications: int = 64):
+        self.pending = set(request_ids)
+        self.max_notifications = max_notifications
+        self.dropped = 0
+        self._items = deque()  # (request id or None for a notification, line)
+        self._queued_notifications = 0
+        self._closed = False
+        self._condition = threading.Condition()
+    
+    def responder(self, request_id: Any):
+        return lambda line: self._put(request_id, line)
+    
+    def notify(self, message: Dict):
+        with self._condition:
+            if self._closed:
+                return
+            if self._queued_notifications >= self.max_notifications:
+                self.dropped += 1
+                return
+            self._queued_notifications += 1
+        self._put(None, dumps(message))
+    
+    def _put(self, request_id: Any, line: str):
+        with self._condition:
+            if not self._closed:
+                self._items.append((request_id, line))
+                self._condition.notify()
+    
+    def next(self, timeout: float) -> Optional[str]:
+        # The next line to send, or None if nothing arrived within timeout
+        with self._condition:
+            if not self._items:
+                self._condition.wait(timeout)
+            if not self._items:
+                return None
+            request_id, line = self._items.popleft()
+            if request_id is None:
+                self._queued_notifications -= 1
+            else:
+                self.pending.discard(request_id)
+            return line
+    
+    def abandon(self, request_id: Any):
+        # The call was cancelled and its response suppressed: answer it with an error instead,
+        # so the POST carrying it can complete
+        self._put(request_id, dumps({
+            "jsonrpc": "2.0",
+            "id": request_id,
+            "error": {"code": CANCELLED_ERROR_CODE, "message": "Request cancelled"}
+        }))
+    
+    def done(self) -> bool:
+        with self._condition:
+            return not self.pending and not self._items
+    
+    def close(self) -> List[Any]:
+        # The client went away; returns the ids still waiting for a response
+        with self._condition:
+            self._closed = True
+            self._items.clear()
+            return list(self.pending)
+
+class Session:
+    def __init__(self, session_id: str):
+        self.id = session_id
+        self.last_seen = time.monotonic()
+        self.inflight = 0
+
+class StreamableHTTPTransport:
+    # Serves one RequestDispatcher (and so one set of caches, connection pools and workers)
+    # to any number of concurrent client sessions
+    def __init__(self, dispatcher, host: str = "127.0.0.1", port: int = 8808,
+                 max_session_inflight: int = 32, session_ttl: float = 3600.0,
+                 max_notifications: int = 64, keepalive: float = 15.0,
+                 allowed_origins: Optional[List[str]] = None):
+        self.dispatcher = dispatcher
+        self.max_session_inflight = max_session_inflight
+        self.session_ttl = session_ttl
+        self.max_notifications = max_notifications
+        self.keepalive = keepalive
+        self.allowed_origins = set(allowed_origins or [])
+        self.sessions: Dict[str, Session] = {}
+        self.streams: Dict[Any, ResponseStream] = {}  # (session id, request id) -> stream of its POST
+        self._sessions_lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+    
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}{MCP_PATH}"
+    
+    def serve_forever(self):
+        try:
+            self.httpd.serve_forever()
+        finally:
+            self.httpd.server_close()
+            self.dispatcher.drain()
+    
+    def start(self) -> "StreamableHTTPTransport":
+        # Serve from a background thread, e.g. for loopback tests
+        threading.Thread(target=self.httpd.serve_forever, name="mcp-http", daemon=True).start()
+        return self
+    
+    def shutdown(self):
+        self.httpd.shutdown()
+    
+    def origin_allowed(self, origin: Optional[str]) -> bool:
+        # Browsers send Origin; refusing foreign ones stops DNS-rebinding attacks on a local server
+        if not origin:
+            return True
+        return origin in self.allowed_origins or urlsplit(origin).hostname in LOCAL_HOSTS
+    
+    def create_session(self) -> Session:
+        now = time.monotonic()
+        with self._sessions_lock:
+            # Forget sessions that have been idle too long
+            for session_id, session in list(self.sessions.items()):
+                if session.inflight == 0 and now - session.last_seen > self.session_ttl:
+                    del self.sessions[session_id]
+            session = Session(uuid.uuid4().hex)
+            self.sessions[session.id] = session
+        return session
+    
+    def get_session(self, session_id: Optional[str]) -> Optional[Session]:
+        with self._sessions_lock:
+            session = self.sessions.get(session_id)
+            if session is not None:
+                session.last_seen = time.monotonic()
+            return session
+    
+    def end_session(self, session_id: str) -> bool:
+        with self._sessions_lock:
+            session = self.sessions.pop(session_id, None)
+        if session is None:
+            return False
+        with self._sessions_lock:
+            request_ids = [request_id for key_session, request_id in self.streams if key_session == session_id]
+        for request_id in request_ids:
+            self.cancel(session_id, request_id)
+        self.dispatcher.cancel_session(session_id)
+        return True
+    
+    def cancel(self, session_id: str, request_id: Any):
+        # Cancel a call and complete its POST if the dispatcher suppressed the response
+        if self.dispatcher.cancel(request_id, session_id):
+            with self._sessions_lock:
+                stream = self.streams.get((session_id, request_id))
+            if stream is not None:
+                stream.abandon(request_id)
+    
+    def track(self, session_id: str, request_ids: List[Any], stream: ResponseStream):
+        # Remember which POST is waiting for each request, so a cancellation can complete it
+        with self._sessions_lock:
+            for request_id in request_ids:
+                self.streams[(session_id, request_id)] = stream
+    
+    def untrack(self, session_id: str, request_ids: List[Any], stream: ResponseStream):
+        with self._sessions_lock:
+            for request_id in request_ids:
+                if self.streams.get((session_id, request_id)) is stream:
+                    del self.streams[(session_id, request_id)]
+    
+    def admit(self, session: Session, calls: int) -> bool:
+        # Per-session cap on calls in flight, so one client cannot take every worker
+        with self._sessions_lock:
+            if calls and session.inflight + calls > self.max_session_inflight:
+                return False
+            session.inflight += calls
+            return True
+    
+    def release(self, session: Session, calls: int):
+        with self._sessions_lock:
+            session.inflight -= calls
+            session.last_seen = time.monotonic()
+    
+    def _handler_class(self):
+        transport = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            
+            def log_message(self, *args):
+                pass
+            
+            def _send_body(self, status: int, body: bytes = b"", headers: Optional[Dict] = None,
+                           content_type: str = "application/json"):
+                self.send_response(status)
+                if body:
+                    self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def _send_error(self, status: int, code: int, message: str, headers: Optional[Dict] = None):
+                body = dumps({"jsonrpc": "2.0", "id": None, "error": {"code": code, "message": message}})
+                self._send_body(status, body.encode("utf-8"), headers)
+            
+            def _check_request(self) -> bool:
+                if self.path.split("?")[0] != MCP_PATH:
+                    self._send_body(404)
+                    return False
+                if not transport.origin_allowed(self.headers.get("Origin")):
+                    self._send_error(403, -32000, "Origin not allowed")
+                    return False
+                return True
+            
+            def do_GET(self):
+                # No server-initiated stream; every message belongs to a POST
+                if self._check_request():
+                    self._send_body(405, headers={"Allow": "POST, DELETE"})
+            
+            def do_DELETE(self):
+                if not self._check_request():
+                    return
+                if transport.end_session(self.headers.get(SESSION_HEADER)):
+                    self._send_body(200)
+                else:
+                    self._send_error(404, -32001, "Session not found")
+            
+            def do_POST(self):
+                if not self._check_request():
+                    return
+                
+                try:
+                    length = int(self.headers.get("Content-Length") or 0)
+                    payload = json.loads(self.rfile.read(length))
+                except Exception as e:
+                    return self._send_error(400, -32700, f"Parse error: {e}")
+                
+                batch = isinstance(payload, list)
+                messages = payload if batch else [payload]
+                if not messages or not all(isinstance(m, dict) for m in messages):
+                    return self._send_error(400, -32600, "Invalid Request")
+                
+                # initialize starts a session; everything else must name one
+                headers = {}
+                if any(m.get("method") == "initialize" for m in messages):
+                    session = transport.create_session()
+                    headers[SESSION_HEADER] = session.id
+                else:
+                    session_id = self.headers.get(SESSION_HEADER)
+                    if not session_id:
+                        return self._send_error(400, -32000, f"Missing {SESSION_HEADER} header")
+                    session = transport.get_session(session_id)
+                    if session is None:
+                        return self._send_error(404, -32001, "Session not found")
+                
+                requests = [m for m in messages if "id" in m and "method" in m]
+                if not requests:
+                    # Notifications (e.g. notifications/cancelled) and client responses
+                    for message in messages:
+                        if message.get("method") == "notifications/cancelled":
+                            transport.cancel(session.id, (message.get("params") or {}).get("requestId"))
+                        else:
+                            transport.dispatcher.dispatch(message, session=session.id)
+                    return self._send_body(202, headers=headers)
+                
+                calls = sum(1 for m in requests if m.get("method") == "tools/call")
+                if not transport.admit(session, calls):
+                    return self._send_error(429, -32000, "Too many calls in flight for this session",
+                                            {"Retry-After": "1", **headers})
+                
+                # Stream when the client accepts it and there is something worth streaming
+                use_sse = calls > 0 and "text/event-stream" in (self.headers.get("Accept") or "")
+                request_ids = [m["id"] for m in requests]
+                stream = ResponseStream(request_ids, transport.max_notifications if use_sse else 0)
+                transport.track(session.id, request_ids, stream)
+                try:
+                    for message in messages:
+                        if message.get("method") == "notifications/cancelled":
+                            transport.cancel(session.id, (message.get("params") or {}).get("requestId"))
+                            continue
+                        respond = stream.responder(message["id"]) if "id" in message and "method" in message else None
+                        transport.dispatcher.dispatch(message, respond=respond, notify=stream.notify, session=session.id)
+                    
+                    if use_sse:
+                        self._stream(stream, headers, session)
+                    else:
+                        self._respond_json(stream, headers, batch)
+                finally:
+                    transport.untrack(session.id, request_ids, stream)
+                    transport.release(session, calls)
+            
+            def _respond_json(self, stream: ResponseStream, headers: Dict, batch: bool):
+                lines = []
+                while not stream.done():
+                    line = stream.next(transport.keepalive)
+                    if line is not None:
+                        lines.append(line)
+                body = ("[" + ",".join(lines) + "]") if batch else lines[0]
+                self._send_body(200, body.encode("utf-8"), headers)
+            
+            def _stream(self, stream: ResponseStream, headers: Dict, session: Session):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Connection", "close")
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.close_connection = True
+                
+                try:
+                    while not stream.done():
+                        line = stream.next(transport.keepalive)
+                        # A comment line keeps proxies from timing out and reveals dead clients
+                        self.wfile.write(b": keepalive\n\n" if line is None else f"event: message\ndata: {line}\n\n".encode("utf-8"))
+                        self.wfile.flush()
+                except OSError:
+                    # The client disconnected: abort whatever it was still waiting for
+                    for request_id in stream.close():
+                        transport.cancel(session.id, request_id)
+        
+        return Handler
+
+def serve_http(dispatcher, host: Optional[str] = None, port: Optional[int] = None):
+    # Run the streamable HTTP transport until interrupted
+    transport = StreamableHTTPTransport(
+        dispatcher,
+        host=host or os.getenv("MCP_HTTP_HOST", "127.0.0.1"),
+        port=int(port if port is not None else os.getenv("MCP_HTTP_PORT", "8808")),
+        max_session_inflight=int(os.getenv("MCP_HTTP_SESSION_MAX_INFLIGHT", "32")),
+        session_ttl=float(os.getenv("MCP_HTTP_SESSION_TTL", "3600")),
+        allowed_origins=[o.strip() for o in os.getenv("MCP_HTTP_ALLOWED_ORIGINS", "").split(",") if o.strip()]
+    )
+    print(f"MCP streamable HTTP transport listening on {transport.url}", file=sys.stderr, flush=True)
+    
+    # SIGTERM stops accepting requests; serve_forever then lets in-flight calls finish
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=transport.shutdown, daemon=True).start())
+    try:
+        transport.serve_forever()
+    except KeyboardInterrupt:
+        pass
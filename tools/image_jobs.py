@@ -0,0 +1,257 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from typing import Dict, List, Optional
+
+from tools.file_lock import file_lock
+from tools.generate_image import IMAGE_MODEL, TERMINAL_STATUSES, call_replicate, download_image, get_client, get_image_store, image_input, image_key
+from tools.result_cache import default_cache_dir
+
+# Adaptive polling: start fast (flux-schnell often finishes in a second or two), back off for slow jobs
+MIN_POLL_INTERVAL = 0.5
+MAX_POLL_INTERVAL = 5.0
+POLL_BACKOFF = 1.5
+
+class ImageJobStore:
+    # Replicate predictions recorded in SQLite so results survive a restart and can be re-read for free
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.path.join(default_cache_dir(), "image_jobs.sqlite3")
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS image_jobs ("
+            "job_id TEXT PRIMARY KEY, model TEXT, input TEXT, status TEXT, output TEXT, error TEXT, "
+            "progress REAL, created_at REAL, updated_at REAL, completed_at REAL, "
+            "poll_interval REAL, next_poll_at REAL)"
+        )
+        self._db.commit()
+    
+    def insert(self, job_id: str, model: str, input: Dict, status: str):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO image_jobs (job_id, model, input, status, created_at, updated_at, "
+                "poll_interval, next_poll_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, model, json.dumps(input), status, now, now, MIN_POLL_INTERVAL, now + MIN_POLL_INTERVAL)
+            )
+            self._db.commit()
+    
+    def update(self, job_id: str, **fields):
+        fields["updated_at"] = time.time()
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._db.execute(f"UPDATE image_jobs SET {columns} WHERE job_id = ?", (*fields.values(), job_id))
+            self._db.commit()
+    
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._db.execute("SELECT * FROM image_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+    
+    def active(self) -> List[Dict]:
+        placeholders = ", ".join("?" for _ in TERMINAL_STATUSES)
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT * FROM image_jobs WHERE status NOT IN ({placeholders}) ORDER BY next_poll_at",
+                TERMINAL_STATUSES
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+class ImageJobManager:
+    # Submits predictions without waiting and tracks them from a background poller thread
+    def __init__(self, store: Optional[ImageJobStore] = None):
+        self.store = store or ImageJobStore()
+        self._wake = threading.Event()
+        self._poller = None
+        self._poller_lock = threading.Lock()
+    
+    def submit(self, prompt: str, input: Optional[Dict] = None) -> Dict:
+        input = input or image_input(prompt)
+        client = get_client()
+        prediction = call_replicate(lambda: client.models.predictions.create(model=IMAGE_MODEL, input=input))
+        
+        self.store.insert(prediction.id, IMAGE_MODEL, input, prediction.status)
+        self._apply(prediction)
+        self._ensure_poller()
+        return {
+            "success": True,
+            "job_id": prediction.id,
+            "status": prediction.status,
+            "model": IMAGE_MODEL
+        }
+    
+    def status(self, job_id: str) -> Dict:
+        job = self.store.get(job_id)
+        if job is None:
+            return {"success": False, "error": f"Unknown job: {job_id}"}
+        
+        # Jobs left over from a previous run are picked up again on first access
+        if job["status"] not in TERMINAL_STATUSES:
+            self._ensure_poller()
+        
+        return {
+            "success": True,
+            "job_id": job_id,
+            "status": job["status"],
+            "progress": job["progress"],
+            "done": job["status"] in TERMINAL_STATUSES,
+            "created_at": job["created_at"],
+            "updated_at": job["updated_at"],
+            "completed_at": job["completed_at"],
+            "error": job["error"]
+        }
+    
+    def result(self, job_id: str) -> Dict:
+        job = self.store.get(job_id)
+        if job is None:
+            return {"success": False, "error": f"Unknown job: {job_id}"}
+        
+        if job["status"] not in TERMINAL_STATUSES:
+            self._ensure_poller()
+            return {
+                "success": False,
+                "job_id": job_id,
+                "status": job["status"],
+                "progress": job["progress"],
+                "error": "Job has not finished yet"
+            }
+        
+        if job["status"] != "succeeded":
+            return {"success": False, "job_id": job_id, "status": job["status"], "error": job["error"]}
+        
+        output = json.loads(job["output"]) if job["output"] else []
+        if isinstance(output, str):
+            output = [output]
+        urls = [str(url) for url in output]
+        
+        result = {
+            "success": True,
+            "job_id": job_id,
+            "status": job["status"],
+            "image_urls": urls,
+            "image_url": urls[0] if urls else None
+        }
+        if urls:
+            # Keep a local copy, since Replicate delivery URLs expire
+            input = json.loads(job["input"])
+            key = image_key(job["model"], input, job_id)
+            local_path = get_image_store().get(key)
+            try:
+                result["local_path"] = local_path or download_image(urls[0], key)
+            except Exception as e:
+                result["download_error"] = str(e)
+        return result
+    
+    def poll_once(self) -> Optional[float]:
+        # Refresh every due job; return seconds until the next one is due (or None when idle)
+        jobs = self.store.active()
+        if not jobs:
+            return None
+        
+        client = get_client()
+        now = time.time()
+        for job in jobs:
+            if job["next_poll_at"] > now:
+                continue
+            try:
+                prediction = call_replicate(lambda: client.predictions.get(job["job_id"]))
+            except Exception as e:
+                self.store.update(job["job_id"], error=str(e), **self._next_poll(job))
+                continue
+            self._apply(prediction, job)
+        
+        upcoming = [job["next_poll_at"] for job in self.store.active()]
+        return max(0.0, min(upcoming) - time.time()) if upcoming else None
+    
+    def _apply(self, prediction, job: Optional[Dict] = None):
+        fields = {"status": prediction.status}
+        progress = getattr(prediction, "progress", None)
+        if progress is not None and getattr(progress, "percentage", None) is not None:
+            fields["progress"] = progress.percentage
+        
+        if prediction.status in TERMINAL_STATUSES:
+            fields["completed_at"] = time.time()
+            fields["output"] = json.dumps(prediction.output, default=str)
+            if prediction.error:
+                fields["error"] = str(prediction.error)
+            if prediction.status == "succeeded":
+                fields["progress"] = 1.0
+        else:
+            fields.update(self._next_poll(job))
+        self.store.update(prediction.id, **fields)
+    
+    @staticmethod
+    def _next_poll(job: Optional[Dict]) -> Dict:
+        interval = MIN_POLL_INTERVAL
+        if job is not None:
+            interval = min(MAX_POLL_INTERVAL, (job["poll_interval"] or MIN_POLL_INTERVAL) * POLL_BACKOFF)
+        return {"poll_interval": interval, "next_poll_at": time.time() + interval}
+    
+    def _ensure_poller(self):
+        with self._poller_lock:
+            if self._poller is None or not self._poller.is_alive():
+                self._poller = threading.Thread(target=self._poll_loop, name="image-job-poller", daemon=True)
+                self._poller.start()
+            self._wake.set()
+    
+    def _poll_loop(self):
+        # Workers sharing the job store elect one poller through a file lock, so each job is
+        # polled once however many processes track it. A loser exits; the next status call
+        # tries again, which takes over from a worker that died.
+        if self.store.path == ":memory:":
+            return self._poll_jobs()
+        with file_lock(self.store.path + ".poller", blocking=False) as held:
+            if held:
+                return self._poll_jobs()
+        with self._poller_lock:
+            self._poller = None
+    
+    def _poll_jobs(self):
+        # Exit when nothing is left to track; the next submit starts a fresh poller
+        while True:
+            try:
+                delay = self.poll_once()
+            except Exception:
+                delay = MAX_POLL_INTERVAL
+            
+            with self._poller_lock:
+                if delay is None and not self._wake.is_set():
+                    self._poller = None
+                    return
+                self._wake.clear()
+            self._wake.wait(delay if delay is not None else 0)
+
+_manager = None
+_manager_lock = threading.Lock()
+
+def get_job_manager() -> ImageJobManager:
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = ImageJobManager()
+        return _manager
+
+def submit_image_job(prompt: str) -> Dict:
+    # Start an image prediction and return its job id immediately
+    try:
+        return get_job_manager().submit(prompt)
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+def get_image_job_status(job_id: str) -> Dict:
+    try:
+        return get_job_manager().status(job_id)
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+def get_image_job_result(job_id: str) -> Dict:
+    try:
+        return get_job_manager().result(job_id)
+    except Exception as e:
+        return {"success": False, "error": str(e)}
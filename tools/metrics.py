@@ -0,0 +1,230 @@
+import os
+import sys
+import time
+import threading
+from typing import Dict, List, Optional, Tuple
+
+# Latency bucket upper bounds in seconds (Prometheus style, +Inf implied)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+class Histogram:
+    # Cumulative-bucket latency histogram; percentiles are interpolated within a bucket
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+    
+    def observe(self, seconds: float):
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                index = i
+                break
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+    
+    def percentile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.max
+                return min(self.max, lower + (upper - lower) * (rank - seen) / n)
+            seen += n
+        return self.max
+    
+    def summary(self) -> Dict:
+        return {
+            "count": self.count,
+            "mean_ms": round(self.sum / self.count * 1000, 1) if self.count else 0.0,
+            "p50_ms": round(self.percentile(0.50) * 1000, 1),
+            "p95_ms": round(self.percentile(0.95) * 1000, 1),
+            "p99_ms": round(self.percentile(0.99) * 1000, 1),
+            "max_ms": round(self.max * 1000, 1)
+        }
+
+class MetricsRegistry:
+    # Per-tool and per-provider counters and latency histograms for the focused server
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tool_calls: Dict[Tuple[str, str], int] = {}
+        self._tool_latency: Dict[str, Histogram] = {}  # execution only, from leaving the queue
+        self._queue_wait: Dict[str, Histogram] = {}
+        self._upstream_calls: Dict[Tuple[str, str], int] = {}
+        self._upstream_latency: Dict[Tuple[str, str], Histogram] = {}  # (provider, phase)
+        self._upstream_bytes: Dict[str, int] = {}
+        self.started_at = time.time()
+    
+    def record_tool(self, tool: str, seconds: float, status: str = "ok"):
+        with self._lock:
+            key = (tool, str(status))
+            self._tool_calls[key] = self._tool_calls.get(key, 0) + 1
+            self._tool_latency.setdefault(tool, Histogram()).observe(seconds)
+    
+    def record_queue_wait(self, tool: str, seconds: float):
+        # Time a call spent in the scheduler's queue before a worker picked it up
+        with self._lock:
+            self._queue_wait.setdefault(tool, Histogram()).observe(seconds)
+    
+    def record_upstream(self, provider: str, status, total: float, connect: Optional[float] = None,
+                        ttfb: Optional[float] = None, received_bytes: int = 0):
+        # One upstream attempt; connect is 0 when a pooled connection was reused
+        with self._lock:
+            key = (provider, str(status))
+            self._upstream_calls[key] = self._upstream_calls.get(key, 0) + 1
+            for phase, seconds in (("connect", connect), ("ttfb", ttfb), ("total", total)):
+                if seconds is not None:
+                    self._upstream_latency.setdefault((provider, phase), Histogram()).observe(seconds)
+            self._upstream_bytes[provider] = self._upstream_bytes.get(provider, 0) + received_bytes
+    
+    def record_bytes(self, provider: str, received_bytes: int):
+        # For streamed bodies, whose size is only known once the caller has read them
+        with self._lock:
+            self._upstream_bytes[provider] = self._upstream_bytes.get(provider, 0) + received_bytes
+    
+    def snapshot(self, extra: Optional[Dict] = None) -> Dict:
+        with self._lock:
+            tools: Dict[str, Dict] = {}
+            for (tool, status), n in self._tool_calls.items():
+                entry = tools.setdefault(tool, {"calls": 0, "errors": {}})
+                entry["calls"] += n
+                if status != "ok":
+                    entry["errors"][status] = n
+            for tool, histogram in self._tool_latency.items():
+                tools[tool]["latency"] = histogram.summary()
+            for tool, histogram in self._queue_wait.items():
+                tools.setdefault(tool, {"calls": 0, "errors": {}})["queue_wait"] = histogram.summary()
+            
+            providers: Dict[str, Dict] = {}
+            for (provider, status), n in self._upstream_calls.items():
+                entry = providers.setdefault(provider, {"requests": 0, "statuses": {}, "bytes_received": 0})
+                entry["requests"] += n
+                entry["statuses"][status] = n
+            for (provider, phase), histogram in self._upstream_latency.items():
+                providers.setdefault(provider, {"requests": 0, "statuses": {}, "bytes_received": 0})[phase] = histogram.summary()
+            for provider, n in self._upstream_bytes.items():
+                providers.setdefault(provider, {"requests": 0, "statuses": {}, "bytes_received": 0})["bytes_received"] = n
+        
+        snapshot = {
+            "uptime_seconds": round(time.time() - self.started_at, 1),
+            "tools": tools,
+            "providers": providers
+        }
+        snapshot.update(component_stats())
+        snapshot.update(extra or {})
+        return snapshot
+    
+    def prometheus_text(self, extra: Optional[Dict] = None) -> str:
+        # Prometheus text exposition format, suitable for node_exporter's textfile collector
+        lines: List[str] = []
+        with self._lock:
+            lines.append("# TYPE mcp_tool_calls_total counter")
+            for (tool, status), n in sorted(self._tool_calls.items()):
+                lines.append(f'mcp_tool_calls_total{{tool="{tool}",status="{status}"}} {n}')
+            lines.append("# TYPE mcp_tool_latency_seconds histogram")
+            for tool, histogram in sorted(self._tool_latency.items()):
+                lines.extend(_histogram_lines("mcp_tool_latency_seconds", f'tool="{tool}"', histogram))
+            lines.append("# TYPE mcp_tool_queue_wait_seconds histogram")
+            for tool, histogram in sorted(self._queue_wait.items()):
+                lines.extend(_histogram_lines("mcp_tool_queue_wait_seconds", f'tool="{tool}"', histogram))
+            
+            lines.append("# TYPE mcp_upstream_requests_total counter")
+            for (provider, status), n in sorted(self._upstream_calls.items()):
+                lines.append(f'mcp_upstream_requests_total{{provider="{provider}",status="{status}"}} {n}')
+            lines.append("# TYPE mcp_upstream_latency_seconds histogram")
+            for (provider, phase), histogram in sorted(self._upstream_latency.items()):
+                lines.extend(_histogram_lines("mcp_upstream_latency_seconds", f'provider="{provider}",phase="{phase}"', histogram))
+            lines.append("# TYPE mcp_upstream_received_bytes_total counter")
+            for provider, n in sorted(self._upstream_bytes.items()):
+                lines.append(f'mcp_upstream_received_bytes_total{{provider="{provider}"}} {n}')
+        
+        # Cache, store, limiter and coalescing counters, flattened to gauges
+        stats = component_stats()
+        stats.update(extra or {})
+        lines.append("# TYPE mcp_component_stat gauge")
+        for component, values in sorted(stats.items()):
+            for name, value in sorted(_flatten(values)):
+                lines.append(f'mcp_component_stat{{component="{component}",stat="{name}"}} {value}')
+        
+        # Workers under the supervisor write a file each; the worker label keeps their series apart
+        worker = os.getenv("MCP_WORKER_INDEX")
+        if worker is not None:
+            lines = [line if line.startswith("#") else line.replace("{", f'{{worker="{worker}",', 1) for line in lines]
+        return "\n".join(lines) + "\n"
+
+def _histogram_lines(name: str, labels: str, histogram: Histogram) -> List[str]:
+    lines = []
+    cumulative = 0
+    for bound, n in zip(histogram.buckets + (float("inf"),), histogram.counts):
+        cumulative += n
+        le = "+Inf" if bound == float("inf") else repr(bound)
+        lines.append(f'{name}_bucket{{{labels},le="{le}"}} {cumulative}')
+    lines.append(f"{name}_sum{{{labels}}} {histogram.sum:.6f}")
+    lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+    return lines
+
+def _flatten(values: Dict, prefix: str = "") -> List[Tuple[str, float]]:
+    flat = []
+    for key, value in values.items():
+        if isinstance(value, dict):
+            flat.extend(_flatten(value, f"{prefix}{key}_"))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat.append((prefix + key, value))
+    return flat
+
+def component_stats() -> Dict:
+    # Stats of whichever caches, stores and limiters this process has created so far.
+    # Modules are looked up in sys.modules so reading metrics never loads a provider.
+    stats = {}
+    result_cache = sys.modules.get("tools.result_cache")
+    if result_cache is not None and result_cache._cache is not None:
+        stats["result_cache"] = result_cache._cache.stats()
+    
+    blob_store = sys.modules.get("tools.blob_store")
+    if blob_store is not None:
+        for name, store in list(blob_store._stores.items()):
+            stats[f"{name}_store"] = store.stats()
+    
+    webpage = sys.modules.get("tools.webpage")
+    if webpage is not None and webpage._page_cache is not None:
+        stats["page_cache"] = webpage._page_cache.stats()
+    
+    health = sys.modules.get("tools.health")
+    if health is not None:
+        for name, breaker in list(health._breakers.items()):
+            stats[f"{name}_breaker"] = breaker.stats()
+    
+    rate_limit = sys.modules.get("tools.rate_limit")
+    if rate_limit is not None:
+        for name, limiter in list(rate_limit._limiters.items()):
+            stats[f"{name}_limiter"] = limiter.stats()
+    return stats
+
+_registry = MetricsRegistry()
+
+def get_metrics() -> MetricsRegistry:
+    return _registry
+
+def start_textfile_writer(path: str, interval: float = 15.0, extra=None) -> threading.Thread:
+    # Periodically rewrite a Prometheus text file (atomically, so scrapers never see half a file)
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                with open(tmp_path, "w") as f:
+                    f.write(_registry.prometheus_text(extra() if extra else None))
+                os.replace(tmp_path, path)
+            except Exception as e:
+                print(f"metrics: failed to write {path}: {e}", file=sys.stderr)
+    
+    thread = threading.Thread(target=run, name="metrics-textfile", daemon=True)
+    thread.start()
+    return thread
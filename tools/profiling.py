@@ -0,0 +1,313 @@
+import os
+import re
+import sys
+import time
+import random
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+# cProfile, pstats and tracemalloc are imported when a call is first profiled, so a server that
+# never profiles does not load them
+
+PROFILE_MODES = ("cpu", "memory")
+
+# From Python 3.12 cProfile runs on sys.monitoring: one profiler for the whole interpreter, which
+# records every thread and refuses to start while another is enabled. A call's profile then covers
+# its pool threads without enter_thread, but also calls running at the same time, and only one
+# call at a time gets a cpu profile.
+PROCESS_WIDE_CPU = sys.version_info >= (3, 12)
+
+def default_profile_dir() -> str:
+    return os.getenv("MCP_PROFILE_DIR", os.path.join(tempfile.gettempdir(), "mcp_focused_profiles"))
+
+def resolve_directory(directory: str) -> str:
+    # Profiles may go to a subdirectory of MCP_PROFILE_DIR, never elsewhere: the setting comes
+    # from clients, and the server writes files there
+    base = os.path.realpath(default_profile_dir())
+    path = os.path.realpath(os.path.join(base, directory))
+    if os.path.commonpath([base, path]) != base:
+        raise ValueError(f"directory must be inside MCP_PROFILE_DIR ({base})")
+    return path
+
+def parse_modes(value: Any) -> List[str]:
+    # true, "cpu", "cpu,memory" or ["cpu", "memory"]; unknown modes are ignored
+    if value is True:
+        return list(PROFILE_MODES)
+    if isinstance(value, str):
+        value = value.split(",")
+    if not isinstance(value, (list, tuple)):
+        return []
+    return [mode for mode in PROFILE_MODES if mode in {str(v).strip().lower() for v in value}]
+
+_tracing_lock = threading.Lock()
+_tracing_users = 0
+_tracing_ours = False
+
+def _start_tracing(frames: int):
+    # tracemalloc is process-wide: the first memory-profiled call starts it, the last one stops it
+    global _tracing_users, _tracing_ours
+    import tracemalloc
+    with _tracing_lock:
+        if _tracing_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+            _tracing_ours = True
+        _tracing_users += 1
+
+def _stop_tracing():
+    global _tracing_users, _tracing_ours
+    import tracemalloc
+    with _tracing_lock:
+        _tracing_users -= 1
+        if _tracing_users == 0 and _tracing_ours:
+            tracemalloc.stop()
+            _tracing_ours = False
+
+@lru_cache(maxsize=65536)
+def _frame_label(filename: str, lineno: int) -> str:
+    # Last two path components keep folded stacks readable without losing the package
+    parts = filename.replace("\\", "/").rsplit("/", 2)
+    return f"{'/'.join(parts[-2:])}:{lineno}"
+
+_writer: Optional[ThreadPoolExecutor] = None
+_writer_lock = threading.Lock()
+
+def _background(fn, *args):
+    # Comparing snapshots takes seconds after a call that imported a lot, so allocation reports
+    # are written off the call's thread (and its deadline). Pending ones finish before exit.
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mcp-profile")
+    _writer.submit(fn, *args)
+
+class ProfileSession:
+    # Profiling of one tool call. cpu: a cProfile profile for the calling thread and every pool
+    # thread the call fans out to (see call_scope), merged into one pstats file; on Python 3.12+
+    # one profile of the whole process instead (see PROCESS_WIDE_CPU). memory: the
+    # tracemalloc difference between the start and the end of the call, as folded stacks weighted
+    # by bytes plus a text list of the top allocation sites. tracemalloc sees the whole process,
+    # so allocations of calls running at the same time are included.
+    def __init__(self, profiler: "Profiler", tool: str, request_id: Any, modes: List[str]):
+        self.profiler = profiler
+        self.tool = tool
+        self.request_id = request_id
+        self.modes = modes
+        self.started = time.perf_counter()
+        self.report: Optional[Dict] = None
+        self._profiles = []
+        self._notes: List[str] = []
+        self._before = None
+        self._main = None
+        self._lock = threading.Lock()
+        
+        if "memory" in modes:
+            import tracemalloc
+            _start_tracing(profiler.memory_frames)
+            self._before = tracemalloc.take_snapshot()
+        if "cpu" in modes:
+            self._main = self._enable()
+            if PROCESS_WIDE_CPU and self._main is not None:
+                self._notes.append("cpu profile covers every thread of the process, including other calls running at the same time")
+    
+    def enter_thread(self):
+        # Profile the current thread until the returned profile is disabled; None without cpu mode,
+        # when the call's profile already covers every thread, or when the interpreter refuses a
+        # second active profiler
+        if "cpu" not in self.modes or PROCESS_WIDE_CPU:
+            return None
+        return self._enable()
+    
+    def _enable(self):
+        import cProfile
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError as e:
+            with self._lock:
+                self._notes.append(f"cpu profile of a thread skipped: {e}" if self._profiles else f"cpu profile skipped: {e}")
+            return None
+        with self._lock:
+            self._profiles.append(profile)
+        return profile
+    
+    def finish(self) -> Dict:
+        # Stop profiling and write the files; safe to call more than once
+        if self.report is not None:
+            return self.report
+        if self._main is not None:
+            self._main.disable()
+        
+        seconds = time.perf_counter() - self.started
+        os.makedirs(self.profiler.directory, exist_ok=True)
+        stem = os.path.join(self.profiler.directory, "{}-{}-{}-{}".format(
+            time.strftime("%Y%m%dT%H%M%S"), re.sub(r"[^\w.-]", "_", str(self.tool)), os.getpid(), self.profiler.next_sequence()
+        ))
+        report: Dict[str, Any] = {"tool": self.tool, "seconds": round(seconds, 3), "files": []}
+        after = None
+        if self._before is not None:
+            import tracemalloc
+            try:
+                after = tracemalloc.take_snapshot()
+            finally:
+                _stop_tracing()
+        try:
+            if self._profiles:
+                report["top_functions"] = self._write_cpu(stem + ".prof")
+                report["files"].append(stem + ".prof")
+        except Exception as e:
+            self._notes.append(f"writing the cpu profile failed: {e}")
+        if self._notes:
+            report["notes"] = self._notes
+        self.report = report
+        
+        if after is None:
+            self.profiler.finished(report)
+        else:
+            # The files are listed now and appear shortly; top_allocations lands in profiling/configure's "last"
+            report["files"].extend([stem + ".alloc.folded", stem + ".alloc.txt"])
+            _background(self._write_memory, stem, self._before, after, dict(report))
+        self._before = None
+        return report
+    
+    def _write_cpu(self, path: str) -> List[str]:
+        # pstats format: python -m pstats, snakeviz, tuna, or flameprof for a flame graph
+        import pstats
+        with self._lock:
+            profiles = list(self._profiles)
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        stats.dump_stats(path)
+        
+        top = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:5]
+        return [
+            f"{_frame_label(filename, lineno)}({name}) {internal * 1000:.1f} ms in {calls} calls"
+            for (filename, lineno, name), (_, calls, internal, _, _) in top
+        ]
+    
+    def _write_memory(self, stem: str, before, after, report: Dict):
+        # Folded stacks (root first, weighted by bytes still allocated at the end of the call) for
+        # flamegraph.pl, inferno or speedscope, and the top sites by line. One comparison grouped by
+        # traceback serves both; Snapshot.filter_traces would take longer than the comparison.
+        import tracemalloc
+        own = (tracemalloc.__file__, __file__)
+        sites: Dict[Any, List[int]] = {}
+        try:
+            with open(stem + ".alloc.folded", "w") as f:
+                for stat in after.compare_to(before, "traceback"):
+                    if stat.size_diff <= 0 or stat.traceback[-1].filename in own:
+                        continue
+                    f.write(";".join(_frame_label(frame.filename, frame.lineno) for frame in stat.traceback))
+                    f.write(f" {stat.size_diff}\n")
+                    site = sites.setdefault(stat.traceback[-1], [0, 0])
+                    site[0] += stat.size_diff
+                    site[1] += stat.count_diff
+            
+            top = sorted(sites.items(), key=lambda item: item[1][0], reverse=True)[:self.profiler.top]
+            lines = [
+                f"{_frame_label(frame.filename, frame.lineno)} +{size / 1024:.1f} KiB in {count:+d} blocks"
+                for frame, (size, count) in top
+            ]
+            with open(stem + ".alloc.txt", "w") as f:
+                f.write("\n".join(lines) + "\n")
+            report["top_allocations"] = lines[:5]
+        except Exception as e:
+            report.setdefault("notes", []).append(f"writing the allocation report failed: {e}")
+        self.profiler.finished(report)
+
+class Profiler:
+    # Decides which tool calls get profiled: the next `calls` calls, a random sample_rate fraction
+    # of them, and any call whose _meta asks for it. Off by default; the check for an unprofiled
+    # call is a flag read.
+    def __init__(self):
+        self.directory = default_profile_dir()
+        self.modes = parse_modes(os.getenv("MCP_PROFILE_MODES", "cpu,memory"))
+        self.sample_rate = float(os.getenv("MCP_PROFILE_SAMPLE_RATE", "0"))
+        self.remaining = 0
+        self.tools: Optional[List[str]] = None
+        self.top = int(os.getenv("MCP_PROFILE_TOP", "25"))
+        self.memory_frames = int(os.getenv("MCP_PROFILE_MEMORY_FRAMES", "25"))
+        self.active = self.sample_rate > 0
+        self.last: Optional[Dict] = None
+        self._sequence = 0
+        self._lock = threading.Lock()
+        self._stats = {"profiled": 0, "requested": 0}
+    
+    def configure(self, params: Dict) -> Dict:
+        # profiling/configure: {"calls": N, "sample_rate": 0.01, "modes": ["cpu"], "tools": [...],
+        # "directory": "sub/dir"}; omitted keys keep their value, and {} just reports the settings.
+        # directory is relative to MCP_PROFILE_DIR and must stay inside it.
+        with self._lock:
+            if "calls" in params:
+                self.remaining = max(0, int(params["calls"]))
+            if "sample_rate" in params:
+                self.sample_rate = min(1.0, max(0.0, float(params["sample_rate"])))
+            if "modes" in params:
+                modes = parse_modes(params["modes"])
+                if not modes:
+                    raise ValueError(f"modes must name at least one of {', '.join(PROFILE_MODES)}")
+                self.modes = modes
+            if "tools" in params:
+                self.tools = list(params["tools"]) if params["tools"] else None
+            if params.get("directory"):
+                self.directory = resolve_directory(str(params["directory"]))
+            self.active = self.remaining > 0 or self.sample_rate > 0
+        return self.stats()
+    
+    def begin(self, tool: str, flag: Any = None, context=None) -> Optional[ProfileSession]:
+        # A ProfileSession if this call is to be profiled, else None. flag is the call's
+        # _meta.profile: true or the modes to use.
+        if flag is None and not self.active:
+            return None
+        
+        if flag is not None:
+            modes = parse_modes(flag)
+            if not modes:
+                return None
+            with self._lock:
+                self._stats["requested"] += 1
+        else:
+            with self._lock:
+                if self.tools is not None and tool not in self.tools:
+                    return None
+                if self.remaining > 0:
+                    self.remaining -= 1
+                elif not random.random() < self.sample_rate:
+                    return None
+                self.active = self.remaining > 0 or self.sample_rate > 0
+                modes = list(self.modes)
+        
+        session = ProfileSession(self, tool, getattr(context, "request_id", None), modes)
+        if context is not None:
+            context.profile = session
+        return session
+    
+    def next_sequence(self) -> int:
+        with self._lock:
+            self._sequence += 1
+            return self._sequence
+    
+    def finished(self, report: Dict):
+        with self._lock:
+            self._stats["profiled"] += 1
+            self.last = report
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            return dict(
+                self._stats,
+                remaining_calls=self.remaining,
+                sample_rate=self.sample_rate,
+                modes=list(self.modes),
+                tools=self.tools,
+                directory=self.directory,
+                last=self.last
+            )
+
+_profiler = Profiler()
+
+def get_profiler() -> Profiler:
+    return _profiler
@@ -0,0 +1,181 @@
+import os
+import time
+import random
+import threading
+from contextlib import nullcontext
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from tools.call_context import check_call, interruptible_sleep, remaining_time
+from tools.health import Attempt, CircuitBreaker, get_breaker
+
+# Requests per second and burst size per provider. Override with MCP_<PROVIDER>_RATE / MCP_<PROVIDER>_BURST
+PROVIDER_RATES = {
+    "serpapi": (5.0, 10),
+    "tavily": (10.0, 20),
+    "elevenlabs": (3.0, 5),
+    "replicate": (5.0, 10),
+    "replicate_delivery": (20.0, 40),
+    "web": (20.0, 40),
+}
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+class TokenBucket:
+    # Classic token bucket: rate tokens per second, holding at most burst
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def acquire(self) -> float:
+        # Block until a token is available; returns the time spent waiting
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                wait = (1 - self._tokens) / self.rate
+            interruptible_sleep(wait)
+            waited += wait
+
+class RetryBudget:
+    # Every request earns `ratio` of a retry and every retry spends one, so retries stay
+    # a bounded fraction of traffic instead of multiplying load while a provider struggles
+    def __init__(self, ratio: float = 0.2, reserve: int = 10):
+        self.ratio = ratio
+        self.reserve = reserve
+        self._tokens = float(reserve)
+        self._lock = threading.Lock()
+    
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self.reserve, self._tokens + self.ratio)
+    
+    def withdraw(self) -> bool:
+        with self._lock:
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    # Retry-After is either delta-seconds or an HTTP date
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class ProviderLimiter:
+    # Client-side rate limit plus retries with jittered exponential backoff for one provider,
+    # and its circuit breaker when it has one
+    def __init__(self, name: str, rate: float, burst: int, max_attempts: int = 3,
+                 base_delay: float = 0.5, max_delay: float = 8.0, max_retry_after: float = 30.0,
+                 budget: Optional[RetryBudget] = None, breaker: Optional[CircuitBreaker] = None):
+        self.name = name
+        self.breaker = breaker
+        self.bucket = TokenBucket(rate, burst)
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+        self.budget = budget or RetryBudget()
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "attempts": 0, "retries": 0, "budget_exhausted": 0, "throttled_seconds": 0.0}
+    
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        # Honor the server's Retry-After, otherwise full jitter over an exponential window
+        if retry_after is not None:
+            return retry_after
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+    
+    def execute(self, attempt_fn: Callable[[], Any],
+                should_retry: Callable[[Any, Optional[Exception]], Tuple[bool, Optional[float]]],
+                on_discard: Optional[Callable[[Any], None]] = None) -> Any:
+        # Run attempt_fn under the rate limit, retrying while should_retry says so and the
+        # attempt limit, retry budget and the current call's deadline allow it. The last
+        # outcome is returned or raised; a cancelled or expired call raises instead, and
+        # CircuitOpen is raised without an attempt while the provider's breaker is open.
+        self.budget.deposit()
+        self._count("requests")
+        attempt = 0
+        while True:
+            check_call()
+            # The token comes first: a half-open breaker admits one probe at a time, and that
+            # slot must not sit idle while the probe waits its turn under the rate limit
+            waited = self.bucket.acquire()
+            with (self.breaker.attempt() if self.breaker is not None else nullcontext(Attempt())) as outcome:
+                self._count("attempts", throttled=waited)
+                
+                result, error = None, None
+                started = time.monotonic()
+                try:
+                    result = attempt_fn()
+                except Exception as e:
+                    check_call()
+                    error = e
+                
+                # Throttling, server errors, timeouts and failed connections count against the provider
+                retry, retry_after = should_retry(result, error)
+                outcome.record(error is None and not retry, time.monotonic() - started)
+            
+            if retry and attempt + 1 < self.max_attempts:
+                delay = self.backoff(attempt, retry_after)
+                remaining = remaining_time()
+                if delay <= self.max_retry_after and (remaining is None or delay < remaining):
+                    if self.budget.withdraw():
+                        if on_discard and result is not None:
+                            on_discard(result)
+                        self._count("retries")
+                        interruptible_sleep(delay)
+                        attempt += 1
+                        continue
+                    self._count("budget_exhausted")
+            
+            if error is not None:
+                raise error
+            return result
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["throttled_seconds"] = round(stats["throttled_seconds"], 3)
+        return stats
+    
+    def _count(self, name: str, throttled: float = 0.0):
+        with self._lock:
+            self._stats[name] += 1
+            self._stats["throttled_seconds"] += throttled
+
+_limiters: Dict[str, ProviderLimiter] = {}
+_limiters_lock = threading.Lock()
+
+def get_limiter(provider: str) -> ProviderLimiter:
+    # Process-wide limiter per provider, configured from the environment on first use
+    with _limiters_lock:
+        limiter = _limiters.get(provider)
+        if limiter is None:
+            rate, burst = PROVIDER_RATES.get(provider, (5.0, 10))
+            prefix = f"MCP_{provider.upper()}_"
+            limiter = ProviderLimiter(
+                provider,
+                rate=float(os.getenv(prefix + "RATE", str(rate))),
+                burst=int(os.getenv(prefix + "BURST", str(burst))),
+                max_attempts=int(os.getenv("MCP_RETRY_MAX_ATTEMPTS", "3")),
+                budget=RetryBudget(float(os.getenv("MCP_RETRY_BUDGET_RATIO", "0.2"))),
+                breaker=get_breaker(provider)
+            )
+            _limiters[provider] = limiter
+        return limiter
@@ -0,0 +1,134 @@
+import os
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# String fields that may be shortened to fit a response budget
+TRUNCATABLE_FIELDS = {"content", "snippet", "summary", "raw_content", "text"}
+
+# Fields every projection keeps so callers can always tell whether a call worked
+ALWAYS_KEPT_FIELDS = {"success", "error", "status_code"}
+
+TRUNCATION_MARKER = "…"
+
+def default_mode() -> str:
+    # MCP_RESPONSE_ENCODING=pretty restores the indented output
+    return os.getenv("MCP_RESPONSE_ENCODING", "compact")
+
+def default_max_bytes() -> int:
+    # 0 means no budget
+    return int(os.getenv("MCP_MAX_RESPONSE_BYTES", "0"))
+
+def dumps(value: Any, mode: str = "compact") -> str:
+    # Compact JSON, through orjson when it is installed
+    if mode == "pretty":
+        return json.dumps(value, indent=2)
+    if orjson is not None:
+        try:
+            return orjson.dumps(value).decode("utf-8")
+        except TypeError:
+            pass  # e.g. integers orjson cannot represent; stdlib handles them
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+def project(value: Any, fields: List[str]) -> Any:
+    # Keep only the dotted paths in fields; lists are projected element by element
+    tree: Dict = {}
+    for path in fields:
+        node = tree
+        for part in path.split("."):
+            node = node.setdefault(part, {})
+    return _project(value, tree, top=True)
+
+def _project(value: Any, tree: Dict, top: bool = False) -> Any:
+    if not tree:
+        return value
+    if isinstance(value, list):
+        return [_project(item, tree) for item in value]
+    if not isinstance(value, dict):
+        return value
+    
+    projected = {}
+    for key, item in value.items():
+        if key in tree:
+            projected[key] = _project(item, tree[key])
+        elif top and key in ALWAYS_KEPT_FIELDS:
+            projected[key] = item
+    return projected
+
+def _truncate(value: Any, limit: int) -> Tuple[Any, bool]:
+    # Cap every truncatable string at limit characters
+    if isinstance(value, list):
+        items = [_truncate(item, limit) for item in value]
+        return [item for item, _ in items], any(changed for _, changed in items)
+    if isinstance(value, dict):
+        result = {}
+        changed = False
+        for key, item in value.items():
+            if key in TRUNCATABLE_FIELDS and isinstance(item, str) and len(item) > limit:
+                result[key] = item[:limit] + TRUNCATION_MARKER
+                changed = True
+            else:
+                result[key], item_changed = _truncate(item, limit)
+                changed = changed or item_changed
+        return result, changed
+    return value, False
+
+def _longest_truncatable(value: Any) -> int:
+    if isinstance(value, list):
+        return max((_longest_truncatable(item) for item in value), default=0)
+    if isinstance(value, dict):
+        return max(
+            (len(item) if key in TRUNCATABLE_FIELDS and isinstance(item, str) else _longest_truncatable(item)
+             for key, item in value.items()),
+            default=0
+        )
+    return 0
+
+def fit_to_budget(value: Any, max_bytes: int, mode: str = "compact", text: Optional[str] = None) -> Tuple[str, bool]:
+    # Binary-search the largest per-field character cap whose encoding fits in max_bytes.
+    # The same input and budget always give the same output. text is value already encoded in mode.
+    if text is None:
+        text = dumps(value, mode)
+    if max_bytes <= 0 or len(text.encode("utf-8")) <= max_bytes:
+        return text, False
+    
+    low, high = 0, _longest_truncatable(value)
+    best = None
+    while low <= high:
+        limit = (low + high) // 2
+        candidate = dumps(_truncate(value, limit)[0], mode)
+        if len(candidate.encode("utf-8")) <= max_bytes:
+            best = candidate
+            low = limit + 1
+        else:
+            high = limit - 1
+    
+    # Even empty strings do not fit; return the smallest version we can make
+    if best is None:
+        best = dumps(_truncate(value, 0)[0], mode)
+    return best, True
+
+def encode_result(result: Any, fields: Optional[List[str]] = None, max_bytes: Optional[int] = None,
+                  mode: Optional[str] = None) -> Tuple[str, Dict]:
+    # Encode a tool result for the wire, returning the text and a size report
+    mode = mode or default_mode()
+    max_bytes = default_max_bytes() if max_bytes is None else max_bytes
+    text = dumps(result, mode)
+    original_bytes = len(text.encode("utf-8"))
+    
+    # Without a projection the encoding above is the response unless it is over budget
+    if fields:
+        result = project(result, fields)
+        text = None
+    text, truncated = fit_to_budget(result, max_bytes, mode, text)
+    
+    return text, {
+        "originalBytes": original_bytes,
+        "returnedBytes": len(text.encode("utf-8")),
+        "truncated": truncated,
+        "projected": bool(fields)
+    }
@@ -0,0 +1,196 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# Seconds a successful result stays fresh, per tool. Override with MCP_CACHE_TTL_<TOOL>
+DEFAULT_TTLS = {
+    "search_web": 900,
+    "search_tavily": 900,
+    "summarize_webpage": 3600,
+    "search_and_summarize": 900,
+}
+
+CACHE_MODES = ("default", "bypass", "refresh")
+
+def default_cache_dir() -> str:
+    return os.getenv("MCP_CACHE_DIR", os.path.join(tempfile.gettempdir(), "mcp_focused_cache"))
+
+# Fields compared exactly; everything else is case and whitespace insensitive
+CASE_SENSITIVE_FIELDS = {"url", "text", "prompt"}
+
+def _normalize(value: Any, case_sensitive: bool = False) -> Any:
+    # Queries that differ only in case or whitespace share a key, as do reordered domain lists
+    if isinstance(value, str):
+        return value.strip() if case_sensitive else " ".join(value.split()).lower()
+    if isinstance(value, (list, tuple, set)):
+        return sorted(_normalize(v, case_sensitive) for v in value)
+    if isinstance(value, dict):
+        return {k: _normalize(v, k in CASE_SENSITIVE_FIELDS) for k, v in value.items() if v is not None}
+    return value
+
+def make_key(tool: str, params: Dict) -> str:
+    # Stable hash of the tool name and its normalized parameters
+    raw = json.dumps([tool, _normalize(params)], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+class ResultCache:
+    # In-memory LRU in front of a persistent SQLite tier, both bounded and TTL based. Expired rows
+    # stay on disk for stale_seconds more, to be served (marked stale) while a provider is down.
+    def __init__(self, path: Optional[str] = None, max_memory_entries: int = 512,
+                 max_disk_entries: int = 10000, ttls: Optional[Dict[str, int]] = None,
+                 stale_seconds: float = 86400):
+        self.path = path or os.path.join(default_cache_dir(), "results.sqlite3")
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.stale_seconds = stale_seconds
+        self.ttls = dict(DEFAULT_TTLS)
+        self.ttls.update(ttls or {})
+        
+        self._memory = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "bypassed": 0, "evictions": 0}
+        
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._db = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, tool TEXT, value TEXT, expires_at REAL, accessed_at REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed_at)")
+        self._db.commit()
+    
+    def ttl_for(self, tool: str) -> int:
+        value = os.getenv(f"MCP_CACHE_TTL_{tool.upper()}")
+        return int(value) if value else self.ttls.get(tool, 600)
+    
+    def get(self, key: str) -> Optional[Dict]:
+        # Look in memory first, then on disk (promoting disk hits back into memory)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._memory.move_to_end(key)
+                    self._stats["memory_hits"] += 1
+                    return json.loads(entry[1])
+                del self._memory[key]
+            
+            row = self._db.execute(
+                "SELECT value, expires_at FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and row[1] > now:
+                self._db.execute("UPDATE results SET accessed_at = ? WHERE key = ?", (now, key))
+                self._db.commit()
+                self._remember(key, row[1], row[0])
+                self._stats["disk_hits"] += 1
+                return json.loads(row[0])
+            
+            self._stats["misses"] += 1
+            return None
+    
+    def get_stale(self, key: str) -> Optional[Tuple[Dict, float]]:
+        # The stored result whether or not it is still fresh, with its age in seconds
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value, expires_at, tool FROM results WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), time.time() - (row[1] - self.ttl_for(row[2]))
+    
+    def set(self, tool: str, key: str, value: Dict):
+        now = time.time()
+        expires_at = now + self.ttl_for(tool)
+        raw = json.dumps(value)
+        with self._lock:
+            self._remember(key, expires_at, raw)
+            self._db.execute(
+                "INSERT OR REPLACE INTO results (key, tool, value, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, tool, raw, expires_at, now)
+            )
+            self._writes += 1
+            if self._writes % 64 == 0:
+                self._evict_disk(now)
+            self._db.commit()
+    
+    def get_or_compute(self, tool: str, params: Dict, compute: Callable[[], Dict],
+                       mode: Optional[str] = None) -> Dict:
+        # mode: "default" reads and writes, "refresh" skips the read, "bypass" skips both
+        mode = mode or "default"
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Invalid cache mode: {mode} (expected one of {', '.join(CACHE_MODES)})")
+        
+        key = make_key(tool, params)
+        if mode == "default":
+            cached = self.get(key)
+            if cached is not None:
+                return cached
+        else:
+            with self._lock:
+                self._stats["bypassed"] += 1
+        
+        result = compute()
+        
+        # Only successful results are worth keeping; errors should be retried upstream
+        if mode != "bypass" and isinstance(result, dict) and result.get("success"):
+            self.set(tool, key, result)
+        return result
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+        hits = stats["memory_hits"] + stats["disk_hits"]
+        lookups = hits + stats["misses"]
+        stats["hit_rate"] = round(hits / lookups, 4) if lookups else 0.0
+        return stats
+    
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._db.execute("DELETE FROM results")
+            self._db.commit()
+    
+    def _remember(self, key: str, expires_at: float, raw: str):
+        # Caller holds the lock
+        self._memory[key] = (expires_at, raw)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+            self._stats["evictions"] += 1
+    
+    def _evict_disk(self, now: float):
+        # Caller holds the lock: drop rows past their stale window, then the least recently used beyond the budget
+        self._db.execute("DELETE FROM results WHERE expires_at <= ?", (now - self.stale_seconds,))
+        count = self._db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        excess = count - self.max_disk_entries
+        if excess > 0:
+            self._db.execute(
+                "DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY accessed_at LIMIT ?)",
+                (excess,)
+            )
+            self._stats["evictions"] += excess
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_result_cache() -> ResultCache:
+    # Process-wide cache shared by every cached tool
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResultCache(
+                max_memory_entries=int(os.getenv("MCP_CACHE_MEMORY_ENTRIES", "512")),
+                max_disk_entries=int(os.getenv("MCP_CACHE_DISK_ENTRIES", "10000")),
+                stale_seconds=float(os.getenv("MCP_CACHE_STALE_SECONDS", "86400"))
+            )
+        return _cache
@@ -0,0 +1,218 @@
+import os
+import time
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Executor, Future
+from typing import Any, Callable, Dict, Optional
+
+from tools.metrics import get_metrics
+
+# Share of worker slots each tool gets while several have calls waiting. Override with MCP_<TOOL>_WEIGHT
+DEFAULT_WEIGHTS = {
+    "search_web": 4,
+    "search_tavily": 4,
+    "search_federated": 3,
+    "summarize_webpage": 3,
+    "search_and_summarize": 2,
+    "search_web_batch": 1,
+    "search_tavily_batch": 1,
+    "generate_voice": 1,
+    "generate_image": 1,
+    "generate_images_batch": 1,
+    "generate_image_submit": 4,
+    "generate_image_status": 8,
+    "generate_image_result": 2,
+}
+
+# Most calls of a tool running at once, so slow tools can never hold every slot. Override with MCP_<TOOL>_MAX_CONCURRENCY
+DEFAULT_CAPS = {
+    "search_federated": 4,
+    "search_and_summarize": 3,
+    "search_web_batch": 2,
+    "search_tavily_batch": 2,
+    "generate_voice": 2,
+    "generate_image": 2,
+    "generate_images_batch": 1,
+    "generate_image_result": 2,
+}
+
+# Calls of one tool that may wait for a slot before new ones are turned away. Override with MCP_<TOOL>_MAX_QUEUE
+DEFAULT_MAX_QUEUE = 64
+
+class QueueFull(Exception):
+    # A tool's queue is at its depth limit; retry_after estimates when there will be room
+    def __init__(self, tool: str, depth: int, retry_after: float):
+        super().__init__(f"Too many {tool} calls waiting ({depth}); retry in {retry_after:.1f}s")
+        self.tool = tool
+        self.depth = depth
+        self.retry_after = retry_after
+
+class _Job:
+    __slots__ = ("future", "fn", "client", "queue", "enqueued_at")
+    
+    def __init__(self, future: Future, fn: Callable[[float], Any], client: Any, queue: "_ToolQueue"):
+        self.future = future
+        self.fn = fn
+        self.client = client
+        self.queue = queue
+        self.enqueued_at = time.monotonic()
+
+class _ToolQueue:
+    # One tool's waiting calls, kept per client and served round-robin between clients
+    def __init__(self, tool: str, weight: float, cap: int, max_queue: int):
+        self.tool = tool
+        self.weight = weight
+        self.cap = cap
+        self.max_queue = max_queue
+        self.clients: "OrderedDict[Any, deque]" = OrderedDict()
+        self.queued = 0
+        self.running = 0
+        self.pass_value = 0.0  # stride-scheduling position; the lowest eligible queue goes next
+        self.avg_seconds: Optional[float] = None  # moving average of execution time
+        self.stats = {"dispatched": 0, "rejected": 0, "queue_wait_seconds": 0.0}
+    
+    def push(self, job: _Job):
+        self.clients.setdefault(job.client, deque()).append(job)
+        self.queued += 1
+    
+    def pop(self) -> _Job:
+        client, jobs = next(iter(self.clients.items()))
+        job = jobs.popleft()
+        del self.clients[client]
+        if jobs:
+            self.clients[client] = jobs  # back of the line for this client's next call
+        self.queued -= 1
+        return job
+    
+    def remove(self, job: _Job) -> bool:
+        jobs = self.clients.get(job.client)
+        if not jobs or job not in jobs:
+            return False
+        jobs.remove(job)
+        if not jobs:
+            del self.clients[job.client]
+        self.queued -= 1
+        return True
+
+class FairScheduler:
+    # Weighted fair queuing of tool calls onto an executor with `capacity` threads. Each tool has
+    # its own queue; when a slot frees up, the eligible tool (calls waiting, under its concurrency
+    # cap) with the lowest stride pass goes next and its pass grows by 1/weight. Within a tool,
+    # clients take turns. A burst of slow generation calls therefore waits in its own queue
+    # while searches keep getting slots.
+    def __init__(self, executor: Executor, capacity: int, weights: Optional[Dict[str, float]] = None,
+                 caps: Optional[Dict[str, int]] = None, max_queue: Optional[Dict[str, int]] = None):
+        self.executor = executor
+        self.capacity = capacity
+        self.weights = dict(DEFAULT_WEIGHTS, **(weights or {}))
+        self.caps = dict(DEFAULT_CAPS, **(caps or {}))
+        self.max_queue = dict(max_queue or {})
+        self.queues: Dict[str, _ToolQueue] = {}
+        self.running = 0
+        self._virtual_time = 0.0
+        self._condition = threading.Condition()
+    
+    def _queue(self, tool: str) -> _ToolQueue:
+        # Caller holds the lock
+        queue = self.queues.get(tool)
+        if queue is None:
+            prefix = f"MCP_{tool.upper()}_"
+            queue = _ToolQueue(
+                tool,
+                weight=float(os.getenv(prefix + "WEIGHT", str(self.weights.get(tool, 1)))),
+                cap=int(os.getenv(prefix + "MAX_CONCURRENCY", str(self.caps.get(tool, self.capacity)))),
+                max_queue=int(os.getenv(prefix + "MAX_QUEUE", str(self.max_queue.get(tool, DEFAULT_MAX_QUEUE))))
+            )
+            self.queues[tool] = queue
+        return queue
+    
+    def submit(self, tool: str, client: Any, fn: Callable[[float], Any]) -> Future:
+        # Queue fn(queue_wait_seconds) behind tool's other calls, or raise QueueFull. Cancelling
+        # the returned future before the call starts takes it out of the queue.
+        future = Future()
+        with self._condition:
+            queue = self._queue(tool)
+            if queue.queued >= queue.max_queue:
+                queue.stats["rejected"] += 1
+                raise QueueFull(tool, queue.queued, self._retry_after(queue))
+            
+            # A tool that was idle joins at the current virtual time rather than with banked credit
+            if queue.queued == 0 and queue.running == 0:
+                queue.pass_value = max(queue.pass_value, self._virtual_time)
+            job = _Job(future, fn, client, queue)
+            queue.push(job)
+            self._dispatch()
+        future.add_done_callback(lambda f: f.cancelled() and self._discard(job))
+        return future
+    
+    def _retry_after(self, queue: _ToolQueue) -> float:
+        # Time for the calls ahead to drain through the tool's slots at its usual execution time
+        slots = max(1, min(queue.cap, self.capacity))
+        return max(0.1, queue.queued / slots * (queue.avg_seconds or 1.0))
+    
+    def _discard(self, job: _Job):
+        with self._condition:
+            if job.queue.remove(job):
+                self._condition.notify_all()
+    
+    def _dispatch(self):
+        # Caller holds the lock: start calls while there are free slots and eligible queues
+        while self.running < self.capacity:
+            eligible = [q for q in self.queues.values() if q.queued and q.running < q.cap]
+            if not eligible:
+                return
+            queue = min(eligible, key=lambda q: q.pass_value)
+            job = queue.pop()
+            if not job.future.set_running_or_notify_cancel():
+                continue
+            
+            self._virtual_time = queue.pass_value
+            queue.pass_value += 1.0 / queue.weight
+            queue.running += 1
+            self.running += 1
+            wait = time.monotonic() - job.enqueued_at
+            queue.stats["dispatched"] += 1
+            queue.stats["queue_wait_seconds"] += wait
+            get_metrics().record_queue_wait(queue.tool, wait)
+            self.executor.submit(self._run, job, wait)
+    
+    def _run(self, job: _Job, wait: float):
+        started = time.monotonic()
+        try:
+            job.future.set_result(job.fn(wait))
+        except BaseException as e:
+            job.future.set_exception(e)
+        finally:
+            elapsed = time.monotonic() - started
+            with self._condition:
+                queue = job.queue
+                queue.running -= 1
+                self.running -= 1
+                queue.avg_seconds = elapsed if queue.avg_seconds is None else 0.8 * queue.avg_seconds + 0.2 * elapsed
+                self._dispatch()
+                self._condition.notify_all()
+    
+    def join(self):
+        # Wait until every queued and running call has finished
+        with self._condition:
+            while self.running or any(q.queued for q in self.queues.values()):
+                self._condition.wait()
+    
+    def stats(self) -> Dict:
+        with self._condition:
+            tools = {}
+            for tool, queue in self.queues.items():
+                dispatched = queue.stats["dispatched"]
+                tools[tool] = {
+                    "weight": queue.weight,
+                    "max_concurrency": queue.cap,
+                    "max_queue": queue.max_queue,
+                    "queued": queue.queued,
+                    "running": queue.running,
+                    "waiting_clients": len(queue.clients),
+                    "dispatched": dispatched,
+                    "rejected": queue.stats["rejected"],
+                    "avg_queue_wait_ms": round(queue.stats["queue_wait_seconds"] / dispatched * 1000, 1) if dispatched else 0.0,
+                    "avg_execution_ms": round(queue.avg_seconds * 1000, 1) if queue.avg_seconds is not None else 0.0
+                }
+            return {"capacity": self.capacity, "running": self.running, "tools": tools}
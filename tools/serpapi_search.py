@@ -1,15 +1,22 @@
 import os
+import threading
 import requests
 import json
-from dotenv import load_dotenv
 from typing import Dict, List, Optional
 
-load_dotenv()
+from tools.batch import run_batch
+from tools.env import load_env
+from tools.health import CircuitOpen, degraded_result
+from tools.http_client import get_session
+from tools.result_cache import get_result_cache
+
+load_env()
 
 class SerpAPISearch:
-    def __init__(self):
+    def __init__(self, session: Optional[requests.Session] = None):
         self.api_key = os.getenv("SERPAPI_API_KEY")
-        self.base_url = "https://serpapi.com/search.json"
+        self.base_url = os.getenv("SERPAPI_BASE_URL", "https://serpapi.com/search.json")
+        self.session = session or get_session("serpapi")
         
         if not self.api_key:
             raise ValueError("SERPAPI_API_KEY is not set")
@@ -23,7 +30,7 @@ class SerpAPISearch:
             "engine": search_type
         }
         
-        response = requests.get(self.base_url, params=params)
+        response = self.session.get(self.base_url, params=params)
         
         if response.status_code == 200:
             data = response.json()
@@ -54,18 +61,66 @@ class SerpAPISearch:
         # Search for shopping results
         return self.search(query, num_results, "google_shopping")
 
-def search_web_query(query: str, num_results: int = 10) -> Dict:
-    # Web search function
+_client = None
+_client_lock = threading.Lock()
+
+def get_client() -> SerpAPISearch:
+    # One long-lived client per process, shared by every tool call
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = SerpAPISearch()
+        return _client
+
+def search_web_query(query: str, num_results: int = 10, cache: Optional[str] = None,
+                     reroute: bool = True) -> Dict:
+    # Web search function, served from the result cache while fresh. While SerpAPI's breaker is
+    # open it answers with the stale cached result, else Tavily's (unless reroute is off)
+    params = {"query": query, "num_results": num_results, "engine": "google"}
+    try:
+        serpapi = get_client()
+        return get_result_cache().get_or_compute(
+            "search_web",
+            params,
+            lambda: serpapi.search(query, num_results),
+            cache
+        )
+    except CircuitOpen as e:
+        return degraded_result(e, "search_web", params, cache,
+                               (lambda: _search_with_tavily(query, num_results)) if reroute else None)
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+def _search_with_tavily(query: str, num_results: int) -> Dict:
+    # A Tavily search in search_web's result shape
+    from tools.tavily_search import get_client as get_tavily_client
+    result = get_tavily_client().search(query, max_results=num_results)
+    if not result.get("success"):
+        return result
+    return {
+        "success": True,
+        "query": query,
+        "total_results": result["total_results"],
+        "organic_results": [
+            {"position": position, "title": item.get("title", ""), "link": item.get("url"), "snippet": item.get("content", "")}
+            for position, item in enumerate(result["results"][:num_results], 1)
+        ],
+        "related_questions": [],
+        "related_searches": [],
+        "served_by": "tavily"
+    }
+
+def search_web_batch(queries: List[str], num_results: int = 10, cache: Optional[str] = None) -> Dict:
+    # Run many web searches concurrently; each one goes through the result cache
     try:
-        serpapi = SerpAPISearch()
-        return serpapi.search(query, num_results)
+        return run_batch("serpapi", queries, lambda query: search_web_query(query, num_results, cache))
     except Exception as e:
         return {"success": False, "error": str(e)}
 
 def search_images(query: str, num_results: int = 10) -> Dict:
     # Image search function
     try:
-        serpapi = SerpAPISearch()
+        serpapi = get_client()
         return serpapi.search_images(query, num_results)
     except Exception as e:
         return {"success": False, "error": str(e)}
@@ -73,7 +128,7 @@ def search_images(query: str, num_results: int = 10) -> Dict:
 def search_news(query: str, num_results: int = 10) -> Dict:
     # News search function
     try:
-        serpapi = SerpAPISearch()
+        serpapi = get_client()
         return serpapi.search_news(query, num_results)
     except Exception as e:
         return {"success": False, "error": str(e)}
@@ -0,0 +1,59 @@
+import threading
+from typing import Any, Callable, Dict
+
+from tools.call_context import check_call
+
+# How often a caller waiting on another's execution checks whether it was cancelled or ran out of time
+FOLLOWER_POLL_SECONDS = 0.05
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    # Collapse concurrent calls with the same key into one execution whose outcome all callers share
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+        self._stats = {"executions": 0, "coalesced": 0}
+    
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._flights[key] = flight
+                self._stats["executions"] += 1
+            else:
+                self._stats["coalesced"] += 1
+        
+        if not leader:
+            # Wait for the leader and hand back exactly what it got, error included. A follower
+            # that is cancelled or out of time stops waiting, so its worker is free at once.
+            while not flight.done.wait(FOLLOWER_POLL_SECONDS):
+                check_call()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        
+        try:
+            flight.result = fn()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return flight.result
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_flight"] = len(self._flights)
+        calls = stats["executions"] + stats["coalesced"]
+        stats["coalesced_rate"] = round(stats["coalesced"] / calls, 4) if calls else 0.0
+        return stats
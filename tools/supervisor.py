@@ -0,0 +1,385 @@
+import os
+import re
+import sys
+import json
+import time
+import signal
+import itertools
+import threading
+import subprocess
+from typing import Any, Callable, Dict, List, Optional
+
+from tools.response_encoding import dumps
+
+# JSON-RPC error codes for calls the supervisor answers itself
+WORKER_EXITED_CODE = -32603
+SHUTTING_DOWN_CODE = -32000
+
+# Methods sent to every worker rather than one
+BROADCAST_METHODS = ("metrics/get", "profiling/configure")
+
+# A worker that dies within this many seconds of starting is restarted after a doubling delay
+CRASH_LOOP_WINDOW = 5.0
+MIN_RESTART_DELAY = 0.5
+MAX_RESTART_DELAY = 30.0
+
+# Workers write responses as {"jsonrpc":"2.0","id":<n>,...}; the supervisor swaps in the client's
+# id by slicing the line rather than parsing and re-encoding a possibly large result
+_RESPONSE_PREFIX = re.compile(r'\{"jsonrpc":"2\.0","id":(\d+),')
+
+class _Pending:
+    # A request handed to a worker under the supervisor's own id
+    __slots__ = ("client_id", "session", "respond", "notify", "progress_token")
+    
+    def __init__(self, client_id: Any, session: Any, respond: Callable[[str], None],
+                 notify: Optional[Callable[[Dict], None]] = None, progress_token: Any = None):
+        self.client_id = client_id
+        self.session = session
+        self.respond = respond
+        self.notify = notify
+        self.progress_token = progress_token
+
+class Worker:
+    # One mcp_server_focused.py child process speaking JSON-RPC over its stdin/stdout
+    def __init__(self, index: int, command: List[str], env: Dict[str, str]):
+        self.index = index
+        self.command = command
+        self.env = env
+        self.process: Optional[subprocess.Popen] = None
+        self.pending: Dict[int, _Pending] = {}
+        self.started_at = 0.0
+        self.restarts = 0
+        self.restart_delay = 0.0
+        self.served = 0
+        self._write_lock = threading.Lock()
+    
+    def start(self):
+        self.process = subprocess.Popen(
+            self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            env=self.env, text=True, encoding="utf-8", bufsize=1
+        )
+        self.started_at = time.monotonic()
+    
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+    
+    def send(self, line: str) -> bool:
+        with self._write_lock:
+            try:
+                self.process.stdin.write(line + "\n")
+                self.process.stdin.flush()
+                return True
+            except (OSError, ValueError):
+                return False
+    
+    def close_input(self):
+        # EOF makes the worker finish its running calls and exit
+        with self._write_lock:
+            try:
+                self.process.stdin.close()
+            except OSError:
+                pass
+
+class WorkerSupervisor:
+    # Runs N worker processes and hands each request to the least-loaded one, so JSON encoding,
+    # HTML parsing and audio stitching scale past one core. It has the RequestDispatcher interface
+    # (dispatch/cancel/cancel_session/serve/drain), so it can sit behind stdio or the HTTP transport.
+    # Workers share the result cache, page cache, job store and audio/image stores through
+    # MCP_CACHE_DIR; their own in-memory result tier is off unless MCP_CACHE_MEMORY_ENTRIES is set.
+    def __init__(self, workers: int, command: Optional[List[str]] = None,
+                 env: Optional[Dict[str, str]] = None, output=None):
+        self.output = output or sys.stdout
+        command = command or [sys.executable, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "mcp_server_focused.py")]
+        self.workers = [Worker(index, command, self._worker_env(index, env)) for index in range(max(1, workers))]
+        self._lock = threading.Condition()
+        self._ids = itertools.count(1)
+        self._routes: Dict[tuple, tuple] = {}  # (session, client id) -> (worker, supervisor id)
+        self._rotation = 0
+        self._draining = False
+        self._stopping = False
+        self._write_lock = threading.Lock()
+        self._readers: List[threading.Thread] = []
+        for worker in self.workers:
+            self._start_worker(worker)
+    
+    @staticmethod
+    def _worker_env(index: int, env: Optional[Dict[str, str]]) -> Dict[str, str]:
+        env = dict(os.environ if env is None else env)
+        env["MCP_WORKERS"] = "1"
+        env["MCP_WORKER_INDEX"] = str(index)
+        env.pop("MCP_TRANSPORT", None)
+        env.setdefault("MCP_CACHE_MEMORY_ENTRIES", "0")
+        
+        # One Prometheus file per worker; the worker label keeps their series apart
+        textfile = env.get("MCP_METRICS_TEXTFILE")
+        if textfile:
+            base, ext = os.path.splitext(textfile)
+            env["MCP_METRICS_TEXTFILE"] = f"{base}.worker{index}{ext}"
+        return env
+    
+    def _start_worker(self, worker: Worker):
+        worker.start()
+        reader = threading.Thread(target=self._read, args=(worker, worker.process),
+                                  name=f"mcp-worker-{worker.index}", daemon=True)
+        reader.start()
+        self._readers.append(reader)
+    
+    def write(self, message: Dict):
+        self.write_line(dumps(message))
+    
+    def write_line(self, line: str):
+        with self._write_lock:
+            self.output.write(line + "\n")
+            self.output.flush()
+    
+    def dispatch_line(self, line: str):
+        line = line.strip()
+        if not line:
+            return
+        try:
+            request = json.loads(line)
+        except Exception as e:
+            self.write({"jsonrpc": "2.0", "id": None, "error": {"code": -32700, "message": f"Parse error: {e}"}})
+            return
+        self.dispatch(request)
+    
+    def dispatch(self, request: Dict, respond: Optional[Callable[[str], None]] = None,
+                 notify: Optional[Callable[[Dict], None]] = None, session: Any = None):
+        respond = respond or self.write_line
+        notify = notify or self.write
+        
+        # Only cancellations matter among notifications; workers need no initialized notice
+        if "id" not in request:
+            if request.get("method") == "notifications/cancelled":
+                self.cancel(request.get("params", {}).get("requestId"), session)
+            return
+        
+        if self._draining:
+            respond(dumps(self._error(request.get("id"), SHUTTING_DOWN_CODE, "Server is shutting down")))
+            return
+        
+        if request.get("method") in BROADCAST_METHODS:
+            self._broadcast(request, respond)
+            return
+        
+        params = request.get("params")
+        meta = params.get("_meta") if isinstance(params, dict) else None
+        progress_token = meta.get("progressToken") if isinstance(meta, dict) else None
+        pending = _Pending(request.get("id"), session, respond, notify, progress_token)
+        
+        with self._lock:
+            worker = self._least_loaded()
+            if worker is None:
+                respond(dumps(self._error(request.get("id"), WORKER_EXITED_CODE, "No worker process is running")))
+                return
+            worker_id = next(self._ids)
+            worker.pending[worker_id] = pending
+            self._routes[(session, request.get("id"))] = (worker, worker_id)
+        
+        # Ids (and progress tokens) are only unique per client, so workers see the supervisor's own.
+        # Workers share their slots out per client, and the client is a session only we can see.
+        forwarded = dict(request, id=worker_id)
+        if isinstance(params, dict) and (progress_token is not None or session is not None):
+            forwarded_meta = dict(meta) if isinstance(meta, dict) else {}
+            if progress_token is not None:
+                forwarded_meta["progressToken"] = worker_id
+            if session is not None:
+                forwarded_meta["client"] = session
+            forwarded["params"] = dict(params, _meta=forwarded_meta)
+        # If the worker is exiting the send fails quietly; its reader then fails the call
+        worker.send(dumps(forwarded))
+    
+    def _least_loaded(self) -> Optional[Worker]:
+        # Caller holds the lock. Fewest calls in flight wins; ties rotate between workers.
+        self._rotation = (self._rotation + 1) % len(self.workers)
+        candidates = [w for w in self.workers[self._rotation:] + self.workers[:self._rotation] if w.alive]
+        return min(candidates, key=lambda w: len(w.pending)) if candidates else None
+    
+    def cancel(self, request_id: Any, session: Any = None) -> bool:
+        # Forward notifications/cancelled to the worker running the call; no response is expected.
+        # True when the call will now never be answered, as RequestDispatcher.cancel.
+        with self._lock:
+            route = self._routes.pop((session, request_id), None)
+            if route is None:
+                return False
+            worker, worker_id = route
+            suppressed = worker.pending.pop(worker_id, None) is not None
+            self._lock.notify_all()
+        worker.send(dumps({"jsonrpc": "2.0", "method": "notifications/cancelled", "params": {"requestId": worker_id}}))
+        return suppressed
+    
+    def cancel_session(self, session: Any):
+        with self._lock:
+            request_ids = [request_id for key_session, request_id in self._routes if key_session == session]
+        for request_id in request_ids:
+            self.cancel(request_id, session)
+    
+    def inflight_count(self) -> int:
+        with self._lock:
+            return sum(len(worker.pending) for worker in self.workers)
+    
+    def _read(self, worker: Worker, process: subprocess.Popen):
+        for line in process.stdout:
+            line = line.strip()
+            if line:
+                try:
+                    self._route(worker, line)
+                except Exception as e:
+                    print(f"supervisor: bad message from worker {worker.index}: {e}", file=sys.stderr)
+        process.wait()
+        self._worker_exited(worker, process)
+    
+    def _route(self, worker: Worker, line: str):
+        match = _RESPONSE_PREFIX.match(line)
+        if match:
+            pending = self._complete(worker, int(match.group(1)))
+            if pending is not None:
+                pending.respond('{"jsonrpc":"2.0","id":' + dumps(pending.client_id) + "," + line[match.end():])
+            return
+        
+        message = json.loads(line)
+        if "method" not in message:
+            # A response encoded some other way (e.g. with an id the prefix does not match)
+            pending = self._complete(worker, message.get("id"))
+            if pending is not None:
+                message["id"] = pending.client_id
+                pending.respond(dumps(message))
+            return
+        
+        if message.get("method") == "notifications/progress":
+            params = message.get("params", {})
+            with self._lock:
+                pending = worker.pending.get(params.get("progressToken"))
+            if pending is not None and pending.notify is not None:
+                params["progressToken"] = pending.progress_token
+                pending.notify(message)
+    
+    def _complete(self, worker: Worker, worker_id: Any) -> Optional[_Pending]:
+        with self._lock:
+            pending = worker.pending.pop(worker_id, None)
+            if pending is not None:
+                worker.served += 1
+                key = (pending.session, pending.client_id)
+                if self._routes.get(key) == (worker, worker_id):
+                    del self._routes[key]
+                self._lock.notify_all()
+            return pending
+    
+    def _worker_exited(self, worker: Worker, process: subprocess.Popen):
+        with self._lock:
+            orphaned = list(worker.pending.values())
+            worker.pending.clear()
+            for pending in orphaned:
+                key = (pending.session, pending.client_id)
+                if self._routes.get(key, (None,))[0] is worker:
+                    del self._routes[key]
+            self._lock.notify_all()
+        
+        # Calls are not replayed on another worker: a tool may already have had side effects
+        for pending in orphaned:
+            pending.respond(dumps(self._error(
+                pending.client_id, WORKER_EXITED_CODE,
+                f"Worker process exited with status {process.returncode} while handling the request"
+            )))
+        
+        if self._stopping:
+            return
+        
+        # Back off when a worker keeps dying right after it starts (bad config, missing package)
+        if time.monotonic() - worker.started_at < CRASH_LOOP_WINDOW:
+            worker.restart_delay = min(MAX_RESTART_DELAY, max(MIN_RESTART_DELAY, worker.restart_delay * 2))
+        else:
+            worker.restart_delay = 0.0
+        print(f"supervisor: worker {worker.index} exited with status {process.returncode}, "
+              f"restarting in {worker.restart_delay:.1f}s", file=sys.stderr, flush=True)
+        time.sleep(worker.restart_delay)
+        if not self._stopping:
+            worker.restarts += 1
+            self._start_worker(worker)
+    
+    def _broadcast(self, request: Dict, respond: Callable[[str], None]):
+        # Every worker keeps its own metrics and profiler, so ask them all and answer with one combined result
+        with self._lock:
+            workers = [w for w in self.workers if w.alive]
+        results: Dict[int, Any] = {}
+        
+        def finish():
+            respond(dumps({
+                "jsonrpc": "2.0",
+                "id": request.get("id"),
+                "result": {"supervisor": self.stats(), "workers": [results.get(w.index) for w in workers]}
+            }))
+        
+        if not workers:
+            finish()
+            return
+        
+        def collector(worker: Worker):
+            def collect(line: str):
+                message = json.loads(line)
+                with self._lock:
+                    results[worker.index] = message.get("result", message.get("error"))
+                    complete = len(results) == len(workers)
+                if complete:
+                    finish()
+            return collect
+        
+        for worker in workers:
+            with self._lock:
+                worker_id = next(self._ids)
+                worker.pending[worker_id] = _Pending(request.get("id"), None, collector(worker))
+            worker.send(dumps(dict(request, id=worker_id)))
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "workers": len(self.workers),
+                "alive": sum(1 for w in self.workers if w.alive),
+                "restarts": sum(w.restarts for w in self.workers),
+                "inflight": [len(w.pending) for w in self.workers],
+                "served": [w.served for w in self.workers]
+            }
+    
+    @staticmethod
+    def _error(request_id: Any, code: int, message: str) -> Dict:
+        return {"jsonrpc": "2.0", "id": request_id, "error": {"code": code, "message": message}}
+    
+    def drain(self, timeout: Optional[float] = None):
+        # Stop taking requests, give in-flight calls up to MCP_DRAIN_TIMEOUT seconds to finish,
+        # then close the workers' input so they exit once their remaining calls are answered
+        self._draining = True
+        if timeout is None:
+            timeout = float(os.getenv("MCP_DRAIN_TIMEOUT", "30"))
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            while any(w.pending for w in self.workers):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._lock.wait(remaining)
+        
+        self._stopping = True
+        for worker in self.workers:
+            worker.close_input()
+        for worker in self.workers:
+            try:
+                worker.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                worker.process.kill()
+        # Let the readers deliver the last responses (or errors for killed workers)
+        for reader in self._readers:
+            reader.join(timeout=1)
+    
+    def serve(self, stream=None):
+        # stdio front end: SIGTERM or EOF on stdin drains the workers before exiting
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, _raise_exit)
+        try:
+            for line in (stream or sys.stdin):
+                self.dispatch_line(line)
+        finally:
+            self.drain()
+
+def _raise_exit(*_):
+    raise SystemExit(0)
@@ -1,22 +1,37 @@
 import os
+import time
+import threading
 import requests
 import json
-from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Dict, List, Optional
 
-load_dotenv()
+from tools.batch import run_batch
+from tools.call_context import in_call, report_progress
+from tools.env import load_env
+from tools.health import CircuitOpen, degraded_result
+from tools.http_client import get_session
+from tools.response_encoding import dumps
+from tools.result_cache import get_result_cache
+from tools.webpage import MIN_TEXT_CHARS, summarize_page, summarize_text
+
+load_env()
+
+# Tavily returns at most 10 results per search
+MAX_RESEARCH_SOURCES = 10
 
 class TavilySearch:
-    def __init__(self):
+    def __init__(self, session: Optional[requests.Session] = None):
         self.api_key = os.getenv("TAVILY_API_KEY")
-        self.base_url = "https://api.tavily.com"
+        self.base_url = os.getenv("TAVILY_BASE_URL", "https://api.tavily.com")
+        self.session = session or get_session("tavily")
         
         if not self.api_key:
             raise ValueError("TAVILY_API_KEY is not set")
     
     def search(self, query: str, search_depth: str = "basic", 
                include_domains: List[str] = None, exclude_domains: List[str] = None,
-               max_results: int = 10) -> Dict:
+               max_results: int = 10, include_raw_content: bool = False) -> Dict:
         # Perform a web search using Tavily
         url = f"{self.base_url}/search"
         
@@ -26,12 +41,14 @@ class TavilySearch:
             "max_results": max_results
         }
         
+        if include_raw_content:
+            payload["include_raw_content"] = True
         if include_domains:
             payload["include_domains"] = include_domains
         if exclude_domains:
             payload["exclude_domains"] = exclude_domains
         
-        response = requests.post(
+        response = self.session.post(
             url,
             json=payload,
             headers={"Authorization": f"Bearer {self.api_key}"}
@@ -53,37 +70,27 @@ class TavilySearch:
                 "status_code": response.status_code
             }
     
-    def summarize_url(self, url: str, include_images: bool = False) -> Dict:
-        # Summarize content from a URL
-        api_url = f"{self.base_url}/search"
-        
-        payload = {
-            "query": f"summarize this webpage: {url}",
-            "search_depth": "basic",
-            "max_results": 1
-        }
-        
-        response = requests.post(
-            api_url,
-            json=payload,
+    def extract_url(self, url: str) -> Dict:
+        # Page text as Tavily's extract endpoint sees it; used when fetching the page directly fails
+        response = self.session.post(
+            f"{self.base_url}/extract",
+            json={"urls": [url]},
             headers={"Authorization": f"Bearer {self.api_key}"}
         )
         
         if response.status_code == 200:
-            data = response.json()
-            results = data.get("results", [])
+            results = response.json().get("results", [])
             if results:
                 return {
                     "success": True,
                     "url": url,
-                    "summary": results[0].get("content", ""),
                     "title": results[0].get("title", ""),
-                    "content": results[0].get("content", "")
+                    "content": results[0].get("raw_content") or results[0].get("content", "")
                 }
             else:
                 return {
                     "success": False,
-                    "error": "No summary available"
+                    "error": "No content extracted"
                 }
         else:
             return {
@@ -92,63 +99,154 @@ class TavilySearch:
                 "status_code": response.status_code
             }
     
-    def search_and_summarize(self, query: str, search_depth: str = "basic") -> Dict:
-        # Search and then summarize the top result
-        # First, perform the search
-        search_result = self.search(query, search_depth, max_results=1)
-        
+    def search_and_summarize(self, query: str, search_depth: str = "basic", k: int = 3) -> Dict:
+        # One search for the top k sources, with their page text included, then every source is
+        # summarized concurrently. Each finished source is streamed as a progress notification.
+        k = max(1, min(int(k), MAX_RESEARCH_SOURCES))
+        started = time.perf_counter()
+        search_result = self.search(query, search_depth, max_results=k, include_raw_content=True)
         if not search_result.get("success"):
             return search_result
         
-        results = search_result.get("results", [])
+        results = search_result.get("results", [])[:k]
         if not results:
             return {
                 "success": False,
                 "error": "No search results found"
             }
+        search_ms = round((time.perf_counter() - started) * 1000, 1)
         
-        # Get the URL of the first result
-        top_result = results[0]
-        url = top_result.get("url")
-        
-        if not url:
-            return {
-                "success": False,
-                "error": "No URL found in search results"
-            }
-        
-        # Summarize the URL
-        summary_result = self.summarize_url(url)
+        sources: List[Optional[Dict]] = [None] * len(results)
+        with ThreadPoolExecutor(max_workers=len(results), thread_name_prefix="research") as pool:
+            futures = {pool.submit(in_call(_summarize_source), item): index for index, item in enumerate(results)}
+            for done, future in enumerate(as_completed(futures), 1):
+                index = futures[future]
+                source = future.result()
+                source["rank"] = index + 1
+                sources[index] = source
+                report_progress(done, len(results), dumps(source))
         
         return {
             "success": True,
             "query": query,
-            "search_result": top_result,
-            "summary": summary_result.get("summary", ""),
-            "title": summary_result.get("title", ""),
-            "url": url
+            "k": k,
+            "summary": summarize_text("\n".join(source["summary"] for source in sources)),
+            "sources": sources,
+            "search_time_ms": search_ms,
+            "total_time_ms": round((time.perf_counter() - started) * 1000, 1)
         }
 
-def summarize_webpage(url: str) -> Dict:
-    # Webpage summarization function
+def _summarize_source(item: Dict) -> Dict:
+    # Summarize the text the search already returned; fetch the page only when there is none
+    started = time.perf_counter()
+    url = item.get("url")
+    text = item.get("raw_content") or ""
+    if len(text) >= MIN_TEXT_CHARS:
+        summary, origin = summarize_text(text), "search"
+    else:
+        page = summarize_page(url) if url else {"success": False}
+        if page.get("success"):
+            summary, origin = page["summary"], "page"
+        else:
+            # The search snippet beats no summary at all
+            summary, origin = item.get("content", ""), "snippet"
+    
+    return {
+        "url": url,
+        "title": item.get("title", ""),
+        "summary": summary,
+        "from": origin,
+        "score": item.get("score"),
+        "latency_ms": round((time.perf_counter() - started) * 1000, 1)
+    }
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client() -> TavilySearch:
+    # One long-lived client per process, shared by every tool call
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = TavilySearch()
+        return _client
+
+def _extract_with_tavily(url: str) -> Dict:
+    return get_client().extract_url(url)
+
+def summarize_webpage(url: str, cache: Optional[str] = None) -> Dict:
+    # Fetch and summarize the page locally, with Tavily only as a fallback. Served from the
+    # result cache while fresh; after that an unchanged page costs one conditional GET.
+    try:
+        return get_result_cache().get_or_compute(
+            "summarize_webpage",
+            {"url": url},
+            lambda: summarize_page(url, fallback=_extract_with_tavily, use_cache=cache != "bypass"),
+            cache
+        )
+    except CircuitOpen as e:
+        return degraded_result(e, "summarize_webpage", {"url": url}, cache)
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+def search_with_tavily(query: str, search_depth: str = "basic", cache: Optional[str] = None,
+                       reroute: bool = True) -> Dict:
+    # Tavily search function, served from the result cache while fresh. While Tavily's breaker is
+    # open it answers with the stale cached result, else SerpAPI's (unless reroute is off)
+    params = {"query": query, "search_depth": search_depth, "max_results": 10,
+              "include_domains": None, "exclude_domains": None}
     try:
-        tavily = TavilySearch()
-        return tavily.summarize_url(url)
+        tavily = get_client()
+        return get_result_cache().get_or_compute(
+            "search_tavily",
+            params,
+            lambda: tavily.search(query, search_depth),
+            cache
+        )
+    except CircuitOpen as e:
+        return degraded_result(e, "search_tavily", params, cache,
+                               (lambda: _search_with_serpapi(query, search_depth)) if reroute else None)
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-def search_with_tavily(query: str, search_depth: str = "basic") -> Dict:
-    # Tavily search function
+def _search_with_serpapi(query: str, search_depth: str) -> Dict:
+    # A SerpAPI search in search_tavily's result shape
+    from tools.serpapi_search import get_client as get_serpapi_client
+    result = get_serpapi_client().search(query, 10)
+    if not result.get("success"):
+        return result
+    results = [
+        {"title": item.get("title", ""), "url": item.get("link"), "content": item.get("snippet", ""), "score": None}
+        for item in result["organic_results"] if item.get("link")
+    ]
+    return {
+        "success": True,
+        "query": query,
+        "results": results,
+        "search_depth": search_depth,
+        "total_results": len(results),
+        "served_by": "serpapi"
+    }
+
+def search_tavily_batch(queries: List[str], search_depth: str = "basic", cache: Optional[str] = None) -> Dict:
+    # Run many Tavily searches concurrently; each one goes through the result cache
     try:
-        tavily = TavilySearch()
-        return tavily.search(query, search_depth)
+        return run_batch("tavily", queries, lambda query: search_with_tavily(query, search_depth, cache))
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-def search_and_summarize(query: str) -> Dict:
-    # Search and summarize function
+def search_and_summarize(query: str, k: int = 3, search_depth: str = "basic", cache: Optional[str] = None) -> Dict:
+    # Research function: top k sources and their summaries, served from the result cache while fresh
+    params = {"query": query, "k": k, "search_depth": search_depth}
     try:
-        tavily = TavilySearch()
-        return tavily.search_and_summarize(query)
+        tavily = get_client()
+        return get_result_cache().get_or_compute(
+            "search_and_summarize",
+            params,
+            lambda: tavily.search_and_summarize(query, search_depth, k),
+            cache
+        )
+    except CircuitOpen as e:
+        return degraded_result(e, "search_and_summarize", params, cache)
     except Exception as e:
         return {"success": False, "error": str(e)}
@@ -0,0 +1,414 @@
+import os
+import re
+import json
+import math
+import time
+import codecs
+import socket
+import ipaddress
+import sqlite3
+import threading
+from collections import Counter
+from html.parser import HTMLParser
+from typing import Callable, Dict, List, Optional
+from urllib.parse import urljoin, urlsplit
+
+from tools.call_context import check_call
+from tools.http_client import get_session, pinned_addresses
+from tools.metrics import get_metrics
+from tools.result_cache import default_cache_dir
+
+# Stop reading a page after this many bytes; the main text of an article is near the top
+MAX_PAGE_BYTES = int(os.getenv("MCP_PAGE_MAX_BYTES", str(2 * 1024 * 1024)))
+PAGE_CHUNK_SIZE = 16384
+
+SUMMARY_SENTENCES = int(os.getenv("MCP_SUMMARY_SENTENCES", "5"))
+
+# Less extracted text than this usually means a script-rendered page, which Tavily handles better
+MIN_TEXT_CHARS = 200
+
+# Extracted text kept in results and in the page cache
+MAX_CONTENT_CHARS = 20000
+
+# Redirects followed per page; each hop's address is checked like the first
+MAX_REDIRECTS = 5
+
+# Pages on loopback, private and link-local addresses (e.g. a cloud metadata service) are refused
+# unless MCP_PAGE_ALLOW_PRIVATE=1, so a caller cannot make the server read its own network
+ALLOW_PRIVATE_ADDRESSES = os.getenv("MCP_PAGE_ALLOW_PRIVATE", "0") == "1"
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (compatible; focused-tools-mcp/1.0)",
+    "Accept": "text/html,application/xhtml+xml,text/plain;q=0.9,*/*;q=0.5"
+}
+
+# Elements whose text is never part of the page's main content
+SKIP_TAGS = {"script", "style", "noscript", "template", "svg", "canvas", "iframe", "nav", "header",
+             "footer", "aside", "form", "button", "select", "textarea"}
+
+# Elements that end a run of text
+BLOCK_TAGS = {"p", "div", "section", "article", "main", "li", "ul", "ol", "br", "hr", "tr", "td", "th",
+              "table", "pre", "blockquote", "dd", "dt", "dl", "figcaption", "h1", "h2", "h3", "h4", "h5", "h6"}
+
+# Elements that usually hold the main content when a page has them
+MAIN_TAGS = {"article", "main"}
+
+class PageTextExtractor(HTMLParser):
+    # Incremental HTML to text: feed() chunks as they arrive, then call text()
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.title = ""
+        self.description = ""
+        self._in_title = False
+        self._skip_depth = 0
+        self._main_depth = 0
+        self._current: List[str] = []
+        self._blocks: List[tuple] = []  # (inside article/main, text)
+    
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag == "title":
+            self._in_title = True
+        elif tag == "meta":
+            attributes = dict(attrs)
+            name = (attributes.get("name") or attributes.get("property") or "").lower()
+            if name in ("description", "og:description") and not self.description:
+                self.description = " ".join((attributes.get("content") or "").split())
+        
+        if tag in BLOCK_TAGS:
+            self._flush()
+        if tag in MAIN_TAGS:
+            self._main_depth += 1
+    
+    def handle_endtag(self, tag):
+        if tag in SKIP_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag == "title":
+            self._in_title = False
+        
+        if tag in BLOCK_TAGS:
+            self._flush()
+        if tag in MAIN_TAGS:
+            self._main_depth = max(0, self._main_depth - 1)
+    
+    def handle_data(self, data):
+        if self._in_title:
+            self.title += data
+        elif not self._skip_depth:
+            self._current.append(data)
+    
+    def _flush(self):
+        text = " ".join("".join(self._current).split())
+        self._current = []
+        if text:
+            self._blocks.append((self._main_depth > 0, text))
+    
+    def text(self) -> str:
+        self._flush()
+        # Menus, bylines and buttons are short fragments; prose comes in sentences
+        blocks = [(main, text) for main, text in self._blocks if len(text.split()) >= 5 or text[-1:] in ".!?"]
+        main_text = "\n".join(text for main, text in blocks if main)
+        if len(main_text) >= MIN_TEXT_CHARS:
+            return main_text
+        return "\n".join(text for _, text in blocks)
+
+STOPWORDS = frozenset("""
+a about above after again against all also am an and any are as at be because been before being below
+between both but by can could did do does doing down during each few for from further had has have having
+he her here hers him his how i if in into is it its itself just me more most my no nor not now of off on
+once only or other our ours out over own same she should so some such than that the their theirs them then
+there these they this those through to too under until up very was we were what when where which while who
+whom why will with would you your yours
+""".split())
+
+_SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])[\"')\]]*\s+(?=[\"'(\[]?[A-Z0-9])")
+_WORD = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+def split_sentences(text: str) -> List[str]:
+    sentences = []
+    for block in text.split("\n"):
+        for sentence in _SENTENCE_BOUNDARY.split(block):
+            sentence = sentence.strip()
+            if len(sentence.split()) >= 4:
+                sentences.append(sentence)
+    return sentences
+
+def summarize_text(text: str, max_sentences: int = SUMMARY_SENTENCES) -> str:
+    # Extractive summary: score sentences by the TF-IDF weight of their words, with a small bonus
+    # for the opening sentences, and return the best ones in their original order
+    sentences = split_sentences(text)
+    if len(sentences) <= max_sentences:
+        return " ".join(sentences)
+    
+    words = [[w for w in _WORD.findall(s.lower()) if w not in STOPWORDS and len(w) > 1] for s in sentences]
+    
+    # Sentences act as the documents: words the page keeps returning to weigh the most,
+    # unless they appear in nearly every sentence
+    term_counts = Counter(w for sentence_words in words for w in sentence_words)
+    sentence_counts = Counter(w for sentence_words in words for w in set(sentence_words))
+    count = len(sentences)
+    weights = {w: tf * math.log(1 + count / sentence_counts[w]) for w, tf in term_counts.items()}
+    
+    scores = []
+    for index, sentence_words in enumerate(words):
+        if not sentence_words:
+            scores.append(0.0)
+            continue
+        score = sum(weights[w] for w in set(sentence_words)) / math.sqrt(len(sentence_words))
+        scores.append(score * (1 + 0.5 / (1 + index)))
+    
+    best = sorted(range(count), key=lambda i: scores[i], reverse=True)[:max_sentences]
+    return " ".join(sentences[i] for i in sorted(best))
+
+_CHARSET = re.compile(rb"""<meta[^>]+charset=["']?([a-zA-Z0-9_-]+)""", re.IGNORECASE)
+
+def _charset(content_type: str, head: bytes) -> str:
+    # Header charset, else a <meta charset> near the top of the page, else UTF-8
+    match = re.search(r"charset=([^\s;]+)", content_type, re.IGNORECASE)
+    if match:
+        return match.group(1).strip("\"'")
+    match = _CHARSET.search(head[:4096])
+    if match:
+        return match.group(1).decode("ascii")
+    return "utf-8"
+
+class PageCache:
+    # Validators (ETag / Last-Modified) and the summary of each fetched page, so asking for an
+    # unchanged page again costs one conditional GET answered with 304 Not Modified
+    def __init__(self, path: Optional[str] = None, max_entries: int = 2000):
+        self.path = path or os.path.join(default_cache_dir(), "pages.sqlite3")
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._stats = {"hits": 0, "misses": 0, "not_modified": 0, "modified": 0, "stale": 0}
+        self._db = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, result TEXT, fetched_at REAL, used_at REAL)"
+        )
+        self._db.commit()
+    
+    def get(self, url: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._db.execute("SELECT etag, last_modified, result FROM pages WHERE url = ?", (url,)).fetchone()
+            self._stats["hits" if row else "misses"] += 1
+        if row is None:
+            return None
+        return {"etag": row[0], "last_modified": row[1], "result": json.loads(row[2])}
+    
+    def put(self, url: str, etag: Optional[str], last_modified: Optional[str], result: Dict):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO pages (url, etag, last_modified, result, fetched_at, used_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (url, etag, last_modified, json.dumps(result), now, now)
+            )
+            self._writes += 1
+            if self._writes % 64 == 0:
+                # Keep the most recently used pages
+                self._db.execute(
+                    "DELETE FROM pages WHERE url NOT IN (SELECT url FROM pages ORDER BY used_at DESC LIMIT ?)",
+                    (self.max_entries,)
+                )
+            self._db.commit()
+    
+    def revalidated(self, url: str, not_modified: bool):
+        with self._lock:
+            self._stats["not_modified" if not_modified else "modified"] += 1
+            if not_modified:
+                self._db.execute("UPDATE pages SET used_at = ? WHERE url = ?", (time.time(), url))
+                self._db.commit()
+    
+    def served_stale(self, url: str):
+        # The page could not be fetched again, so the cached result was returned as is
+        with self._lock:
+            self._stats["stale"] += 1
+            self._db.execute("UPDATE pages SET used_at = ? WHERE url = ?", (time.time(), url))
+            self._db.commit()
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = self._db.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+        return stats
+
+_page_cache: Optional[PageCache] = None
+_page_cache_lock = threading.Lock()
+
+def get_page_cache() -> PageCache:
+    global _page_cache
+    with _page_cache_lock:
+        if _page_cache is None:
+            _page_cache = PageCache(max_entries=int(os.getenv("MCP_PAGE_CACHE_ENTRIES", "2000")))
+        return _page_cache
+
+class BlockedAddress(ValueError):
+    pass
+
+def check_public_url(url: str) -> List[str]:
+    # Raise BlockedAddress unless url is http(s) and every address its host resolves to is public.
+    # Returns the checked addresses, for the connection to use (none when private addresses are allowed).
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise BlockedAddress(f"Refusing to fetch {url}: only http and https URLs are fetched")
+    if ALLOW_PRIVATE_ADDRESSES:
+        return []
+    try:
+        infos = socket.getaddrinfo(parts.hostname, parts.port or (443 if parts.scheme == "https" else 80),
+                                   proto=socket.IPPROTO_TCP)
+    except socket.gaierror as e:
+        raise BlockedAddress(f"Cannot resolve {parts.hostname}: {e}")
+    addresses = []
+    for info in infos:
+        address = ipaddress.ip_address(info[4][0].split("%", 1)[0])
+        if getattr(address, "ipv4_mapped", None):
+            address = address.ipv4_mapped
+        if not address.is_global or address.is_multicast:
+            raise BlockedAddress(f"Refusing to fetch {url}: {parts.hostname} resolves to non-public address {address}")
+        if str(address) not in addresses:
+            addresses.append(str(address))
+    return addresses
+
+def fetch_page(url: str, cached: Optional[Dict] = None) -> Dict:
+    # Download a page, parsing it while it streams in and stopping at MAX_PAGE_BYTES.
+    # With a cached entry the request is conditional; a 304 reuses the cached result.
+    # Raises BlockedAddress for a URL, or a redirect, to a non-public address; the connection
+    # goes to the addresses that were checked, not to a second DNS answer.
+    headers = dict(HEADERS)
+    if cached:
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+    
+    started = time.perf_counter()
+    for _ in range(MAX_REDIRECTS + 1):
+        addresses = check_public_url(url)
+        with pinned_addresses(urlsplit(url).hostname, addresses):
+            response = get_session("web").get(url, headers=headers, stream=True, allow_redirects=False)
+        if not response.is_redirect:
+            break
+        url = urljoin(url, response.headers["Location"])
+        response.close()
+    else:
+        return {"status": response.status_code, "error": f"More than {MAX_REDIRECTS} redirects"}
+    
+    with response:
+        if response.status_code == 304 and cached:
+            return {"status": 304, "result": cached["result"]}
+        if response.status_code != 200:
+            return {"status": response.status_code, "error": f"HTTP {response.status_code}"}
+        
+        content_type = response.headers.get("Content-Type", "")
+        if content_type and not any(kind in content_type for kind in ("text/html", "application/xhtml", "text/plain")):
+            return {"status": response.status_code, "error": f"Unsupported content type: {content_type}"}
+        
+        # Plain text needs no parsing, only decoding
+        plain = "text/plain" in content_type
+        extractor = PageTextExtractor()
+        parts: List[str] = []
+        sink = parts.append if plain else extractor.feed
+        decoder = None
+        received = 0
+        truncated = False
+        for chunk in response.iter_content(chunk_size=PAGE_CHUNK_SIZE):
+            check_call()
+            if not chunk:
+                continue
+            if decoder is None:
+                try:
+                    decoder = codecs.getincrementaldecoder(_charset(content_type, chunk))(errors="replace")
+                except LookupError:
+                    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+            received += len(chunk)
+            sink(decoder.decode(chunk))
+            if received >= MAX_PAGE_BYTES:
+                truncated = True
+                break
+        if decoder is not None:
+            sink(decoder.decode(b"", final=True))
+        get_metrics().record_bytes("web", received)
+        
+        if plain:
+            text = "".join(parts)
+        else:
+            extractor.close()
+            text = extractor.text()
+        
+        return {
+            "status": 200,
+            "title": " ".join(extractor.title.split()),
+            "description": extractor.description,
+            "text": text,
+            "bytes": received,
+            "truncated": truncated,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "fetch_ms": round((time.perf_counter() - started) * 1000, 1)
+        }
+
+def summarize_page(url: str, fallback: Optional[Callable[[str], Dict]] = None, use_cache: bool = True) -> Dict:
+    # Fetch and summarize url locally. fallback(url) -> {"title", "content"} is tried when the page
+    # cannot be fetched or has too little text (e.g. it is rendered by JavaScript).
+    page_cache = get_page_cache() if use_cache else None
+    cached = page_cache.get(url) if page_cache else None
+    
+    try:
+        page = fetch_page(url, cached)
+    except Exception as e:
+        check_call()
+        page = {"error": str(e)}
+    
+    if page.get("status") == 304:
+        page_cache.revalidated(url, True)
+        return dict(page["result"], not_modified=True)
+    if cached and "error" in page:
+        # A failed revalidation says nothing about the page; keep serving the cached copy
+        page_cache.served_stale(url)
+        return dict(cached["result"], stale=True, revalidation_error=page["error"])
+    
+    if "error" not in page and len(page["text"]) >= MIN_TEXT_CHARS:
+        result = {
+            "success": True,
+            "url": url,
+            "title": page["title"],
+            "summary": summarize_text(page["text"]) or page["description"],
+            "content": page["text"][:MAX_CONTENT_CHARS],
+            "source": "page",
+            "truncated": page["truncated"]
+        }
+        if cached:
+            # A 200 to a conditional request may still carry the same text (e.g. a rotated ETag)
+            page_cache.revalidated(url, result["content"] == cached["result"].get("content"))
+        if page_cache and (page["etag"] or page["last_modified"]):
+            page_cache.put(url, page["etag"], page["last_modified"], result)
+        return result
+    
+    if cached:
+        page_cache.revalidated(url, False)
+    error = page.get("error") or "Page has too little text to summarize"
+    if fallback is None:
+        return {"success": False, "url": url, "error": error}
+    
+    try:
+        extracted = fallback(url)
+    except Exception as e:
+        check_call()
+        return {"success": False, "url": url, "error": f"{error}; fallback failed: {e}"}
+    if not extracted.get("success"):
+        return {"success": False, "url": url, "error": f"{error}; fallback failed: {extracted.get('error', 'no content')}"}
+    
+    content = extracted.get("content", "")
+    return {
+        "success": True,
+        "url": url,
+        "title": extracted.get("title") or page.get("title", ""),
+        "summary": summarize_text(content) or content[:500],
+        "content": content[:MAX_CONTENT_CHARS],
+        "source": "tavily",
+        "fallback_reason": error
+    }